@@ -1,35 +1,40 @@
 from dotenv import load_dotenv
 import streamlit as st
-import os
-import requests
-from util import extract_code, get_code_prompt
+from code_retrieval import DEFAULT_TOKEN_BUDGET, build_code_prompt
+from snapshot import get_codebase
+from response_cache import cached_response
+from parallel import DEFAULT_MAX_WORKERS, map_in_containers
+from design_mapreduce import DESIGN_MODES, show_design
+from scan_rules import skipped_reasons
 from prompt_templates import code_explain_prompt, java_code_gen_prompt, oo_design_prompt
 from langchain.prompts import PromptTemplate
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import AzureChatOpenAI
+from telemetry import session_totals, start_session
+from rate_limiter import describe_backlog, set_wait_listener, toast_wait
+from model_router import AUTO, describe_latency, resolve_model
+from llm_client import get_client, sampling_params
+from continuation import continue_response, should_continue
 import warnings
 
 warnings.filterwarnings('ignore')
 _ = load_dotenv()
 
+# Requests queued by the rate limiter show a toast on the page
+set_wait_listener(toast_wait)
+
+# LLM telemetry is totalled per browser session
+start_session(st.session_state)
+
 code_dir_name = "./code"
 
+# Sampling of every call; also part of the response cache key
+TEMPERATURE = 0.5
+MAX_TOKENS = 4000
+
 def initialize_conversation(model_name):
     """
     Initialize the conversation chain with the specified model
     """
-    chat = AzureChatOpenAI(
-        azure_deployment=os.environ["DEPLOYMENT_NAME"],
-        openai_api_version="2024-09-01-preview",
-        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-        api_key=os.environ["AZURE_OPENAI_API_KEY"],
-        temperature=0.5,
-        max_tokens=4000,
-        model_name=model_name
-    )
-    memory = ConversationBufferMemory(return_messages=True)
-    return ConversationChain(llm=chat, memory=memory)
+    return get_client().conversation(model_name, temperature=TEMPERATURE, max_tokens=MAX_TOKENS)
 
 def is_response_incomplete(response):
     """Check if the response appears incomplete"""
@@ -48,12 +53,9 @@ def has_unmatched_code_blocks(response, stack):
     return bool(stack) or response.count('{') != response.count('}')
 
 def create_continuation_prompt(previous_response, code_block_stack, attempt_number):
-    """Create a context-aware continuation prompt"""
-    last_context = previous_response[-500:]  # Increased context window
-    
+    """Create the context-aware part of a continuation prompt (continue_response adds the request, outline and tail)"""
     prompt = (
-        "Continue the Java code conversion from where you left off. "
-        f"Current context: '{last_context}'\n"
+        "You are continuing the Java code conversion. "
         f"Open code blocks: {len(code_block_stack)}\n"
         "Maintain consistent code style and complete any unfinished statements or blocks.\n"
         "If generating a new method or class, ensure proper closure and documentation."
@@ -113,24 +115,42 @@ def post_process_response(response, code_block_stack):
     
     return response.strip()
 
-def llm(prompt, model_name):
+def llm(prompt, model_name, stream=True):
     """
     Enhanced LLM calling function with improved long response handling and strict loop control
     
     Args:
         prompt (str): The input prompt to send to the model
         model_name (str): Name of the model to use
+        stream (bool): Show the response in the page as it is generated (streamed if the
+            model's settings allow it)
         
     Returns:
-        str: The complete response from the model
+        tuple: (response, complete): the response (None on failure) and whether the
+            model finished it, False if it was still cut off after the last continuation
     """
     try:
         conversation = initialize_conversation(model_name)
+        full_response = ""
+        
+        # The response is shown in one placeholder: each part streams in below the merged
+        # text so far, which replaces it once the part is merged, so the page shows the
+        # returned (and cached) text rather than the raw overlapping parts
+        placeholder = st.empty() if stream else None
+        
+        def show_part(chunks):
+            text = ""
+            for chunk in chunks:
+                text += chunk
+                placeholder.markdown(f"{full_response}\n{text}" if full_response else text)
+        stream_to = show_part if stream else None
         
         # Generate initial response
-        response = conversation.predict(input=prompt)
+        response = conversation.predict(input=prompt, stream_to=stream_to)
         full_response = response
-        max_tokens = 500
+        if stream:
+            placeholder.markdown(full_response)
+        max_tokens = MAX_TOKENS  # the max_tokens set in initialize_conversation
         
         # Track number of continuation attempts
         continuation_attempts = 0
@@ -138,28 +158,29 @@ def llm(prompt, model_name):
         last_processed_length = 0
         code_block_stack = []
         
-        while is_response_incomplete(full_response) and continuation_attempts < max_attempts:
-            # Check if response needs continuation
+        # Continue only when the API reports the last part as cut off (finish_reason/usage);
+        # the text heuristics are used only when it reports neither
+        while (should_continue(conversation.last_result, full_response, max_tokens, is_response_incomplete)
+               and continuation_attempts < max_attempts):
             current_length = len(full_response)
-            needs_continuation = is_response_incomplete(full_response)
             
-            # Break if response seems complete or hasn't grown
-            if not needs_continuation or current_length == last_processed_length:
+            # Break if response hasn't grown
+            if current_length == last_processed_length:
                 break
                 
             last_processed_length = current_length
                 
-            # Create a context-aware continuation prompt
-            continuation_prompt = create_continuation_prompt(full_response, code_block_stack, continuation_attempts)
+            # Create a context-aware continuation prompt; only the outline and tail of the
+            # response are resent, not the whole conversation
+            continuation_note = create_continuation_prompt(full_response, code_block_stack, continuation_attempts)
                 
             try:
-                continuation_response = conversation.predict(input=continuation_prompt)
+                continuation_response = continue_response(conversation, prompt, full_response, continuation_note, stream_to)
                 
                 # Validate continuation
                 if not is_valid_continuation(continuation_response, full_response, current_length):
-                    # If the continuation is not valid, retry with the original prompt
-                    continuation_prompt = prompt
-                    continuation_response = conversation.predict(input=continuation_prompt)
+                    # If the continuation is not valid, retry once with the same bounded prompt
+                    continuation_response = continue_response(conversation, prompt, full_response, continuation_note, stream_to)
                     
                     if not is_valid_continuation(continuation_response, full_response, current_length):
                         break  # Break if response is still not valid
@@ -168,6 +189,8 @@ def llm(prompt, model_name):
                 cleaned_continuation = clean_continuation_response(continuation_response, full_response)
                 if cleaned_continuation:
                     full_response += "\n" + cleaned_continuation
+                if stream:
+                    placeholder.markdown(full_response)
                 
                 # Update the code block stack
                 update_code_block_stack(cleaned_continuation, code_block_stack)
@@ -181,14 +204,15 @@ def llm(prompt, model_name):
             except Exception as e:
                 st.warning(f"Continuation attempt {continuation_attempts + 1} failed: {str(e)}")
                 
-                # If the continuation fails, retry with the original prompt
-                continuation_prompt = prompt
+                # If the continuation fails, retry once with the same bounded prompt
                 try:
-                    continuation_response = conversation.predict(input=continuation_prompt)
+                    continuation_response = continue_response(conversation, prompt, full_response, continuation_note, stream_to)
                     full_response += "\n" + continuation_response
+                    if stream:
+                        placeholder.markdown(full_response)
                 except Exception as e:
                     st.error(f"Error calling model: {str(e)}")
-                    return None
+                    return None, False
                     
                 continuation_attempts += 1
                 
@@ -196,16 +220,21 @@ def llm(prompt, model_name):
                     st.warning("Reached maximum number of continuation attempts. Response may be truncated.")
                     break
         
+        # Only a response the model ended itself may be cached
+        complete = not should_continue(conversation.last_result, full_response, max_tokens, is_response_incomplete)
+        
         # Post-process the final response
         full_response = post_process_response(full_response, code_block_stack)
-        return full_response.strip()
+        if stream:
+            placeholder.markdown(full_response)
+        return full_response.strip(), complete
  
     except Exception as e:
         st.error(f"Error calling model: {str(e)}")
-        return None
+        return None, False
 
 # Extract code content
-code_index, code_text, file_content = extract_code(code_dir_name)
+codebase = get_codebase(code_dir_name)
 
 # Initialize selected model
 selected_model = None
@@ -235,7 +264,8 @@ with st.sidebar:
          "/openai_gpt_4o",
          "/openai_o1_preview",
          "/openai_o1_mini",
-         "/claude_3.5_sonnet")
+         "/claude_3.5_sonnet",
+         "/auto")
     )
 
     # Map selection to model names
@@ -244,11 +274,14 @@ with st.sidebar:
         "/openai_gpt_4o": "gpt-4o",
         "/openai_o1_preview": "o1-preview",
         "/openai_o1_mini": "o1-mini",
-        "/claude_3.5_sonnet": "claude-3-5-sonnet"
+        "/claude_3.5_sonnet": "claude-3-5-sonnet",
+        "/auto": AUTO
     }
     
     selected_model = model_mapping[select_model]
     st.write("Selected Language Model:", selected_model)
+    if selected_model == AUTO and describe_latency():
+        st.caption(describe_latency())
 
     add_radio = st.radio(
         "What can I do for you today?",
@@ -259,50 +292,78 @@ with st.sidebar:
          "/generate_java_code")
     )
 
+    max_workers = st.slider("Concurrent LLM calls", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS)
+    bypass_cache = st.toggle("Bypass response cache", False,
+                             help="Call the model even if an identical request was answered before")
+    if describe_backlog():
+        st.caption(describe_backlog())
+    telemetry_panel = st.empty()  # filled with the session's LLM totals once this run's calls are done
+
+def show_response(code_file, response):
+    """
+    Display one file's word count (the response itself is streamed by llm())
+    """
+    if response:
+        st.write("\nApproximate word count:", len(response.split()))
+
 def execute(model_name, exec_prompt, code):
     """
     Execute LLM with provided prompt template
     """
     final_prompt = PromptTemplate.from_template(exec_prompt)
     formatted_prompt = final_prompt.format(PLSQL_CODE=code)
-    return llm(formatted_prompt, model_name)
+    model_name = resolve_model(model_name, formatted_prompt, exec_prompt, on_route=st.caption)
+    return cached_response(lambda: llm(formatted_prompt, model_name), model_name, formatted_prompt, exec_prompt,
+                           sampling_params(model_name, TEMPERATURE, MAX_TOKENS), bypass=bypass_cache, on_hit=st.write)
 
 # Main content based on selection
 if add_radio == "/show_code":
     st.title("/show_code")
     st.write("Here is the index of the files in the codebase:")
-    st.write(code_index)
+    st.write(codebase.index)
+    if codebase.skipped:
+        st.write("Skipped files:", skipped_reasons(codebase.skipped))
     st.write("Here is the entire codebase:")
-    st.code(code_text)
+    st.code(codebase.text)
 
 elif add_radio == "/command_interface":
     st.title("/command_interface")
     question = st.text_input("Enter your question here:")
+    context_mode = st.radio("Context", ("retrieval", "full"), horizontal=True)
+    token_budget = st.number_input("Prompt token budget", min_value=1000, max_value=200000,
+                                   value=DEFAULT_TOKEN_BUDGET, step=1000)
     if st.button("/get_answer"):
-        prompt = get_code_prompt(question, code_index, code_text)
-        response = llm(prompt, selected_model)
-        st.write(response)
-        st.write("\nApproximate word count:", len(response.split()))
+        prompt = build_code_prompt(question, codebase, token_budget, context_mode)
+        response, _ = llm(prompt, resolve_model(selected_model, prompt, task="qa", on_route=st.caption))
+        if response:
+            st.write("\nApproximate word count:", len(response.split()))
 
 elif add_radio == "/explain":
     st.title("/explain")
-    for file in file_content:
-        response = execute(selected_model, code_explain_prompt, file)
-        st.write(response)
-        st.write("\nApproximate word count:", len(response.split()))
+    map_in_containers(
+        lambda code_file: execute(selected_model, code_explain_prompt, code_file.render()),
+        codebase.files, show_response, max_workers,
+    )
 
 elif add_radio == "/generate_oo_design":
     st.title("/generate_oo_design")
-    response = execute(selected_model, oo_design_prompt, code_text)
-    st.write(response)
+    design_mode = st.radio("Design mode", DESIGN_MODES, horizontal=True)
+    response = show_design(
+        design_mode, codebase.files, lambda: execute(selected_model, oo_design_prompt, codebase.text),
+        lambda prompt: llm(prompt, resolve_model(selected_model, prompt, task="design"), stream=False),
+        selected_model, max_workers,
+    )
     st.write("\nApproximate word count:", len(response.split()))
 
 elif add_radio == "/generate_java_code":
     st.title("/generate_java_code")
-    for file in file_content:
-        response = execute(selected_model, java_code_gen_prompt, file)
-        st.write(response)
-        st.write("\nApproximate word count:", len(response.split()))
+    map_in_containers(
+        lambda code_file: execute(selected_model, java_code_gen_prompt, code_file.render()),
+        codebase.files, show_response, max_workers,
+    )
+
+# Session totals, including the calls made during this run
+telemetry_panel.caption(session_totals().describe())
 # # -----------------------------------------------------------------------------------------
 # from dotenv import load_dotenv
 # import streamlit as st
@@ -1,111 +1,125 @@
 from dotenv import load_dotenv
 import streamlit as st
-import os
-import requests
-from util import extract_code, get_code_prompt
+from code_retrieval import DEFAULT_TOKEN_BUDGET, build_code_prompt
+from snapshot import get_codebase
+from response_cache import cached_response
+from parallel import DEFAULT_MAX_WORKERS, map_in_containers
+from design_mapreduce import DESIGN_MODES, show_design
+from scan_rules import skipped_reasons
 from prompt_templates import code_explain_prompt, java_code_gen_prompt, oo_design_prompt
 from langchain_core.prompts import PromptTemplate
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import AzureChatOpenAI
+from telemetry import session_totals, start_session
+from rate_limiter import describe_backlog, set_wait_listener, toast_wait
+from model_router import AUTO, describe_latency, resolve_model
+from llm_client import RetryPolicy, get_client
+import overlap
+from continuation import continuation_prompt, should_continue
 import warnings
 
 warnings.filterwarnings('ignore')
 _ = load_dotenv()
 
+# Requests queued by the rate limiter show a toast on the page
+set_wait_listener(toast_wait)
+
+# LLM telemetry is totalled per browser session
+start_session(st.session_state)
+
 code_dir_name = "./code"
 
-def generate_complete_response(prompt, model_name, initial_temperature=0):
+def generate_complete_response(prompt, model_name, initial_temperature=0, stream=True, policy=None):
     """
-    Generate complete response with dynamic temperature adjustment and chunked completion
+    Generate complete response with chunked completion under a fixed retry policy
     
     Args:
         prompt (str): Input prompt for the model
         model_name (str): Name of the model to use
-        initial_temperature (float): Starting temperature value
+        initial_temperature (float): Temperature used for every attempt
+        stream (bool): Show the response in the page as it is generated
+        policy (RetryPolicy): Attempt limits and sampling; its attempts record each call's latency
         
     Returns:
-        str: Complete generated response
+        tuple: (response, complete): the generated response (None on failure) and whether
+            the model finished it, False if it was still cut off after the last attempt
     """
-    def init_llm(temp):
-        return AzureChatOpenAI(
-            azure_deployment=os.environ["DEPLOYMENT_NAME"],
-            openai_api_version="2024-09-01-preview",
-            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-            api_key=os.environ["AZURE_OPENAI_API_KEY"],
-            temperature=temp,
-            max_tokens=4000,
-            model_name=model_name
-        )
-    
     # Initialize tracking variables
+    policy = policy or RetryPolicy(temperature=initial_temperature)
     full_response = ""
-    current_temp = initial_temperature
-    max_attempts = 3
-    attempt = 0
+    incomplete = lambda text: not is_response_complete(text)
+    
+    # One conversation on the shared pooled client, with the same sampling for every attempt
+    conversation = get_client().conversation(model_name, temperature=policy.temperature, max_tokens=policy.max_tokens)
     
     # Create progress indicators
     if st.session_state.get('show_progress', True):
         progress_bar = st.progress(0)
         status_text = st.empty()
     
+    # The response is shown in one placeholder: each attempt streams in below the merged
+    # text so far, and the merge replaces it once the attempt ends, so the page shows the
+    # returned (and cached) text rather than the raw overlapping parts
+    placeholder = st.empty() if stream else None
+    
+    def show_attempt(chunks):
+        text = ""
+        for chunk in chunks:
+            text += chunk
+            placeholder.markdown(f"{full_response}\n{text}" if full_response else text)
+    stream_to = show_attempt if stream else None
+    
     try:
-        while attempt < max_attempts:
+        for attempt in range(policy.max_attempts):
             # Update progress
             if st.session_state.get('show_progress', True):
-                progress = (attempt + 1) / max_attempts
-                progress_bar.progress(progress)
-                status_text.text(f"Generating response... Attempt {attempt + 1}/{max_attempts}")
+                progress_bar.progress((attempt + 1) / policy.max_attempts)
+                status_text.text(f"Generating response... Attempt {attempt + 1}/{policy.max_attempts}")
             
-            # Initialize conversation with current temperature
-            conversation = ConversationChain(
-                llm=init_llm(current_temp),
-                memory=ConversationBufferMemory(return_messages=True)
-            )
-            
-            # Generate response
+            # Generate response: the prompt first, then bounded continuation prompts
             if not full_response:
-                # Initial generation
-                response = conversation.predict(input=prompt)
+                request, label = prompt, "initial"
             else:
-                # Continuation prompt
-                continuation_prompt = create_continuation_prompt(full_response, prompt)
-                response = conversation.predict(input=continuation_prompt)
+                request, label = create_continuation_prompt(full_response, prompt), f"continuation {attempt}"
+            conversation.reset()
+            # A transient error mid-stream is retried from the start; the partial attempt is taken back first
+            response = policy.call(lambda: conversation.predict(input=request, stream_to=stream_to), label, conversation,
+                                   on_retry=lambda: placeholder.markdown(full_response) if stream else None)
+            full_response = response if not full_response else merge_responses(full_response, response)
+            if stream:
+                placeholder.markdown(full_response)
             
-            # Validate and process response
-            if is_response_complete(response):
-                full_response = response if not full_response else merge_responses(full_response, response)
+            # Continue only on real truncation: the API's finish_reason decides, the
+            # completeness heuristics only when it doesn't report one
+            if not should_continue(conversation.last_result, response, policy.max_tokens, incomplete):
                 break
-            else:
-                # Incomplete response - adjust temperature and try again
-                full_response = response if not full_response else merge_responses(full_response, response)
-                current_temp = min(2.0, current_temp + 0.2)  # Increase temperature, max 2.0
-                attempt += 1
         
         # Final validation and warning if still incomplete
-        if not is_response_complete(full_response):
+        complete = not should_continue(conversation.last_result, full_response, policy.max_tokens, incomplete)
+        if not complete:
             st.warning("Generated response may be incomplete. Please verify the output.")
         
-        return full_response
+        if st.session_state.get('show_progress', True):
+            status_text.text(f"Attempts: {policy.summary()}")
+        return full_response, complete
         
     except Exception as e:
         st.error(f"Error in response generation: {str(e)}")
-        return None
+        return None, False
 
-def create_continuation_prompt(previous_response, original_prompt):
+def llm(prompt, model_name, stream=True, policy=None):
     """
-    Create a prompt for continuing the response
+    LLM call used by the other actions, with the same completion handling as /generate_java_code
     """
-    return f"""
-    Previous response context:
-    {previous_response[-500:]}  # Last 500 characters for context
-    
-    Original request:
-    {original_prompt}
-    
-    Please continue the response, maintaining consistency with the previous content.
-    Focus on completing any unfinished sections or thoughts.
+    return generate_complete_response(prompt, model_name, stream=stream, policy=policy)
+
+def create_continuation_prompt(previous_response, original_prompt):
+    """
+    Create a prompt for continuing the response: the original request, an outline
+    of the previous response and its tail
     """
+    return continuation_prompt(
+        original_prompt, previous_response,
+        "Focus on completing any unfinished sections or thoughts, consistent with the previous content.",
+    )
 
 def is_response_complete(response):
     """
@@ -149,7 +163,7 @@ def merge_responses(base_response, continuation):
     # Find a suitable merge point
     merge_point = find_merge_point(base_response, continuation)
     
-    if merge_point:
+    if merge_point is not None:
         # Merge at the identified point
         return base_response[:merge_point] + continuation
     else:
@@ -158,19 +172,10 @@ def merge_responses(base_response, continuation):
 
 def find_merge_point(base, continuation):
     """
-    Find the optimal point to merge the responses
+    Find the optimal point to merge the responses: where the longest part of the
+    base's end that the continuation repeats begins (linear-time, over overlap.py's window)
     """
-    # Look for overlap in the last 100 characters
-    overlap_size = min(100, len(base), len(continuation))
-    base_end = base[-overlap_size:]
-    cont_start = continuation[:overlap_size]
-    
-    # Find the longest common substring
-    for i in range(overlap_size, 0, -1):
-        if base_end[-i:] == cont_start[:i]:
-            return len(base) - i
-    
-    return None
+    return overlap.find_merge_point(base, continuation)
 
 
 
@@ -1398,7 +1403,7 @@ def find_merge_point(base, continuation):
     
 
 # Extract code content
-code_index, code_text, file_content = extract_code(code_dir_name)
+codebase = get_codebase(code_dir_name)
 
 # Initialize selected model
 selected_model = None
@@ -1428,7 +1433,8 @@ with st.sidebar:
          "/openai_gpt_4o",
          "/openai_o1_preview",
          "/openai_o1_mini",
-         "/claude_3.5_sonnet")
+         "/claude_3.5_sonnet",
+         "/auto")
     )
 
     # Map selection to model names
@@ -1437,11 +1443,14 @@ with st.sidebar:
         "/openai_gpt_4o": "gpt-4o",
         "/openai_o1_preview": "o1-preview",
         "/openai_o1_mini": "o1-mini",
-        "/claude_3.5_sonnet": "claude-3-5-sonnet"
+        "/claude_3.5_sonnet": "claude-3-5-sonnet",
+        "/auto": AUTO
     }
     
     selected_model = model_mapping[select_model]
     st.write("Selected Language Model:", selected_model)
+    if selected_model == AUTO and describe_latency():
+        st.caption(describe_latency())
 
     add_radio = st.radio(
         "What can I do for you today?",
@@ -1452,42 +1461,68 @@ with st.sidebar:
          "/generate_java_code")
     )
 
+    max_workers = st.slider("Concurrent LLM calls", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS)
+    bypass_cache = st.toggle("Bypass response cache", False,
+                             help="Call the model even if an identical request was answered before")
+    if describe_backlog():
+        st.caption(describe_backlog())
+    telemetry_panel = st.empty()  # filled with the session's LLM totals once this run's calls are done
+
+def show_response(code_file, response):
+    """
+    Display one file's word count (the response itself is streamed by llm())
+    """
+    if response:
+        st.write("\nApproximate word count:", len(response.split()))
+
 def execute(model_name, exec_prompt, code):
     """
     Execute LLM with provided prompt template
     """
     final_prompt = PromptTemplate.from_template(exec_prompt)
     formatted_prompt = final_prompt.format(PLSQL_CODE=code)
-    return llm(formatted_prompt, model_name)
+    model_name = resolve_model(model_name, formatted_prompt, exec_prompt, on_route=st.caption)
+    policy = RetryPolicy()
+    return cached_response(lambda: llm(formatted_prompt, model_name, policy=policy), model_name, formatted_prompt,
+                           exec_prompt, policy.sampling(model_name), bypass=bypass_cache, on_hit=st.write)
 
 # Main content based on selection
 if add_radio == "/show_code":
     st.title("/show_code")
     st.write("Here is the index of the files in the codebase:")
-    st.write(code_index)
+    st.write(codebase.index)
+    if codebase.skipped:
+        st.write("Skipped files:", skipped_reasons(codebase.skipped))
     st.write("Here is the entire codebase:")
-    st.code(code_text)
+    st.code(codebase.text)
 
 elif add_radio == "/command_interface":
     st.title("/command_interface")
     question = st.text_input("Enter your question here:")
+    context_mode = st.radio("Context", ("retrieval", "full"), horizontal=True)
+    token_budget = st.number_input("Prompt token budget", min_value=1000, max_value=200000,
+                                   value=DEFAULT_TOKEN_BUDGET, step=1000)
     if st.button("/get_answer"):
-        prompt = get_code_prompt(question, code_index, code_text)
-        response = llm(prompt, selected_model)
-        st.write(response)
-        st.write("\nApproximate word count:", len(response.split()))
+        prompt = build_code_prompt(question, codebase, token_budget, context_mode)
+        response, _ = llm(prompt, resolve_model(selected_model, prompt, task="qa", on_route=st.caption))
+        if response:
+            st.write("\nApproximate word count:", len(response.split()))
 
 elif add_radio == "/explain":
     st.title("/explain")
-    for file in file_content:
-        response = execute(selected_model, code_explain_prompt, file)
-        st.write(response)
-        st.write("\nApproximate word count:", len(response.split()))
+    map_in_containers(
+        lambda code_file: execute(selected_model, code_explain_prompt, code_file.render()),
+        codebase.files, show_response, max_workers,
+    )
 
 elif add_radio == "/generate_oo_design":
     st.title("/generate_oo_design")
-    response = execute(selected_model, oo_design_prompt, code_text)
-    st.write(response)
+    design_mode = st.radio("Design mode", DESIGN_MODES, horizontal=True)
+    response = show_design(
+        design_mode, codebase.files, lambda: execute(selected_model, oo_design_prompt, codebase.text),
+        lambda prompt: llm(prompt, resolve_model(selected_model, prompt, task="design"), stream=False),
+        selected_model, max_workers,
+    )
     st.write("\nApproximate word count:", len(response.split()))
         
 # In your main code
@@ -1520,10 +1555,11 @@ elif add_radio == "/generate_oo_design":
 
 if add_radio == "/generate_java_code":
     st.title("/generate_java_code")
-    for file in file_content:
-        final_prompt = PromptTemplate.from_template(java_code_gen_prompt)
-        formatted_prompt = final_prompt.format(PLSQL_CODE=file)
-        response = generate_complete_response(formatted_prompt, selected_model)
-        if response:
-            st.write(response, language='java')
-            st.write("\nApproximate word count:", len(response.split()))
\ No newline at end of file
+    # Same completion handling as the other actions, and through the response cache
+    map_in_containers(
+        lambda code_file: execute(selected_model, java_code_gen_prompt, code_file.render()),
+        codebase.files, show_response, max_workers,
+    )
+
+# Session totals, including the calls made during this run
+telemetry_panel.caption(session_totals().describe())
@@ -1,62 +1,83 @@
 from dotenv import load_dotenv
 import streamlit as st
 import os
-import requests
-from util import extract_code, get_code_prompt
+from code_retrieval import DEFAULT_TOKEN_BUDGET, build_code_prompt
+from snapshot import get_codebase
+from response_cache import cached_response
+from parallel import DEFAULT_MAX_WORKERS, map_in_containers, map_parallel
+from result_store import content_hash, get_result_store
+from design_mapreduce import DESIGN_MODES, show_design
+from scan_rules import skipped_reasons
+from tokenizer import count_tokens, count_tokens_batch
 from prompt_templates import code_explain_prompt, java_code_gen_prompt, oo_design_prompt, ms_prompt
 from langchain_core.prompts import PromptTemplate
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import AzureChatOpenAI
+from telemetry import session_totals, start_session
+from rate_limiter import describe_backlog, set_wait_listener, toast_wait
+from model_router import AUTO, describe_latency, resolve_model
+from llm_client import get_client, sampling_params
+from continuation import continue_response, should_continue
 import warnings
-import tiktoken
 
 
 warnings.filterwarnings('ignore')
 _ = load_dotenv()
 
+# Requests queued by the rate limiter show a toast on the page
+set_wait_listener(toast_wait)
+
+# LLM telemetry is totalled per browser session
+start_session(st.session_state)
+
 code_dir_name = "./extract_code"
 
+# Sampling of every call; also part of the response cache key
+TEMPERATURE = 0.5
+MAX_TOKENS = 4000
+
 def initialize_conversation(model_name):
     """
     Initialize the conversation chain with the specified model
     """
-    chat = AzureChatOpenAI(
-        azure_deployment=os.environ["DEPLOYMENT_NAME"],
-        openai_api_version="2024-09-01-preview",
-        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-        api_key=os.environ["AZURE_OPENAI_API_KEY"],
-        temperature=0.5,
-        max_tokens=4000,
-        model_name=model_name
-    )
-    memory = ConversationBufferMemory(return_messages=True)
-    return ConversationChain(llm=chat, memory=memory)
+    return get_client().conversation(model_name, temperature=TEMPERATURE, max_tokens=MAX_TOKENS)
 
 
-def llm(prompt, model_name):
+def llm(prompt, model_name, stream=True):
     """
-    Handle LLM interactions with automatic continuation for long responses
+    Handle LLM interactions with automatic continuation for long responses,
+    showing the response in the page as it is generated unless stream is False
+    (streamed if the model's settings allow it).
+    Returns (response, complete), complete being False if it was still cut off
     """
     # Initialize conversation with the selected model
     conversation = initialize_conversation(model_name)
+    full_response = ""
+    
+    # One placeholder for the whole response: each part streams in below the text so
+    # far, which replaces it once the part is appended
+    placeholder = st.empty() if stream else None
+    
+    def show_part(chunks):
+        text = ""
+        for chunk in chunks:
+            text += chunk
+            placeholder.markdown(f"{full_response} {text}" if full_response else text)
+    stream_to = show_part if stream else None
     
     # Generate the initial response
-    response = conversation.predict(input=prompt)
+    response = conversation.predict(input=prompt, stream_to=stream_to)
     
     # Initialize the full response
     full_response = response
+    if stream:
+        placeholder.markdown(full_response)
     
     
     
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    # Encode the text to get tokens
-    tokens = encoding.encode(full_response)
-    st.write("Number of tokens:", len(tokens))
-    
-    # Check if continuation is needed (leaving buffer of 50 tokens)
-    max_tokens = 4000  # Using the max_tokens set in initialize_conversation
-    needs_continuation = len(tokens) >= max_tokens - 400
+    # Continue only if the API reports the response as cut off; the token threshold
+    # (leaving a buffer of 400 tokens) is the fallback when it doesn't say
+    max_tokens = MAX_TOKENS  # Using the max_tokens set in initialize_conversation
+    near_limit = lambda text: count_tokens(text, model_name) >= max_tokens - 400
+    needs_continuation = should_continue(conversation.last_result, full_response, max_tokens, near_limit)
     # st.write(needs_continuation)
     # Handle continuation if needed
     # check_end="END" in full_response
@@ -65,17 +86,16 @@ def llm(prompt, model_name):
     # st.write(full_response)
     while needs_continuation:# and "END" not in full_response
         # st.write("Inside_loop",needs_continuation)
-        # Prompt the model to continue
-        continuation_prompt = "Please continue where you left off."
-        
-        # Generate the continuation response
-        continuation_response = conversation.predict(input=continuation_prompt)
+        # Prompt the model to continue, resending the request with only an outline
+        # and the tail of the response so far instead of the whole conversation
+        continuation_response = continue_response(conversation, prompt, full_response, stream_to=stream_to)
         
         # Append the continuation to the full response
         full_response += " " + continuation_response
-        tokens_continuation = encoding.encode(continuation_response)
+        if stream:
+            placeholder.markdown(full_response)
         # Check again if the continuation is also truncated
-        needs_continuation = len(tokens_continuation) >= max_tokens - 400
+        needs_continuation = should_continue(conversation.last_result, continuation_response, max_tokens, near_limit)
         
         # st.write(continuation_response)
 
@@ -84,26 +104,39 @@ def llm(prompt, model_name):
             break
         
     
-    return full_response
+    return full_response, not needs_continuation
 
-def execute(model_name, exec_prompt, code):
-    final_prompt = PromptTemplate.from_template(exec_prompt)
-    formatted_prompt = final_prompt.format(PLSQL_CODE=code)
-    return llm(formatted_prompt, model_name)
+def show_response(code_file, response):
+    """
+    Display one file's token and word counts in its container (the response itself is
+    streamed by llm(); every call's API token usage is in the telemetry totals)
+    """
+    if response:
+        st.write("Number of tokens:", count_tokens(response))
+        st.write("\nApproximate word count:", len(response.split()))
 
-def execute1(model_name, exec_prompt, code,response):
+def execute1(model_name, exec_prompt, code,response, stream=True):
+    """
+    Execute LLM with provided prompt template, with the design document (response) appended
+    """
     final_prompt = PromptTemplate.from_template(exec_prompt)
-    formatted_prompt = final_prompt.format(PLSQL_CODE=code, response=response)
-    return llm(formatted_prompt, model_name)
-
-def execute(model_name, exec_prompt, code):
+    formatted_prompt = final_prompt.format(PLSQL_CODE=code) + (
+        "\nFollow this object-oriented design document of the whole codebase:\n" + response)
+    model_name = resolve_model(model_name, formatted_prompt, exec_prompt, on_route=st.caption)
+    return cached_response(lambda: llm(formatted_prompt, model_name, stream), model_name, formatted_prompt, exec_prompt,
+                           sampling_params(model_name, TEMPERATURE, MAX_TOKENS), bypass=bypass_cache,
+                           on_hit=st.write if stream else None)
+
+def execute(model_name, exec_prompt, code, stream=True):
     """
     Execute LLM with provided prompt template
     """
     final_prompt = PromptTemplate.from_template(exec_prompt)
     formatted_prompt = final_prompt.format(PLSQL_CODE=code)
-    print(formatted_prompt)
-    return llm(formatted_prompt, model_name)
+    model_name = resolve_model(model_name, formatted_prompt, exec_prompt, on_route=st.caption)
+    return cached_response(lambda: llm(formatted_prompt, model_name, stream), model_name, formatted_prompt, exec_prompt,
+                           sampling_params(model_name, TEMPERATURE, MAX_TOKENS), bypass=bypass_cache,
+                           on_hit=st.write if stream else None)
    
 
 # # Extract code content
@@ -137,7 +170,8 @@ with st.sidebar:
          "/openai_gpt_4o",
          "/openai_o1_preview",
          "/openai_o1_mini",
-         "/claude_3.5_sonnet")
+         "/claude_3.5_sonnet",
+         "/auto")
     )
 
     # Map selection to model names
@@ -146,11 +180,14 @@ with st.sidebar:
         "/openai_gpt_4o": "gpt-4o",
         "/openai_o1_preview": "o1-preview",
         "/openai_o1_mini": "o1-mini",
-        "/claude_3.5_sonnet": "claude-3-5-sonnet"
+        "/claude_3.5_sonnet": "claude-3-5-sonnet",
+        "/auto": AUTO
     }
     
     selected_model = model_mapping[select_model]
     st.write("Selected Language Model:", selected_model)
+    if selected_model == AUTO and describe_latency():
+        st.caption(describe_latency())
 
     add_radio = st.radio(
         "What can I do for you today?",
@@ -161,6 +198,13 @@ with st.sidebar:
          "/generate_java_code")
     )
 
+    max_workers = st.slider("Concurrent LLM calls", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS)
+    bypass_cache = st.toggle("Bypass response cache", False,
+                             help="Call the model even if an identical request was answered before")
+    if describe_backlog():
+        st.caption(describe_backlog())
+    telemetry_panel = st.empty()  # filled with the session's LLM totals once this run's calls are done
+
 
 
 import zipfile
@@ -170,65 +214,76 @@ import io
 uploaded_file = st.file_uploader("Upload a zip file containing code", type=["zip"])
 
 if uploaded_file is not None:
-    # Clear the existing files in the code directory
-    if os.path.exists(code_dir_name):
-        for filename in os.listdir(code_dir_name):
-            file_path = os.path.join(code_dir_name, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)  # Remove file
-                elif os.path.isdir(file_path):
-                    os.rmdir(file_path)  # Remove directory (if empty)
-            except Exception as e:
-                st.write(f"Error removing file {file_path}: {e}")
-
-    else:
-        os.makedirs(code_dir_name)  # Create the directory if it doesn't exist
-
-    # Extract the contents of the zip file
-    with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-        zip_ref.extractall(code_dir_name)  # Extract to a directory
-
-    # Now you can call extract_code on the extracted files
-    code_index, code_text, file_content = extract_code(code_dir_name)
+    # Extract only when a new zip is uploaded; re-extracting on every rerun would
+    # change the file mtimes and force a rescan of an unchanged codebase
+    if st.session_state.get("extracted_upload") != uploaded_file.file_id:
+        # Clear the existing files in the code directory
+        if os.path.exists(code_dir_name):
+            for filename in os.listdir(code_dir_name):
+                file_path = os.path.join(code_dir_name, filename)
+                try:
+                    if os.path.isfile(file_path):
+                        os.remove(file_path)  # Remove file
+                    elif os.path.isdir(file_path):
+                        os.rmdir(file_path)  # Remove directory (if empty)
+                except Exception as e:
+                    st.write(f"Error removing file {file_path}: {e}")
+
+        else:
+            os.makedirs(code_dir_name)  # Create the directory if it doesn't exist
+
+        # Extract the contents of the zip file
+        with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
+            zip_ref.extractall(code_dir_name)  # Extract to a directory
+        st.session_state["extracted_upload"] = uploaded_file.file_id
+
+    # Cached snapshot of the extracted files, rescanned only when they change
+    codebase = get_codebase(code_dir_name)
         
     if "show_code" not in st.session_state:
         st.session_state["show_code"] = False
-    if "response" not in st.session_state:
-        st.session_state["response"] = None
-    if "MS_response" not in st.session_state:
-        st.session_state["MS_response"] = None
-    if "response_doc" not in st.session_state:
-        st.session_state["response_doc"] = None
         
     # Main content based on selection
     if add_radio == "/show_code":
         st.title("/show_code")
         st.write("Here is the index of the files in the codebase:")
-        st.write(code_index)
+        st.write(codebase.index)
+        if codebase.skipped:
+            st.write("Skipped files:", skipped_reasons(codebase.skipped))
         st.write("Here is the entire codebase:")
-        st.code(code_text)
+        st.code(codebase.text)
 
     elif add_radio == "/command_interface":
         st.title("/command_interface")
         question = st.text_input("Enter your question here:")
+        context_mode = st.radio("Context", ("retrieval", "full"), horizontal=True)
+        token_budget = st.number_input("Prompt token budget", min_value=1000, max_value=200000,
+                                       value=DEFAULT_TOKEN_BUDGET, step=1000)
         if st.button("/get_answer"):
-            prompt = get_code_prompt(question, code_index, code_text)
-            response = llm(prompt, selected_model)
-            st.write(response)
-            st.write("\nApproximate word count:", len(response.split()))
+            prompt = build_code_prompt(question, codebase, token_budget, context_mode)
+            try:
+                response, _ = llm(prompt, resolve_model(selected_model, prompt, task="qa", on_route=st.caption))
+            except Exception as e:
+                st.error(f"Error calling model: {str(e)}")
+                response = None
+            if response:
+                st.write("\nApproximate word count:", len(response.split()))
 
     elif add_radio == "/explain":
         st.title("/explain")
-        for file in file_content:
-            response = execute(selected_model, code_explain_prompt, file)
-            st.write(response)
-            st.write("\nApproximate word count:", len(response.split()))
+        map_in_containers(
+            lambda code_file: execute(selected_model, code_explain_prompt, code_file.render()),
+            codebase.files, show_response, max_workers,
+        )
 
     elif add_radio == "/generate_oo_design":
         st.title("/generate_oo_design")
-        response = execute(selected_model, oo_design_prompt, code_text)
-        st.write(response)
+        design_mode = st.radio("Design mode", DESIGN_MODES, horizontal=True)
+        response = show_design(
+            design_mode, codebase.files, lambda: execute(selected_model, oo_design_prompt, codebase.text),
+            lambda prompt: llm(prompt, resolve_model(selected_model, prompt, task="design"), stream=False),
+            selected_model, max_workers,
+        )
         st.write("\nApproximate word count:", len(response.split()))
 
 # elif add_radio == "/generate_java_code":
@@ -256,51 +311,66 @@ if uploaded_file is not None:
         st.title("/generate_java_code")
         # st.write(file_content)
         col = st.tabs(["Spring Boot Code", "Microservice Code", "Doc to Microservice Code"])
-
-        for file in file_content:
-            # st.write("file_data_is")
-            # st.write(file)
-
-            # Tab 0: Spring Boot Code
-            with col[0]:
-                st.session_state["show_code"] = st.toggle("Show Code", st.session_state["show_code"], key="check1")
-                if st.session_state["show_code"]:
-                    if st.session_state["response"] is None:
-                        st.session_state["response"] = execute(selected_model, java_code_gen_prompt, file)
-                    st.write(st.session_state["response"])
-                    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-                    tokens = encoding.encode(st.session_state["response"])
-                    st.write("\nApproximate word count:", len(tokens))    
-
-            # Tab 1: Microservice Code
-            with col[1]:
-                if st.session_state["response"] is not None:
-                    if st.session_state["MS_response"] is None:
-                        st.session_state["MS_response"] = execute(selected_model, ms_prompt, st.session_state["response"])
-                    st.write(st.session_state["MS_response"])
-                    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-                    tokens = encoding.encode(st.session_state["MS_response"])
-                    st.write("\nApproximate word count:", len(tokens))    
-
-            # Tab 2: Doc to Microservice Code
-            with col[2]:
-                if st.session_state["response"] is not None:
-                    if st.session_state["response_doc"] is None:
-                        st.session_state["response_doc"] = execute(selected_model, oo_design_prompt, code_text)
-                    if st.session_state["MS_response"] is None:  # Reuse MS_response or create it
-                        st.session_state["MS_response"] = execute1(
-                            selected_model, ms_prompt, st.session_state["response"], st.session_state["response_doc"]
-                        )
-                    st.write(st.session_state["MS_response"])
-                    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-                    tokens = encoding.encode(st.session_state["MS_response"])
-                    st.write("\nApproximate word count:", len(tokens))            
+        store = get_result_store()
+
+        def stage(code_file_hash, name, compute):
+            """ one pipeline stage for one file, computed once per (file hash, stage, model) """
+            return store.get_or_compute((code_file_hash, name, selected_model), compute, bypass_cache)
+
+        def convert(code_file, design):
+            """ Spring Boot code, microservices and design-based microservices for one file """
+            file_hash = content_hash(code_file.text)
+            results = {"java": stage(file_hash, "java", lambda: execute(
+                selected_model, java_code_gen_prompt, code_file.render(), stream=False))}
+            if results["java"]:
+                results["microservice"] = stage(file_hash, "microservice", lambda: execute(
+                    selected_model, ms_prompt, results["java"], stream=False))
+                if design:
+                    results["doc_microservice"] = stage(file_hash, "doc_microservice", lambda: execute1(
+                        selected_model, ms_prompt, results["java"], design, stream=False))
+            return results
+
+        with col[0]:
+            st.session_state["show_code"] = st.toggle("Show Code", st.session_state["show_code"], key="check1")
+        if st.session_state["show_code"]:
+            # The design document covers the whole codebase, so it is computed once, here on the
+            # main thread, single-call or map-reduce as in /generate_oo_design's "auto" mode;
+            # a failed design ("") isn't stored, so the next run tries again
+            design = stage(content_hash(codebase.text), "design", lambda: show_design(
+                "auto", codebase.files, lambda: execute(selected_model, oo_design_prompt, codebase.text, stream=False),
+                lambda prompt: llm(prompt, resolve_model(selected_model, prompt, task="design"), stream=False),
+                selected_model, max_workers, write=False,
+            ) or None)
+
+            conversion_progress = st.progress(0.0, text="Converting files...")
+            done = [0]
+
+            def on_done(_, __):
+                done[0] += 1
+                conversion_progress.progress(done[0] / len(codebase.files),
+                                             text=f"Converted {done[0]}/{len(codebase.files)} files")
+
+            # Files are converted in parallel; results already in the store return immediately
+            converted = map_parallel(lambda code_file: convert(code_file, design), codebase.files, max_workers, on_done)
+            conversion_progress.empty()
+
+            for tab, name in zip(col, ("java", "microservice", "doc_microservice")):
+                with tab:
+                    responses = [results.get(name) for results in converted]
+                    # One batched tokenizer pass for the tab's footers instead of one per file
+                    token_counts = count_tokens_batch(response or "" for response in responses)
+                    for code_file, response, tokens in zip(codebase.files, responses, token_counts):
+                        with st.expander(code_file.path, expanded=len(codebase.files) == 1):
+                            if response:
+                                st.write(response)
+                                st.write("Number of tokens:", tokens)
+                                st.write("\nApproximate word count:", len(response.split()))
+                            else:
+                                st.warning("Not generated; the Spring Boot conversion or design step failed.")
                     
         # sping boot
         # st.write(response)
         # medhod(response, document)
-       
-
-
-
 
+# Session totals, including the calls made during this run
+telemetry_panel.caption(session_totals().describe())
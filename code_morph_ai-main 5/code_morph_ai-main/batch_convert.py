@@ -0,0 +1,230 @@
+"""
+Headless batch conversion: runs the app's explain -> OO design -> Java -> microservice
+pipeline (prompt_templates) over a directory or zip file with parallel LLM calls,
+writes every result to an output tree and prints timings and token totals.
+
+Output layout:
+    <out>/files/<relative path>/explain.md, java.md, microservice.md
+    <out>/design.md
+    <out>/summary.json
+
+Examples:
+    python batch_convert.py ./code --out ./converted
+    python batch_convert.py repo.zip --out ./converted --stages explain java --workers 8 --model auto
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+from langchain_core.prompts import PromptTemplate
+
+import telemetry
+from continuation import continuation_prompt, should_continue
+from design_mapreduce import generate_oo_design, should_map_reduce
+from llm_client import RetryPolicy, get_client
+from model_router import resolve_model
+from overlap import find_merge_point
+from parallel import DEFAULT_MAX_WORKERS, map_parallel
+from prompt_templates import code_explain_prompt, java_code_gen_prompt, ms_prompt, oo_design_prompt
+from response_cache import cached_response
+from util import CodeFile, load_codebase
+
+STAGES = ("explain", "design", "java", "microservice")
+
+STAGE_TEMPLATES = {
+    "explain": code_explain_prompt,
+    "design": oo_design_prompt,
+    "java": java_code_gen_prompt,
+    "microservice": ms_prompt,
+}
+
+class TruncatedResponse(Exception):
+    """The response was still cut off after the last continuation."""
+
+def generate(prompt, model_name, policy=None):
+    """
+    Response to prompt without a UI: continued with bounded continuation prompts
+    while the API reports truncation, transient errors retried by policy.
+
+    Returns:
+        tuple: (response, complete), complete being False if it was still cut off
+            after policy.max_attempts calls
+    """
+    policy = policy or RetryPolicy()
+    conversation = get_client().conversation(model_name, temperature=policy.temperature, max_tokens=policy.max_tokens)
+    response = policy.call(lambda: conversation.predict(input=prompt), "initial", conversation)
+    for attempt in range(1, policy.max_attempts):
+        if not should_continue(conversation.last_result, response, policy.max_tokens):
+            break
+        conversation.reset()
+        request = continuation_prompt(prompt, response)
+        part = policy.call(lambda: conversation.predict(input=request), f"continuation {attempt}", conversation)
+        merge_point = find_merge_point(response, part, model_name=model_name)
+        response = response[:merge_point] + part if merge_point is not None else response + "\n" + part
+    return response, not should_continue(conversation.last_result, response, policy.max_tokens)
+
+@dataclass
+class StageReport:
+    stage: str
+    items: int = 0
+    failed: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    telemetry: dict = field(default_factory=dict)
+
+class BatchConverter:
+    """Runs the pipeline stages over one codebase, writing each result as it completes."""
+
+    def __init__(self, out_dir, model_name, max_workers=None, bypass_cache=False, verbose=True):
+        self.out_dir = out_dir
+        self.model_name = model_name
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.bypass_cache = bypass_cache
+        self.verbose = verbose
+        self.java: Dict[str, str] = {}
+
+    def call(self, stage, code):
+        template = STAGE_TEMPLATES[stage]
+        prompt = PromptTemplate.from_template(template).format(PLSQL_CODE=code)
+        model_name = resolve_model(self.model_name, prompt, template)
+        policy = RetryPolicy()
+
+        def compute():
+            response, complete = generate(prompt, model_name, policy)
+            if not complete:
+                # Raised inside compute so the partial text is neither cached nor written
+                raise TruncatedResponse(f"still cut off after {policy.max_attempts} calls")
+            return response, complete
+        return cached_response(compute, model_name, prompt, template, policy.sampling(model_name),
+                               bypass=self.bypass_cache)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.out_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def log(self, message):
+        if self.verbose:
+            print(message, file=sys.stderr, flush=True)
+
+    def run_per_file(self, stage, files: List[CodeFile], report: StageReport, source=None):
+        """ one call per file; source(code_file) gives the prompt input, the file itself by default """
+        source = source or CodeFile.render
+
+        def convert(code_file):
+            try:
+                return self.call(stage, source(code_file))
+            except Exception as e:
+                self.log(f"[{stage}] {code_file.path}: {e}")
+                return None
+
+        def on_done(i, response):
+            path = files[i].path
+            if response:
+                self.write(os.path.join("files", path, f"{stage}.md"), response)
+                if stage == "java":
+                    self.java[path] = response
+            else:
+                report.failed.append(path)
+            report.items += 1
+            self.log(f"[{stage}] {report.items}/{len(files)} {path}")
+
+        map_parallel(convert, files, self.max_workers, on_done)
+
+    def run_design(self, files: List[CodeFile], report: StageReport):
+        report.items = 1
+        try:
+            if should_map_reduce(files):
+                design, complete = generate_oo_design(
+                    files, lambda prompt: generate(prompt, resolve_model(self.model_name, prompt, task="design")),
+                    self.model_name, self.max_workers,
+                    progress=lambda stage, done, total: self.log(f"[design] {stage}: {done}/{total}"),
+                )
+                if design and not complete:
+                    raise TruncatedResponse("final design still cut off")
+            else:
+                design = self.call("design", "".join(code_file.render() for code_file in files))
+        except Exception as e:
+            self.log(f"[design] {e}")
+            design = None
+        if design:
+            self.write("design.md", design)
+        else:
+            report.failed.append("design")
+
+    def run(self, files: List[CodeFile], stages=STAGES) -> List[StageReport]:
+        reports = []
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            report = StageReport(stage)
+            # Each stage gets its own telemetry session, so its tokens and latency can be totalled
+            session = f"batch-{os.getpid()}-{stage}"
+            telemetry.SESSION.set(session)
+            start = time.perf_counter()
+            if stage == "design":
+                self.run_design(files, report)
+            elif stage == "microservice":
+                if "java" not in stages:
+                    self.log("[microservice] needs the java stage, skipped")
+                    continue
+                java_files = [code_file for code_file in files if code_file.path in self.java]
+                self.run_per_file(stage, java_files, report, lambda code_file: self.java[code_file.path])
+            else:
+                self.run_per_file(stage, files, report)
+            report.seconds = time.perf_counter() - start
+            report.telemetry = asdict(telemetry.get_telemetry().totals(session))
+            reports.append(report)
+        return reports
+
+def load_input(path):
+    """ CodeBase of a directory, or of a zip file extracted to a temporary directory (removed once read) """
+    if zipfile.is_zipfile(path):
+        with tempfile.TemporaryDirectory(prefix="batch_convert_") as extract_dir:
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(extract_dir)
+            return load_codebase(extract_dir)
+    return load_codebase(path)
+
+def format_summary(reports: List[StageReport], seconds):
+    lines = [f"{'stage':<14}{'items':>7}{'failed':>8}{'seconds':>10}{'calls':>7}{'prompt tok':>12}{'compl tok':>11}{'hits':>6}"]
+    for report in reports:
+        totals = report.telemetry
+        lines.append(f"{report.stage:<14}{report.items:>7}{len(report.failed):>8}{report.seconds:>10.1f}"
+                     f"{totals['calls']:>7}{totals['prompt_tokens']:>12,}{totals['completion_tokens']:>11,}"
+                     f"{totals['cache_hits']:>6}")
+    lines.append(f"total {seconds:.1f}s")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="directory or .zip file with the PL/SQL code")
+    parser.add_argument("--out", default="./converted", help="output directory")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--model", default="gpt-4o-mini", help='model name, or "auto" to route per request')
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent LLM calls")
+    parser.add_argument("--no-cache", action="store_true", help="call the model even for cached requests")
+    parser.add_argument("--quiet", action="store_true", help="no per-file progress")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    codebase = load_input(args.input)
+    converter = BatchConverter(args.out, args.model, args.workers, args.no_cache, not args.quiet)
+    converter.log(f"{len(codebase.files)} files, {len(codebase.skipped)} skipped")
+    reports = converter.run(codebase.files, args.stages)
+    seconds = time.perf_counter() - start
+
+    summary = {"input": args.input, "model": args.model, "files": len(codebase.files), "seconds": seconds,
+               "stages": [asdict(report) for report in reports]}
+    converter.write("summary.json", json.dumps(summary, indent=2))
+    print(format_summary(reports, seconds))
+    sys.exit(1 if any(report.failed for report in reports) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import List
+
+from tokenizer import approx_tokens
+from util import CodeBase, get_code_prompt
+
+# Prompt size used by /command_interface when the user doesn't pick one
+DEFAULT_TOKEN_BUDGET = 12000
+
+# Lines that start a new retrievable unit: SQL objects, Java/Python classes and methods
+UNIT_BOUNDARY = re.compile(
+    r"^\s*(?:CREATE\b|PROCEDURE\s+\w+|FUNCTION\s+\w+|TRIGGER\s+\w+|"
+    r"(?:public|private|protected)\b[^;=]*[({]\s*$|(?:abstract\s+|final\s+)?class\s+\w+|def\s+\w+)",
+    re.IGNORECASE,
+)
+MIN_UNIT_TOKENS = 40
+MAX_UNIT_TOKENS = 800
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_index_lock = threading.Lock()
+
+def estimate_tokens(text):
+    """ rough token count, cheap enough for every line of the codebase """
+    return approx_tokens(text) + 1
+
+def codebase_tokens(codebase: CodeBase):
+    """ estimate of codebase.text from the file sizes, so the concatenated text isn't built """
+    chars = sum(code_file.size + len(code_file.path) + 23 for code_file in codebase.files)  # 23: render() header
+    return (chars + 3) // 4 + 1
+
+def tokenize(text):
+    """ identifiers split into lowercase terms; ORDER_ITEMS -> order_items, order, items """
+    terms = []
+    for identifier in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text):
+        lowered = identifier.lower()
+        terms.append(lowered)
+        parts = re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", identifier.replace("_", " "))
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts)
+    return [term for term in terms if len(term) > 1]
+
+@dataclass
+class CodeUnit:
+    """A retrievable slice of a file: a procedure, class, method or block of lines."""
+    path: str
+    start_line: int
+    end_line: int
+    name: str
+    text: str
+    tokens: int
+
+    def render(self):
+        return f"__________{self.path} (lines {self.start_line}-{self.end_line})__________\n{self.text}\n\n"
+
+def split_units(code_file) -> List[CodeUnit]:
+    """ split a file at object/method boundaries, merging tiny pieces and windowing large ones """
+    lines = code_file.text.splitlines()
+    starts = [0] + [i for i, line in enumerate(lines) if i and UNIT_BOUNDARY.match(line)]
+    pieces = [(start, end) for start, end in zip(starts, starts[1:] + [len(lines)]) if end > start]
+
+    merged = []
+    for start, end in pieces:
+        if merged and estimate_tokens("\n".join(lines[merged[-1][0]:merged[-1][1]])) < MIN_UNIT_TOKENS:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    units = []
+    for start, end in merged:
+        window_start = start
+        while window_start < end:
+            window_end = window_start
+            size = 0
+            while window_end < end and (window_end == window_start or size < MAX_UNIT_TOKENS):
+                size += estimate_tokens(lines[window_end])
+                window_end += 1
+            text = "\n".join(lines[window_start:window_end])
+            name = lines[window_start].strip()[:80] if window_start < len(lines) else code_file.path
+            units.append(CodeUnit(code_file.path, window_start + 1, window_end, name, text, estimate_tokens(text)))
+            window_start = window_end
+    return units
+
+class CodeIndex:
+    """Lexical (BM25) index over the code units of a CodeBase."""
+
+    def __init__(self, units: List[CodeUnit]):
+        self.units = units
+        self.postings = defaultdict(list)  # term -> [(unit index, term frequency)]
+        self.lengths = []
+        for i, unit in enumerate(units):
+            terms = Counter(tokenize(f"{unit.path} {unit.text}"))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings[term].append((i, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    @classmethod
+    def build(cls, codebase: CodeBase):
+        return cls([unit for code_file in codebase.files for unit in split_units(code_file)])
+
+    def bm25(self, question):
+        scores = defaultdict(float)
+        total = len(self.units)
+        for term in set(tokenize(question)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, frequency in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[i] / (self.average_length or 1)
+                scores[i] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+        return scores
+
+    def search(self, question):
+        """ unit indexes ordered by relevance to the question """
+        scores = self.bm25(question)
+        return sorted(scores, key=lambda i: (-scores[i], i))
+
+def get_code_index(codebase: CodeBase) -> CodeIndex:
+    """ index for a codebase snapshot, built once and kept with the snapshot """
+    with _index_lock:
+        index = codebase.derived.get("code_index")
+        if index is None:
+            index = codebase.derived["code_index"] = CodeIndex.build(codebase)
+    return index
+
+def build_code_prompt(question, codebase: CodeBase, token_budget=DEFAULT_TOKEN_BUDGET, mode="retrieval"):
+    """
+    Generate a prompt for code related questions that fits in token_budget.
+
+    In "retrieval" mode the most relevant units are picked until the budget is used;
+    "full" mode (and any codebase that fits the budget anyway) uses get_code_prompt.
+    """
+    if mode == "full":
+        return get_code_prompt(question, codebase.index, codebase.text)
+
+    full_size = codebase_tokens(codebase) + estimate_tokens(str(codebase.index))
+    if full_size + estimate_tokens(question) + 100 <= token_budget:
+        return get_code_prompt(question, codebase.index, codebase.text)
+
+    index = get_code_index(codebase)
+    remaining = token_budget - estimate_tokens(question) - 150
+
+    # Keep the file index unless it would take more than a quarter of the budget
+    code_index = codebase.index
+    if estimate_tokens(str(code_index)) > remaining // 4:
+        code_index = None
+    else:
+        remaining -= estimate_tokens(str(code_index))
+
+    selected = []
+    for i in index.search(question):
+        unit = index.units[i]
+        if unit.tokens + 20 <= remaining:
+            selected.append(unit)
+            remaining -= unit.tokens + 20
+        if remaining < MIN_UNIT_TOKENS:
+            break
+
+    selected.sort(key=lambda unit: (unit.path, unit.start_line))
+    if code_index is None:
+        code_index = sorted({unit.path for unit in selected})
+        code_index.append(f"... {len(codebase.index) - len(code_index)} more files not shown")
+    excerpts = "".join(unit.render() for unit in selected)
+
+    prompt = f"""
+    Question : {question}
+
+    Context:
+
+    - The parts of the codebase most relevant to the question are provided below.
+    - Here is an index of the files in the codebase: {code_index}
+    - Each excerpt is headed by its file and line range. {excerpts}
+
+    Answer:
+
+    """
+
+    return prompt
@@ -0,0 +1,107 @@
+import re
+from typing import Callable, Optional
+
+from llm_client import ChatResult, Conversation
+
+# finish_reason values meaning the model hit its output limit (OpenAI/Azure, Anthropic)
+TRUNCATED = {"length", "max_tokens"}
+
+# finish_reason values meaning the model ended the response itself
+FINISHED = {"stop", "end_turn", "stop_sequence", "content_filter", "tool_calls", "function_call"}
+
+# Characters of the emitted output resent with each continuation request (about 1000 tokens)
+TAIL_CHARS = 4000
+
+# Lines kept in the outline of what has been emitted
+OUTLINE_LINES = 60
+
+# Lines that structure a response: markdown headings and steps, file names,
+# class/method/procedure declarations
+OUTLINE_LINE = re.compile(
+    r"^\s*(?:#{1,6}\s|\*\*[^*]+\*\*:?\s*$|Step\s+\d+|(?:\w+/)+\w+\.\w+\s*$|"
+    r"(?:public|private|protected)\b[^;=]*[({]\s*$|(?:abstract\s+|final\s+)?(?:class|interface|enum|record)\s+\w+|"
+    r"def\s+\w+|CREATE\b)",
+    re.IGNORECASE,
+)
+
+CONTINUATION_PROMPT = """{prompt}
+
+----
+Your answer to the request above was cut off by the output limit. It is not repeated
+here in full. Outline of what you have written so far:
+{outline}
+
+Your answer currently ends with:
+<<<
+{tail}
+>>>
+{note}
+Continue exactly where the answer ends. Do not repeat anything already written,
+do not restart or summarize the answer, and do not add an introduction."""
+
+def outline(text, max_lines=OUTLINE_LINES):
+    """ compact outline of a response: its headings and declarations, most recent kept if too many """
+    lines = [line.strip()[:120] for line in text.splitlines() if OUTLINE_LINE.match(line)]
+    if len(lines) > max_lines:
+        lines = [f"... {len(lines) - max_lines} earlier items"] + lines[-max_lines:]
+    return "\n".join(f"- {line}" for line in lines) or "- (no headings or declarations yet)"
+
+def continuation_prompt(prompt, emitted, note="", tail_chars=TAIL_CHARS):
+    """
+    Prompt for the next part of a cut-off response: the original request, an outline
+    of what has been emitted and only its tail, so the input stays about the same
+    size however long the response grows.
+    """
+    tail = emitted[-tail_chars:]
+    if len(emitted) > tail_chars and "\n" in tail:
+        tail = tail[tail.index("\n") + 1:]  # start the tail on a line boundary
+    return CONTINUATION_PROMPT.format(prompt=prompt, outline=outline(emitted), tail=tail,
+                                      note=f"{note}\n" if note else "")
+
+def continue_response(conversation: Conversation, prompt, emitted, note="", stream_to=None):
+    """
+    Ask for the next part of a cut-off response with continuation_prompt. The
+    conversation history is dropped first, so earlier partial answers aren't resent.
+
+    Returns:
+        str: The next part; conversation.last_result holds its finish_reason and usage
+    """
+    conversation.reset()
+    return conversation.predict(input=continuation_prompt(prompt, emitted, note), stream_to=stream_to)
+
+def was_truncated(result: Optional[ChatResult], max_tokens=None) -> Optional[bool]:
+    """
+    Whether the API reports the response as cut off: True/False from finish_reason,
+    else from the usage counters (completion tokens reaching max_tokens); None if
+    the result carries neither.
+    """
+    if result is None:
+        return None
+    if result.finish_reason in TRUNCATED:
+        return True
+    if result.finish_reason in FINISHED:
+        return False
+    completion_tokens = (result.usage or {}).get("completion_tokens")
+    if completion_tokens is not None and max_tokens:
+        return completion_tokens >= max_tokens
+    return None
+
+def should_continue(result: Optional[ChatResult], text, max_tokens=None,
+                    fallback: Optional[Callable[[str], bool]] = None) -> bool:
+    """
+    Decide whether to ask the model to continue.
+
+    Args:
+        result (ChatResult): The last API result (finish_reason and usage)
+        text (str): The response text so far, for the fallback
+        max_tokens (int): Output limit of the call, used with the usage counters
+        fallback (callable): fallback(text) -> bool, a text heuristic used only when
+            the API says nothing about truncation
+
+    Returns:
+        bool: True only when the model was cut off (or, without API signals, the fallback says so)
+    """
+    truncated = was_truncated(result, max_tokens)
+    if truncated is not None:
+        return truncated
+    return bool(fallback and fallback(text))
@@ -1,47 +1,49 @@
 from dotenv import load_dotenv
 import streamlit as st
-import os
-import requests
-from util import extract_code, get_code_prompt
+from code_retrieval import DEFAULT_TOKEN_BUDGET, build_code_prompt
+from snapshot import get_codebase
+from response_cache import cached_response
+from parallel import DEFAULT_MAX_WORKERS, map_in_containers
+from design_mapreduce import DESIGN_MODES, show_design
+from scan_rules import skipped_reasons
+from telemetry import session_totals, start_session
+from rate_limiter import describe_backlog, set_wait_listener, toast_wait
+from model_router import AUTO, describe_latency, resolve_model
+from llm_client import get_client, sampling_params
+from continuation import should_continue
 from prompt_templates import code_explain_prompt, java_code_gen_prompt, oo_design_prompt
 from langchain_core.prompts import PromptTemplate
 
 _ = load_dotenv()
 
+# Requests queued by the rate limiter show a toast on the page
+set_wait_listener(toast_wait)
+
+# LLM telemetry is totalled per browser session
+start_session(st.session_state)
+
 code_dir_name = "./code1"
 
-def llm(prompt, model_name):
+def llm(prompt, model_name, stream=True):
     """
-    Generic LLM calling function that works with Azure OpenAI
+    Generic LLM calling function that works with Azure OpenAI; streams the response into the page.
+    Returns (response, complete), complete being False if the model was cut off
     """
     try:
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": os.environ["AZURE_OPENAI_API_KEY"]
-        }
-        data = {
-            "model": model_name,
-            "messages": [
-                {"role": "system", "content": "Answer the user's questions based on the extracted text."},
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post(
-            f"{os.environ['AZURE_OPENAI_ENDPOINT']}/openai/deployments/{os.environ['DEPLOYMENT_NAME']}/chat/completions?api-version=2024-09-01-preview",
-            headers=headers, 
-            json=data
-        )
-        
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
+        # Like the original requests.post call, sends no temperature or max_tokens
+        if not stream:
+            result = get_client().complete(prompt, model_name, api_defaults=True)
+        else:
+            response = get_client().stream_complete(prompt, model_name, api_defaults=True)
+            st.write_stream(response)
+            result = response.result
+        return result.text, not should_continue(result, result.text)
     except Exception as e:
         st.error(f"Error calling GPT model: {e}")
-        return None
+        return None, False
 
 # Extract code content
-code_index, code_text, file_content = extract_code(code_dir_name)
+codebase = get_codebase(code_dir_name)
 
 # Initialize selected model
 selected_model = None
@@ -71,7 +73,8 @@ with st.sidebar:
          "/openai_gpt_4o",
          "/openai_o1_preview",
          "/openai_o1_mini",
-         "/claude_3.5_sonnet")
+         "/claude_3.5_sonnet",
+         "/auto")
     )
 
     # Map selection to model names
@@ -80,11 +83,14 @@ with st.sidebar:
         "/openai_gpt_4o": "gpt-4o",
         "/openai_o1_preview": "o1-preview",
         "/openai_o1_mini": "o1-mini",
-        "/claude_3.5_sonnet": "claude-3-5-sonnet"
+        "/claude_3.5_sonnet": "claude-3-5-sonnet",
+        "/auto": AUTO
     }
     
     selected_model = model_mapping[select_model]
     st.write("Selected Language Model:", selected_model)
+    if selected_model == AUTO and describe_latency():
+        st.caption(describe_latency())
 
     add_radio = st.radio(
         "What can I do for you today?",
@@ -95,43 +101,65 @@ with st.sidebar:
          "/generate_java_code")
     )
 
+    max_workers = st.slider("Concurrent LLM calls", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS)
+    bypass_cache = st.toggle("Bypass response cache", False,
+                             help="Call the model even if an identical request was answered before")
+    if describe_backlog():
+        st.caption(describe_backlog())
+    telemetry_panel = st.empty()  # filled with the session's LLM totals once this run's calls are done
+
 def execute(model_name, exec_prompt, code):
     """
     Execute LLM with provided prompt template
     """
     final_prompt = PromptTemplate.from_template(exec_prompt)
     formatted_prompt = final_prompt.format(PLSQL_CODE=code)
-    return llm(formatted_prompt, model_name)
+    model_name = resolve_model(model_name, formatted_prompt, exec_prompt, on_route=st.caption)
+    return cached_response(lambda: llm(formatted_prompt, model_name), model_name, formatted_prompt, exec_prompt,
+                           sampling_params(model_name, api_defaults=True), bypass=bypass_cache, on_hit=st.write)
 
 # Main content based on selection
 if add_radio == "/show_code":
     st.title("/show_code")
     st.write("Here is the index of the files in the codebase:")
-    st.write(code_index)
+    st.write(codebase.index)
+    if codebase.skipped:
+        st.write("Skipped files:", skipped_reasons(codebase.skipped))
     st.write("Here is the entire codebase:")
-    st.code(code_text)
+    st.code(codebase.text)
 
 elif add_radio == "/command_interface":
     st.title("/command_interface")
     question = st.text_input("Enter your question here:")
+    context_mode = st.radio("Context", ("retrieval", "full"), horizontal=True)
+    token_budget = st.number_input("Prompt token budget", min_value=1000, max_value=200000,
+                                   value=DEFAULT_TOKEN_BUDGET, step=1000)
     if st.button("/get_answer"):
-        prompt = get_code_prompt(question, code_index, code_text)
-        response = llm(prompt, selected_model)
-        st.write(response)
+        prompt = build_code_prompt(question, codebase, token_budget, context_mode)
+        response, _ = llm(prompt, resolve_model(selected_model, prompt, task="qa", on_route=st.caption))
 
 elif add_radio == "/explain":
     st.title("/explain")
-    for file in file_content:
-        response = execute(selected_model, code_explain_prompt, file)
-        st.write(response)
+    map_in_containers(
+        lambda code_file: execute(selected_model, code_explain_prompt, code_file.render()),
+        codebase.files, max_workers=max_workers,
+    )
 
 elif add_radio == "/generate_oo_design":
     st.title("/generate_oo_design")
-    response = execute(selected_model, oo_design_prompt, code_text)
-    st.write(response)
+    design_mode = st.radio("Design mode", DESIGN_MODES, horizontal=True)
+    response = show_design(
+        design_mode, codebase.files, lambda: execute(selected_model, oo_design_prompt, codebase.text),
+        lambda prompt: llm(prompt, resolve_model(selected_model, prompt, task="design"), stream=False),
+        selected_model, max_workers,
+    )
 
 elif add_radio == "/generate_java_code":
     st.title("/generate_java_code")
-    for file in file_content:
-        response = execute(selected_model, java_code_gen_prompt, file)
-        st.write(response)
\ No newline at end of file
+    map_in_containers(
+        lambda code_file: execute(selected_model, java_code_gen_prompt, code_file.render()),
+        codebase.files, max_workers=max_workers,
+    )
+
+# Session totals, including the calls made during this run
+telemetry_panel.caption(session_totals().describe())
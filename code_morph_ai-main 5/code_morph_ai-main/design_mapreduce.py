@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+
+from langchain_core.prompts import PromptTemplate
+
+from parallel import map_parallel
+from prompt_templates import oo_design_from_digest_prompt, oo_digest_merge_prompt, oo_digest_prompt
+
+# Codebases estimated above this many tokens go through the map-reduce path in "auto" mode
+SINGLE_CALL_TOKENS = int(os.environ.get("OO_DESIGN_SINGLE_CALL_TOKENS", 24000))
+
+# Digests merged per reduce call
+REDUCE_FAN_IN = 4
+
+# Options of the apps' design mode selector (see show_design)
+DESIGN_MODES = ("auto", "single call", "map-reduce")
+
+DIGEST_CACHE_DIR = os.environ.get("DIGEST_CACHE_DIR", ".cache/oo_digests")
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class DigestCache:
+    """
+    On-disk cache of intermediate digests. Leaves are keyed by the file content, inner
+    nodes by their children's keys, so editing one file only invalidates its branch.
+    """
+
+    def __init__(self, cache_dir=DIGEST_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, text):
+        path = self._path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump({"text": text}, f)
+            os.replace(path + ".tmp", path)
+
+def should_map_reduce(files):
+    """ True when the files are too large for a single oo_design_prompt call """
+    return sum(code_file.size for code_file in files) // 4 > SINGLE_CALL_TOKENS
+
+def _cached_call(llm_fn, template, code, key, cache, store=True):
+    """
+    (response, cached) for template filled with code, from the cache if it is there.
+    A response is cached only if it is complete and store is set; cached tells the
+    caller whether the response is the one the cache holds (or now holds) for key.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, True
+    response, complete = llm_fn(PromptTemplate.from_template(template).format(PLSQL_CODE=code))
+    store = store and bool(response) and complete
+    if store:
+        cache.put(key, response)
+    return response, store
+
+def bucket_tree(items, path_of, fan_in=REDUCE_FAN_IN, depth=0):
+    """
+    Nest items into merge groups of at most fan_in by the hash of their path: a group
+    with more items is split into fan_in buckets on the next base-fan_in digit of the
+    hash. A group only depends on the paths that hash into it, so adding or removing a
+    file changes the groups on that file's branch and no others.
+
+    Returns:
+        list: Groups whose members are items or nested groups
+    """
+    if len(items) <= fan_in or depth >= 64:
+        return sorted(items, key=path_of)
+    buckets = [[] for _ in range(fan_in)]
+    for item in items:
+        buckets[int(_hash(path_of(item)), 16) // fan_in ** depth % fan_in].append(item)
+    return [bucket_tree(bucket, path_of, fan_in, depth + 1) for bucket in buckets if bucket]
+
+def generate_oo_design(files, llm_fn, model_name, max_workers=None, fan_in=REDUCE_FAN_IN, cache=None, progress=None):
+    """
+    Hierarchical OO design generation for codebases too large for one call.
+
+    Map: every file is summarized into a design digest, in parallel.
+    Reduce: digests are merged fan_in at a time along bucket_tree, deepest groups first,
+    until one digest is left; that digest is turned into the final design with
+    oo_design_from_digest_prompt.
+
+    Args:
+        files (list): CodeFile records
+        llm_fn (callable): llm_fn(prompt) -> (response text or None on failure, complete);
+            digests that are still cut off are used but not cached
+        model_name (str): Model name, part of the cache key
+        max_workers (int): Concurrent LLM calls per level
+        fan_in (int): Digests merged per reduce call
+        cache (DigestCache): Intermediate digest cache, defaults to DIGEST_CACHE_DIR
+        progress (callable): Called as progress(stage, done, total)
+
+    Returns:
+        tuple: (design or None if the final call failed, complete)
+    """
+    cache = cache or DigestCache()
+    map_version = _hash(oo_digest_prompt)[:12]
+    merge_version = _hash(oo_digest_merge_prompt)[:12]
+
+    def report(stage, total):
+        done = [0]
+
+        def on_done(_, __):
+            done[0] += 1
+            if progress:
+                progress(stage, done[0], total)
+        return on_done
+
+    # Map: one digest per file. Each node is (key, text, cached); a failed or cut-off
+    # digest isn't cached, and neither is any merge built on it, so a later run retries it
+    # instead of finding a merge that contains the placeholder under the key a good one uses
+    leaves = [(_hash(model_name, map_version, code_file.path, code_file.text), code_file) for code_file in files]
+    digests = map_parallel(
+        lambda leaf: _cached_call(llm_fn, oo_digest_prompt, leaf[1].render(), leaf[0], cache),
+        leaves, max_workers, report("digest", len(leaves)),
+    )
+    nodes = {
+        id(leaf): (leaf[0], f"__________{leaf[1].path}__________\n{digest or '(digest unavailable)'}\n", cached)
+        for leaf, (digest, cached) in zip(leaves, digests)
+    }
+    if not nodes:
+        return None, False
+
+    # Reduce: merge the groups of bucket_tree by height, every group of a height in parallel
+    tree = bucket_tree(leaves, lambda leaf: leaf[1].path, fan_in)
+    by_height = {}
+
+    def collect(group):
+        if not isinstance(group, list):
+            return 0
+        height = 1 + max(collect(member) for member in group)
+        by_height.setdefault(height, []).append(group)
+        return height
+
+    def merge(group):
+        children = [nodes[id(member)] for member in group]
+        if len(children) == 1:
+            return children[0]
+        key = _hash(model_name, merge_version, *(key for key, _, _ in children))
+        text, cached = _cached_call(llm_fn, oo_digest_merge_prompt, "\n".join(text for _, text, _ in children), key,
+                                    cache, store=all(cached for _, _, cached in children))
+        return key, text or "(digest unavailable)", cached
+
+    for height in range(1, collect(tree) + 1):
+        groups = by_height[height]
+        merged = map_parallel(merge, groups, max_workers, report(f"merge level {height}", len(groups)))
+        nodes.update((id(group), node) for group, node in zip(groups, merged))
+
+    if progress:
+        progress("design", 0, 1)
+    final_prompt = PromptTemplate.from_template(oo_design_from_digest_prompt).format(PLSQL_CODE=nodes[id(tree)][1])
+    return llm_fn(final_prompt)
+
+def show_design(mode, files, single_call, llm_fn, model_name, max_workers=None, write=True):
+    """
+    The apps' /generate_oo_design: the OO design of files in a Streamlit page.
+
+    Args:
+        mode (str): One of DESIGN_MODES; "auto" takes the map-reduce path when should_map_reduce(files)
+        single_call (callable): single_call() -> design, from one call over the whole codebase
+            (displaying its own response)
+        llm_fn (callable): As for generate_oo_design
+        write (bool): Write the map-reduce design into the page
+
+    Returns:
+        str: The design, or "" (with an error shown) if it failed
+    """
+    import streamlit as st
+
+    if mode == "single call" or (mode == "auto" and not should_map_reduce(files)):
+        design = single_call()
+    else:
+        design_progress = st.progress(0.0, text="Summarizing files...")
+        design, _ = generate_oo_design(
+            files, llm_fn, model_name, max_workers,
+            progress=lambda stage, done, total: design_progress.progress(
+                done / total if total else 1.0, text=f"{stage}: {done}/{total}"),
+        )
+        design_progress.empty()
+        if write and design:
+            st.write(design)
+    if not design:
+        st.error("The design could not be generated.")
+        return ""
+    return design
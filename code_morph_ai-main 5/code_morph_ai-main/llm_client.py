@@ -0,0 +1,438 @@
+"""
+Shared chat-completions client for the CodeMorph apps.
+
+One httpx.Client per process keeps connections alive between calls (HTTP/2 with
+LLM_HTTP2=1, which needs httpx[http2]), so every llm() call after the first skips TCP/TLS setup.
+Every request on it waits for its deployment's RPM/TPM budget (see rate_limiter).
+Talks to Azure OpenAI when AZURE_OPENAI_ENDPOINT is set, otherwise to an
+OpenAI-compatible endpoint at OPENAI_BASE_URL.
+"""
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+import telemetry
+from rate_limiter import limit_request
+from tokenizer import approx_tokens
+
+AZURE_API_VERSION = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-09-01-preview")
+
+DEFAULT_SYSTEM_PROMPT = "Answer the user's questions based on the extracted text."
+
+# Connection pool and timeouts, in seconds
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 120))
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 300))
+
+# HTTP/2 is opt-in: it needs the h2 package (pip install "httpx[http2]")
+HTTP2 = os.environ.get("LLM_HTTP2", "") == "1"
+
+@dataclass(frozen=True)
+class ModelSettings:
+    """Per-model request settings."""
+    deployment: Optional[str] = None  # Azure deployment, defaults to DEPLOYMENT_NAME
+    temperature: Optional[float] = 0.5  # None for models that only accept the default
+    max_tokens: Optional[int] = 4000  # None sends no output limit
+    max_tokens_field: str = "max_tokens"
+    stream: bool = True  # False for models whose API rejects stream=true
+
+MODEL_SETTINGS: Dict[str, ModelSettings] = {
+    "gpt-4o-mini": ModelSettings(),
+    "gpt-4o": ModelSettings(),
+    "o1-preview": ModelSettings(temperature=None, max_tokens=16000, max_tokens_field="max_completion_tokens", stream=False),
+    "o1-mini": ModelSettings(temperature=None, max_tokens=16000, max_tokens_field="max_completion_tokens", stream=False),
+    "claude-3-5-sonnet": ModelSettings(),
+}
+
+def model_settings(model_name, **overrides) -> ModelSettings:
+    """
+    Settings for model_name. The Azure deployment can be set per model with
+    DEPLOYMENT_NAME_<MODEL> (e.g. DEPLOYMENT_NAME_GPT_4O_MINI).
+    """
+    settings = MODEL_SETTINGS.get(model_name, ModelSettings())
+    deployment = os.environ.get("DEPLOYMENT_NAME_" + re.sub(r"\W", "_", model_name).upper())
+    if deployment and settings.deployment is None:
+        settings = replace(settings, deployment=deployment)
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    if settings.temperature is None:
+        overrides.pop("temperature", None)
+    return replace(settings, **overrides)
+
+def sampling_params(model_name, temperature=None, max_tokens=None, api_defaults=False) -> dict:
+    """
+    The sampling fields a request for model_name sends, e.g. {"temperature": 0.5, "max_tokens": 4000}
+    or {"max_completion_tokens": 16000} for o1; empty with api_defaults
+    """
+    if api_defaults:
+        return {}
+    settings = model_settings(model_name, temperature=temperature, max_tokens=max_tokens)
+    params = {}
+    if settings.max_tokens is not None:
+        params[settings.max_tokens_field] = settings.max_tokens
+    if settings.temperature is not None:
+        params["temperature"] = settings.temperature
+    return params
+
+@dataclass
+class ChatResult:
+    text: str
+    finish_reason: Optional[str] = None
+    usage: dict = field(default_factory=dict)
+
+def _record_call(data, kind, start, result: Optional[ChatResult] = None, ttft=None, error=None, tag=("", 0)):
+    """
+    Record a finished call in the telemetry log and, if it succeeded, the latency
+    stats. Token counts are estimated from the text when the API reports no usage.
+    """
+    latency = time.perf_counter() - start
+    prompt_tokens = completion_tokens = 0
+    if result is not None:
+        prompt_tokens = result.usage.get("prompt_tokens") or approx_tokens(json.dumps(data["messages"]))
+        completion_tokens = result.usage.get("completion_tokens") or approx_tokens(result.text)
+        get_latency_stats().record(data["model"], latency, prompt_tokens + completion_tokens)
+    request_id, round = tag
+    telemetry.record(telemetry.CallRecord(
+        data["model"], kind, prompt_tokens, completion_tokens, ttft, latency,
+        result.finish_reason if result else None, request_id, round, error,
+    ))
+
+def _single_turn(prompt, system):
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+class ChatStream:
+    """
+    Iterator over the text deltas of a streamed chat completion (server-sent events),
+    e.g. for st.write_stream. Once it is exhausted, .result holds the whole ChatResult.
+    """
+
+    def __init__(self, http: httpx.Client, url, params, headers, data, tag=("", 0)):
+        self.http = http
+        self.request = (url, params, headers, data)
+        self.tag = tag
+        self.result: Optional[ChatResult] = None
+
+    def __iter__(self):
+        url, params, headers, data = self.request
+        start = time.perf_counter()
+        try:
+            yield from self._events(url, params, headers, data, start)
+        except Exception as e:
+            _record_call(data, "stream", start, error=str(e), tag=self.tag)
+            raise
+
+    def _events(self, url, params, headers, data, start):
+        parts = []
+        ttft = None
+        finish_reason = None
+        usage = {}
+        with self.http.stream("POST", url, params=params, headers=headers, json=data) as response:
+            if response.is_error:
+                response.read()
+                response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                event = json.loads(payload)
+                usage = event.get("usage") or usage
+                for choice in event.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        parts.append(delta)
+                        yield delta
+                    finish_reason = choice.get("finish_reason") or finish_reason
+        self.result = ChatResult("".join(parts), finish_reason, usage)
+        _record_call(data, "stream", start, self.result, ttft, tag=self.tag)
+
+class BufferedStream:
+    """
+    ChatStream stand-in for models that can't stream: one regular request, made when
+    iteration starts, whose whole text is the only delta.
+    """
+
+    def __init__(self, chat: Callable[[], ChatResult]):
+        self.chat = chat
+        self.result: Optional[ChatResult] = None
+
+    def __iter__(self):
+        self.result = self.chat()
+        if self.result.text:
+            yield self.result.text
+
+class LLMClient:
+    """Chat completions over one pooled, keep-alive HTTP client."""
+
+    def __init__(self, endpoint=None, api_key=None, azure=None, http_client: Optional[httpx.Client] = None):
+        azure_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+        self.azure = bool(azure_endpoint) if azure is None else azure
+        if self.azure:
+            self.endpoint = (endpoint or azure_endpoint or "").rstrip("/")
+            self.api_key = api_key or os.environ.get("AZURE_OPENAI_API_KEY", "")
+        else:
+            self.endpoint = (endpoint or os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")).rstrip("/")
+            self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+        self.http = http_client or httpx.Client(
+            http2=HTTP2,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            event_hooks={"request": [limit_request]},
+        )
+
+    def _request(self, settings: ModelSettings):
+        if self.azure:
+            deployment = settings.deployment or os.environ["DEPLOYMENT_NAME"]
+            url = f"{self.endpoint}/openai/deployments/{deployment}/chat/completions"
+            return url, {"api-version": AZURE_API_VERSION}, {"api-key": self.api_key}
+        return f"{self.endpoint}/chat/completions", None, {"Authorization": f"Bearer {self.api_key}"}
+
+    def _prepare(self, messages, model_name, temperature, max_tokens, api_defaults):
+        url, params, headers = self._request(model_settings(model_name))
+        data = {"model": model_name, "messages": messages,
+                **sampling_params(model_name, temperature, max_tokens, api_defaults)}
+        return url, params, headers, data
+
+    def chat(self, messages: List[dict], model_name, temperature=None, max_tokens=None, tag=("", 0),
+             api_defaults=False) -> ChatResult:
+        """
+        Send a chat completion request.
+
+        Args:
+            tag (tuple): (request id, continuation round) recorded with the call's telemetry
+            api_defaults (bool): Send neither temperature nor an output limit, leaving
+                both to the API's defaults
+
+        Raises:
+            httpx.HTTPError: On connection errors and non-2xx responses
+        """
+        url, params, headers, data = self._prepare(messages, model_name, temperature, max_tokens, api_defaults)
+        start = time.perf_counter()
+        try:
+            response = self.http.post(url, params=params, headers=headers, json=data)
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            _record_call(data, "chat", start, error=str(e), tag=tag)
+            raise
+        choice = result["choices"][0]
+        chat_result = ChatResult(choice["message"].get("content") or "", choice.get("finish_reason"), result.get("usage", {}))
+        _record_call(data, "chat", start, chat_result, tag=tag)
+        return chat_result
+
+    def stream_chat(self, messages: List[dict], model_name, temperature=None, max_tokens=None, tag=("", 0),
+                    api_defaults=False):
+        """
+        like chat(), but returns the response as a stream of text deltas; for models whose
+        settings don't allow streaming, a BufferedStream of one regular request
+        """
+        if not model_settings(model_name).stream:
+            return BufferedStream(lambda: self.chat(messages, model_name, temperature, max_tokens, tag, api_defaults))
+        url, params, headers, data = self._prepare(messages, model_name, temperature, max_tokens, api_defaults)
+        data.update(stream=True, stream_options={"include_usage": True})
+        return ChatStream(self.http, url, params, headers, data, tag)
+
+    def complete(self, prompt, model_name, system=DEFAULT_SYSTEM_PROMPT, **kwargs) -> ChatResult:
+        """ single-turn chat: system prompt plus one user message """
+        return self.chat(_single_turn(prompt, system), model_name, **kwargs)
+
+    def stream_complete(self, prompt, model_name, system=DEFAULT_SYSTEM_PROMPT, **kwargs):
+        return self.stream_chat(_single_turn(prompt, system), model_name, **kwargs)
+
+    def conversation(self, model_name, **kwargs) -> "Conversation":
+        return Conversation(self, model_name, **kwargs)
+
+    def close(self):
+        self.http.close()
+
+class Conversation:
+    """
+    Multi-turn chat that keeps its message history, a drop-in for the
+    ConversationChain(...).predict(input=...) pattern.
+    """
+
+    def __init__(self, client: LLMClient, model_name, system=None, **kwargs):
+        self.client = client
+        self.model_name = model_name
+        self.kwargs = kwargs
+        self.messages = [{"role": "system", "content": system}] if system else []
+        self.last_result: Optional[ChatResult] = None
+        # Telemetry groups the calls of one conversation; each call after the first is a continuation round
+        self.request_id = telemetry.new_request_id()
+        self.calls = 0
+
+    def _tag(self):
+        self.calls += 1
+        return self.request_id, self.calls - 1
+
+    def reset(self):
+        """ forget every turn, keeping the system prompt """
+        self.messages = [message for message in self.messages if message["role"] == "system"]
+
+    def predict(self, input, stream_to=None):
+        """
+        Send input and return the reply. With stream_to (e.g. st.write_stream), the reply
+        is streamed into it as it is generated.
+        """
+        if stream_to is not None:
+            stream_to(self.stream(input))
+            return self.last_result.text
+        self.messages.append({"role": "user", "content": input})
+        try:
+            self.last_result = self.client.chat(self.messages, self.model_name, tag=self._tag(), **self.kwargs)
+        except Exception:
+            self.messages.pop()
+            raise
+        self.messages.append({"role": "assistant", "content": self.last_result.text})
+        return self.last_result.text
+
+    def stream(self, input):
+        """ predict() as a stream of text deltas; the reply joins the history once the stream ends """
+        self.messages.append({"role": "user", "content": input})
+        stream = self.client.stream_chat(self.messages, self.model_name, tag=self._tag(), **self.kwargs)
+        try:
+            yield from stream
+        except Exception:
+            self.messages.pop()
+            raise
+        self.last_result = stream.result
+        self.messages.append({"role": "assistant", "content": self.last_result.text})
+
+# HTTP statuses worth retrying: timeouts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def is_transient(error) -> bool:
+    """ True for connection/timeout errors and retryable HTTP statuses """
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in RETRYABLE_STATUS
+
+@dataclass
+class AttemptRecord:
+    """One model call made under a RetryPolicy."""
+    label: str
+    latency: float
+    finish_reason: Optional[str] = None
+    error: Optional[str] = None
+
+@dataclass
+class RetryPolicy:
+    """
+    How a multi-call generation retries: sampling stays fixed across attempts (so
+    repeated requests are reproducible and cacheable), transport errors are retried
+    with exponential backoff, and every call's latency is recorded in attempts.
+    """
+    max_attempts: int = 3  # model calls for a response, initial plus continuations
+    max_transport_retries: int = 2  # extra tries per call on transient errors
+    backoff: float = 1.0  # seconds before the first transport retry, doubled after each
+    temperature: float = 0.0
+    max_tokens: int = 4000
+    attempts: List[AttemptRecord] = field(default_factory=list)
+
+    def call(self, fn: Callable, label, conversation: Optional["Conversation"] = None,
+             on_retry: Optional[Callable[[], None]] = None):
+        """
+        Run fn(), retrying transient errors. Other errors, and transient ones once the
+        retries are used up, are raised. With conversation, its last_result's
+        finish_reason is recorded.
+
+        A retried call starts its reply over, so when fn streams into the page, on_retry
+        must take back what the failed attempt already showed (e.g. reset its placeholder);
+        it is called before every retry.
+        """
+        for retry in range(self.max_transport_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                self.attempts.append(AttemptRecord(label, time.perf_counter() - start, error=str(e)))
+                if retry == self.max_transport_retries or not is_transient(e):
+                    raise
+                if on_retry:
+                    on_retry()
+                time.sleep(self.backoff * 2 ** retry)
+                continue
+            finish_reason = conversation.last_result.finish_reason if conversation and conversation.last_result else None
+            self.attempts.append(AttemptRecord(label, time.perf_counter() - start, finish_reason))
+            return result
+
+    def sampling(self, model_name) -> dict:
+        """ the sampling fields every call under this policy sends to model_name """
+        return sampling_params(model_name, self.temperature, self.max_tokens)
+
+    def summary(self):
+        return ", ".join(
+            f"{a.label} {a.latency:.1f}s" + (f" ({a.finish_reason})" if a.finish_reason else "") + (" failed" if a.error else "")
+            for a in self.attempts
+        )
+
+# Weight of the newest call in the moving averages
+LATENCY_SMOOTHING = 0.3
+
+@dataclass
+class ModelLatency:
+    """Observed speed of one model: moving averages over its recent calls."""
+    calls: int = 0
+    seconds: float = 0.0  # per call
+    seconds_per_1k_tokens: float = 0.0  # prompt plus completion, so calls of any size compare
+
+class LatencyStats:
+    """
+    Per-model latency of the calls made in this process (including any wait for
+    the rate limiter, so a queued deployment looks slow), e.g. for model routing.
+    """
+
+    def __init__(self, smoothing=LATENCY_SMOOTHING):
+        self.smoothing = smoothing
+        self._models: Dict[str, ModelLatency] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, seconds, tokens):
+        per_1k = seconds / max(tokens, 1) * 1000
+        with self._lock:
+            stats = self._models.setdefault(model_name, ModelLatency())
+            weight = 1.0 if stats.calls == 0 else self.smoothing
+            stats.seconds += weight * (seconds - stats.seconds)
+            stats.seconds_per_1k_tokens += weight * (per_1k - stats.seconds_per_1k_tokens)
+            stats.calls += 1
+
+    def get(self, model_name) -> Optional[ModelLatency]:
+        with self._lock:
+            stats = self._models.get(model_name)
+            return replace(stats) if stats else None
+
+    def expected_seconds(self, model_name, tokens) -> Optional[float]:
+        """ predicted latency of a call with this many prompt plus completion tokens; None before the first call """
+        stats = self.get(model_name)
+        return stats.seconds_per_1k_tokens * tokens / 1000 if stats else None
+
+    def snapshot(self) -> Dict[str, ModelLatency]:
+        with self._lock:
+            return {name: replace(stats) for name, stats in self._models.items()}
+
+_latency_stats = LatencyStats()
+
+def get_latency_stats() -> LatencyStats:
+    return _latency_stats
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> LLMClient:
+    """ process-wide client, so every app, session and rerun shares its connection pool """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
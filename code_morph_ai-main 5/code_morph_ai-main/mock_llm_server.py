@@ -0,0 +1,309 @@
+"""
+Local stand-in for the Azure OpenAI / OpenAI chat-completions and embeddings APIs,
+for offline load and performance testing. Standard library only.
+
+Routes (POST):
+    /openai/deployments/<deployment>/chat/completions, /openai/deployments/<deployment>/embeddings
+    /v1/chat/completions, /v1/embeddings (also without the /v1 prefix)
+GET /stats returns request counters; POST /stats/reset clears them.
+
+Point the apps at it with
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765 AZURE_OPENAI_API_KEY=mock DEPLOYMENT_NAME=mock
+or, for the OpenAI clients (llm_client without Azure, langchain in plsql_spring_boot),
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+
+Examples:
+    python mock_llm_server.py
+    python mock_llm_server.py --latency lognormal:-0.7,0.5 --tokens-per-second 80 --completion-tokens 1500
+    python mock_llm_server.py --error-rate 0.05 --rpm 60 --truncate-rate 0.2
+
+A prompt containing [[TRUNCATE]] is always answered with finish_reason "length",
+and one containing [[429]] with a 429.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+WORDS = ("public class service repository entity procedure cursor loop exception commit "
+         "select insert update delete from where order customer account balance transfer").split()
+
+@dataclass
+class MockConfig:
+    """How the mock server behaves; every field has a matching command-line option."""
+    latency: str = "uniform:0.2,0.6"  # time to first token, see sample_latency
+    tokens_per_second: float = 200.0  # completion generation speed, 0 for instant
+    completion_tokens: int = 300  # length of a full answer, capped by the request's max_tokens
+    truncate_rate: float = 0.0  # share of chat requests cut off with finish_reason "length"
+    error_rate: float = 0.0  # share of requests answered with 429
+    rpm: int = 0  # requests per minute before 429s, 0 for no quota
+    retry_after: int = 1  # Retry-After seconds on 429s
+    embedding_dimensions: int = 1536
+    seed: Optional[int] = None
+
+def sample_latency(spec, rng: random.Random) -> float:
+    """
+    Seconds drawn from a distribution spec: "fixed:S", "uniform:LO,HI", "normal:MEAN,SD",
+    "lognormal:MU,SIGMA" (of the log of seconds) or "exp:MEAN". Never negative.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed":
+        seconds = values[0]
+    elif kind == "uniform":
+        seconds = rng.uniform(*values)
+    elif kind == "normal":
+        seconds = rng.gauss(*values)
+    elif kind == "lognormal":
+        seconds = rng.lognormvariate(*values)
+    elif kind == "exp":
+        seconds = rng.expovariate(1 / values[0])
+    else:
+        raise ValueError(f"unknown latency distribution: {spec}")
+    return max(0.0, seconds)
+
+def approx_tokens(text) -> int:
+    return len(text) // 4 + 1
+
+def _prompt_text(body) -> str:
+    if "messages" in body:
+        return "\n".join(str(message.get("content") or "") for message in body["messages"])
+    return json.dumps(body.get("input", ""))
+
+def embedding(text, dimensions):
+    """ deterministic unit vector for text """
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    chat: int = 0
+    embeddings: int = 0
+    streamed: int = 0
+    truncated: int = 0
+    rate_limited: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    by_deployment: Dict[str, int] = field(default_factory=dict)
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats = MockStats()
+        self.lock = threading.Lock()
+        self._recent = deque()  # request times within the last minute, for --rpm
+
+    def admit(self, prompt) -> bool:
+        """ False if this request should get a 429 (injected error or quota exceeded) """
+        with self.lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if "[[429]]" in prompt or self.rng.random() < self.config.error_rate:
+                return False
+            if self.config.rpm and len(self._recent) >= self.config.rpm:
+                return False
+            self._recent.append(now)
+            return True
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def latency(self):
+        with self.lock:
+            return sample_latency(self.config.latency, self.rng)
+
+    def count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockLLMServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self) -> Tuple[Optional[str], str]:
+        """ (operation, deployment or "") for the request path """
+        path = self.path.split("?")[0].rstrip("/")
+        match = re.fullmatch(r"/openai/deployments/([^/]+)/(chat/completions|embeddings)", path)
+        if match:
+            return match.group(2), match.group(1)
+        match = re.fullmatch(r"(?:/v1)?/(chat/completions|embeddings)", path)
+        return (match.group(1), "") if match else (None, "")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.server.lock:
+                self._send_json(200, vars(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/stats/reset":
+            with self.server.lock:
+                self.server.stats = MockStats()
+            self._send_json(200, {})
+            return
+        operation, deployment = self._route()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if operation is None:
+            self._send_json(404, {"error": {"message": f"unknown route {self.path}"}})
+            return
+        model = deployment or body.get("model", "mock")
+        prompt = _prompt_text(body)
+        with self.server.lock:
+            self.server.stats.by_deployment[model] = self.server.stats.by_deployment.get(model, 0) + 1
+        self.server.count(requests=1)
+        if not self.server.admit(prompt):
+            self.server.count(rate_limited=1)
+            retry_after = self.server.config.retry_after
+            self._send_json(429, {"error": {
+                "code": "429", "message": f"Rate limit exceeded. Retry after {retry_after} seconds."}},
+                {"Retry-After": str(retry_after), "retry-after-ms": str(retry_after * 1000)})
+            return
+        time.sleep(self.server.latency())
+        if operation == "embeddings":
+            self._embeddings(body, model)
+        else:
+            self._chat(body, model, prompt)
+
+    def _embeddings(self, body, model):
+        inputs = body.get("input", "")
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or self.server.config.embedding_dimensions
+        data = []
+        tokens = 0
+        for i, item in enumerate(inputs):
+            text = item if isinstance(item, str) else json.dumps(item)  # token id arrays
+            tokens += len(item) if isinstance(item, list) else approx_tokens(item)
+            vector = embedding(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self.server.count(embeddings=1, prompt_tokens=tokens)
+        self._send_json(200, {"object": "list", "data": data, "model": model,
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _completion(self, body, prompt):
+        """ (text as a list of token-sized pieces, finish_reason) """
+        config = self.server.config
+        limit = body.get("max_tokens") or body.get("max_completion_tokens") or config.completion_tokens
+        wanted = config.completion_tokens
+        if "[[TRUNCATE]]" in prompt or self.server.random() < config.truncate_rate:
+            wanted = max(wanted, limit + 1)
+        count = min(wanted, limit)
+        last = str((body.get("messages") or [{}])[-1].get("content") or "")
+        pieces = ["Mock", " response", " to:", " " + " ".join(last.split()[:8]), "\n"]
+        pieces += [(" " if i % 12 else "\n") + WORDS[i % len(WORDS)] for i in range(max(0, count - len(pieces)))]
+        return pieces[:count], "length" if wanted > limit else "stop"
+
+    def _chat(self, body, model, prompt):
+        pieces, finish_reason = self._completion(body, prompt)
+        usage = {"prompt_tokens": approx_tokens(prompt), "completion_tokens": len(pieces)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.server.count(chat=1, truncated=finish_reason == "length",
+                          prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+        rate = self.server.config.tokens_per_second
+        header = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": model}
+        if not body.get("stream"):
+            if rate:
+                time.sleep(len(pieces) / rate)
+            self._send_json(200, {**header, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "message": {"role": "assistant", "content": "".join(pieces)}, "finish_reason": finish_reason}]})
+            return
+        self.server.count(streamed=1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload):
+            data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode()) + b"\n\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        chunk = {**header, "object": "chat.completion.chunk"}
+        event({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for i in range(0, len(pieces), 4):
+            if rate:
+                time.sleep(len(pieces[i:i + 4]) / rate)
+            event({**chunk, "choices": [{"index": 0, "delta": {"content": "".join(pieces[i:i + 4])}, "finish_reason": None}]})
+        event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event({**chunk, "choices": [], "usage": usage})
+        event(b"[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def start_server(config: Optional[MockConfig] = None, host="127.0.0.1", port=0) -> MockLLMServer:
+    """
+    Start the server on a background thread, e.g. from a benchmark. Port 0 picks a
+    free port; the base URL is then f"http://{host}:{server.server_port}".
+    Stop it with server.shutdown().
+    """
+    server = MockLLMServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    defaults = MockConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default=defaults.latency,
+                        help="time to first token: fixed:S, uniform:LO,HI, normal:MEAN,SD, lognormal:MU,SIGMA or exp:MEAN")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--truncate-rate", type=float, default=defaults.truncate_rate)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="share of requests answered 429")
+    parser.add_argument("--rpm", type=int, default=defaults.rpm, help="requests per minute before 429s (0: unlimited)")
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after)
+    parser.add_argument("--embedding-dimensions", type=int, default=defaults.embedding_dimensions)
+    parser.add_argument("--seed", type=int, default=None)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    sample_latency(args["latency"], random.Random())  # fail fast on a bad spec
+    server = MockLLMServer((host, port), MockConfig(**args))
+    print(f"Mock LLM server on http://{host}:{server.server_port} (Azure: AZURE_OPENAI_ENDPOINT, "
+          f"OpenAI: OPENAI_BASE_URL=http://{host}:{server.server_port}/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
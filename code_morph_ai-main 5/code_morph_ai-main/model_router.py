@@ -0,0 +1,136 @@
+"""
+Automatic model selection ("auto" in the model picker).
+
+Each request is routed by task and size: small prompts and simple PL/SQL go to a
+fast model, large prompts and complex procedures to a strong one. Prompts in the
+band between the two go to the strong tier unless it is currently much slower
+than the fast one. Within a tier, the model with the lowest expected latency is
+picked, based on the calls this process has made (llm_client.LatencyStats).
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from llm_client import LatencyStats, get_latency_stats
+from prompt_templates import (code_explain_prompt, java_code_gen_prompt, ms_prompt, oo_design_prompt,
+                              oo_design_from_digest_prompt, oo_digest_merge_prompt, oo_digest_prompt)
+from tokenizer import count_tokens
+
+AUTO = "auto"
+
+# Candidate models per tier, comma separated, in order of preference before any latency is known
+FAST_MODELS = os.environ.get("ROUTER_FAST_MODELS", "gpt-4o-mini").split(",")
+STRONG_MODELS = os.environ.get("ROUTER_STRONG_MODELS", "gpt-4o").split(",")
+
+# How many times slower than the fast tier the strong tier may be before borderline prompts stay fast
+LATENCY_TOLERANCE = float(os.environ.get("ROUTER_LATENCY_TOLERANCE", 3.0))
+
+@dataclass(frozen=True)
+class TaskProfile:
+    """Limits under which a task counts as simple enough for the fast tier."""
+    small_tokens: int  # prompt tokens; up to twice this is the borderline band
+    max_complexity: Optional[int] = None  # PL/SQL complexity score, None to ignore it
+
+TASKS = {
+    "qa": TaskProfile(small_tokens=8000),
+    "explain": TaskProfile(small_tokens=6000, max_complexity=20),
+    "design": TaskProfile(small_tokens=3000, max_complexity=10),
+    "java": TaskProfile(small_tokens=2000, max_complexity=8),
+}
+
+TEMPLATE_TASKS = {
+    code_explain_prompt: "explain",
+    oo_design_prompt: "design",
+    oo_digest_prompt: "design",
+    oo_digest_merge_prompt: "design",
+    oo_design_from_digest_prompt: "design",
+    java_code_gen_prompt: "java",
+    ms_prompt: "java",
+}
+
+# Constructs that make a procedure harder to translate faithfully
+COMPLEX_CONSTRUCTS = re.compile(
+    r"\b(?:CURSOR|LOOP|EXCEPTION|EXECUTE\s+IMMEDIATE|BULK\s+COLLECT|FORALL|PIPELINED|DBMS_SQL|PRAGMA|"
+    r"MERGE\s+INTO|CONNECT\s+BY|REF\s+CURSOR|SAVEPOINT|ROLLBACK|OVER\s*\()",
+    re.IGNORECASE,
+)
+
+def complexity(code) -> int:
+    """ number of complex PL/SQL constructs (cursors, loops, dynamic SQL, bulk binds...) in code """
+    return len(COMPLEX_CONSTRUCTS.findall(code))
+
+@dataclass
+class Route:
+    model: str
+    task: str
+    tokens: int
+    complexity: int
+    reason: str
+
+    def describe(self):
+        return f"Auto-routed {self.task} ({self.tokens} tokens, complexity {self.complexity}) to {self.model}: {self.reason}"
+
+def _fastest(models, tokens, stats: LatencyStats):
+    """ the model expected to answer soonest, untried models first so every candidate gets measured """
+    expected = [(stats.expected_seconds(model, tokens), i, model) for i, model in enumerate(models)]
+    untried = [model for seconds, _, model in expected if seconds is None]
+    if untried:
+        return untried[0], None
+    seconds, _, model = min(expected)
+    return model, seconds
+
+def route(task, prompt, stats: Optional[LatencyStats] = None, template="") -> Route:
+    """
+    Pick a model for prompt.
+
+    Args:
+        task (str): "qa", "explain", "design" or "java"
+        prompt (str): The formatted prompt
+        stats (LatencyStats): Observed latencies, defaults to the process-wide ones
+        template (str): Template the prompt was built from; its own wording
+            ("exception handling"...) doesn't count towards complexity
+
+    Returns:
+        Route: The model and why it was chosen
+    """
+    stats = stats or get_latency_stats()
+    profile = TASKS.get(task, TASKS["qa"])
+    tokens = count_tokens(prompt)
+    score = complexity(prompt) - complexity(template) if profile.max_complexity is not None else 0
+    fast, fast_seconds = _fastest(FAST_MODELS, tokens, stats)
+    strong, strong_seconds = _fastest(STRONG_MODELS, tokens, stats)
+
+    if profile.max_complexity is not None and score > profile.max_complexity:
+        return Route(strong, task, tokens, score, f"complexity above {profile.max_complexity}")
+    if tokens <= profile.small_tokens:
+        return Route(fast, task, tokens, score, f"prompt within {profile.small_tokens} tokens")
+    if tokens > 2 * profile.small_tokens:
+        return Route(strong, task, tokens, score, f"prompt over {2 * profile.small_tokens} tokens")
+    if fast_seconds and strong_seconds and strong_seconds > LATENCY_TOLERANCE * fast_seconds:
+        return Route(fast, task, tokens, score,
+                     f"borderline size, {strong} currently {strong_seconds / fast_seconds:.1f}x slower")
+    return Route(strong, task, tokens, score, "borderline size")
+
+def resolve_model(model_name, prompt, template=None, task=None, on_route: Optional[Callable[[str], None]] = None):
+    """
+    model_name unless it is AUTO, in which case the routed model. The task is
+    taken from the prompt template when not given.
+
+    Args:
+        on_route (callable): Called with a description of the routing decision, e.g. st.caption
+    """
+    if model_name != AUTO:
+        return model_name
+    decision = route(task or TEMPLATE_TASKS.get(template, "qa"), prompt, template=template or "")
+    if on_route:
+        on_route(decision.describe())
+    return decision.model
+
+def describe_latency(stats: Optional[LatencyStats] = None):
+    """ one line per model seen so far, for the UI """
+    stats = stats or get_latency_stats()
+    return "\n\n".join(
+        f"{name}: {model.seconds:.1f}s per call, {model.seconds_per_1k_tokens:.2f}s per 1k tokens ({model.calls} calls)"
+        for name, model in sorted(stats.snapshot().items())
+    )
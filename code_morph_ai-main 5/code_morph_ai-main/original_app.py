@@ -1,27 +1,60 @@
 from dotenv import load_dotenv
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import ChatOpenAI
-from util import extract_code, get_code_prompt
+from code_retrieval import DEFAULT_TOKEN_BUDGET, build_code_prompt
+from snapshot import get_codebase
+from response_cache import cached_response
+from parallel import DEFAULT_MAX_WORKERS, map_in_containers
+from design_mapreduce import DESIGN_MODES, show_design
+from scan_rules import skipped_reasons
+from telemetry import session_totals, start_session, timed_stream
+from rate_limiter import describe_backlog, get_rate_limiter, set_wait_listener, toast_wait
+from llm_client import get_client
+from continuation import TRUNCATED
 import streamlit as st
 from prompt_templates import code_explain_prompt, java_code_gen_prompt, oo_design_prompt
 from langchain_core.prompts import PromptTemplate
+from langchain_core.rate_limiters import BaseRateLimiter
 import os
 
 _ = load_dotenv()
 
+# Requests queued by the rate limiter show a toast on the page
+set_wait_listener(toast_wait)
+
+# LLM telemetry is totalled per browser session
+start_session(st.session_state)
+
 code_dir_name = "./code"
 
-llm_anthropic = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.1)
+class SharedRateLimiter(BaseRateLimiter):
+    """ langchain adapter for a process-wide rate_limiter queue (requests only, the token count isn't known up front) """
+
+    def __init__(self, name):
+        self.name = name
+
+    def acquire(self, *, blocking=True):
+        get_rate_limiter(self.name).acquire()
+        return True
 
-llm_openai = ChatOpenAI(model="gpt-4o",temperature=0.1)
+    async def aacquire(self, *, blocking=True):
+        return self.acquire(blocking=blocking)
 
-llm_openai_mini = ChatOpenAI(model="gpt-4o-mini", temperature=0.1)
+# Anthropic has its own HTTP client, so its calls go through the limiter via langchain
+llm_anthropic = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.1,
+                              rate_limiter=SharedRateLimiter("claude-3-5-sonnet-20241022"))
+
+# The OpenAI models share the pooled HTTP client from llm_client
+llm_openai = ChatOpenAI(model="gpt-4o",temperature=0.1, http_client=get_client().http)
+
+llm_openai_mini = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, http_client=get_client().http)
 
 # llm_openai_o1 = ChatOpenAI(model="o1-preview", temperature=1.0)
 
-llm_openai_o1_mini = ChatOpenAI(model="o1-mini", temperature=1.0)
+# o1 models don't stream (see llm_client.MODEL_SETTINGS); the chain's stream() makes one regular call
+llm_openai_o1_mini = ChatOpenAI(model="o1-mini", temperature=1.0, http_client=get_client().http, disable_streaming=True)
 
-code_index, code_text, file_content = extract_code(code_dir_name)
+codebase = get_codebase(code_dir_name)
 
 llm=None
 
@@ -76,48 +109,87 @@ with st.sidebar:
          "/generate_java_code")
     )
 
+    max_workers = st.slider("Concurrent LLM calls", min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS)
+    bypass_cache = st.toggle("Bypass response cache", False,
+                             help="Call the model even if an identical request was answered before")
+    if describe_backlog():
+        st.caption(describe_backlog())
+    telemetry_panel = st.empty()  # filled with the session's LLM totals once this run's calls are done
+
+def finish_reason(message):
+    """ why the model stopped, from a langchain message or stream chunk (OpenAI and Anthropic metadata) """
+    metadata = getattr(message, "response_metadata", None) or {}
+    return metadata.get("finish_reason") or metadata.get("stop_reason")
+
+def invoke(exec_llm, prompt):
+    """ (response, complete) of one call, complete being False if the model hit its output limit """
+    message = exec_llm.invoke(prompt)
+    return message.content, finish_reason(message) not in TRUNCATED
+
+def write_stream(chunks, model_name, prompt):
+    """ stream langchain chunks into the page; (response, complete) like invoke() """
+    last_reason = [None]
+
+    def tracked():
+        for chunk in chunks:
+            last_reason[0] = finish_reason(chunk) or last_reason[0]
+            yield chunk
+    response = st.write_stream(timed_stream(tracked(), model_name, prompt))
+    return response, last_reason[0] not in TRUNCATED
+
 def execute(exec_llm, exec_prompt, code):
     final_prompt = PromptTemplate.from_template(exec_prompt)
     exec_chain = final_prompt | exec_llm# chain = prompt | llm
-    final_response = exec_chain.invoke(
-        {
-            "PLSQL_CODE": code,
-        }
+    model_name = getattr(exec_llm, "model_name", None) or exec_llm.model
+    formatted_prompt = final_prompt.format(PLSQL_CODE=code)
+    return cached_response(
+        lambda: write_stream(exec_chain.stream({"PLSQL_CODE": code}), model_name, formatted_prompt),
+        model_name, formatted_prompt, exec_prompt,
+        {"temperature": exec_llm.temperature, "max_tokens": getattr(exec_llm, "max_tokens", None)},
+        bypass=bypass_cache,
     )
-    return final_response.content
 
 if add_radio== "/show_code":
     st.title("/show_code")
     st.write("Here is the index of the files in the codebase:")
-    st.write(code_index)
+    st.write(codebase.index)
+    if codebase.skipped:
+        st.write("Skipped files:", skipped_reasons(codebase.skipped))
     st.write("Here is the entire codebase:")
-    st.code(code_text)
+    st.code(codebase.text)
 
 elif add_radio == "/command_interface":
     st.title("/command_interface")
     question = st.text_input("Enter your question here:")
+    context_mode = st.radio("Context", ("retrieval", "full"), horizontal=True)
+    token_budget = st.number_input("Prompt token budget", min_value=1000, max_value=200000,
+                                   value=DEFAULT_TOKEN_BUDGET, step=1000)
     if st.button("/get_answer"):
-        prompt = get_code_prompt(question, code_index, code_text)
-        response = llm.invoke(prompt)
-        st.write(response.content)
+        prompt = build_code_prompt(question, codebase, token_budget, context_mode)
+        st.write_stream(timed_stream(llm.stream(prompt), getattr(llm, "model_name", None) or llm.model, prompt))
 
 elif add_radio == "/explain":
     st.title("/explain")
-    for file in file_content:
-        print("content of the file is: ", file)
-        response = execute(llm, code_explain_prompt, file)
-        st.write(response)
+    map_in_containers(
+        lambda code_file: execute(llm, code_explain_prompt, code_file.render()),
+        codebase.files, max_workers=max_workers,
+    )
 
 elif add_radio == "/generate_oo_design":
     st.title("/generate_oo_design")
-    response = execute(llm, oo_design_prompt, code_text)
-    st.write(response)
+    design_mode = st.radio("Design mode", DESIGN_MODES, horizontal=True)
+    response = show_design(
+        design_mode, codebase.files, lambda: execute(llm, oo_design_prompt, codebase.text),
+        lambda prompt: invoke(llm, prompt),
+        select_llm, max_workers,
+    )
 
 elif add_radio == "/generate_java_code":
     st.title("/generate_java_code")
-    for file in file_content:
-        response = execute(llm, java_code_gen_prompt, file)
-        st.write(response)
-
-
+    map_in_containers(
+        lambda code_file: execute(llm, java_code_gen_prompt, code_file.render()),
+        codebase.files, max_workers=max_workers,
+    )
 
+# Session totals, including the calls made during this run
+telemetry_panel.caption(session_totals().describe())
@@ -0,0 +1,81 @@
+import os
+from typing import Optional, Sequence
+
+from tokenizer import get_encoding_for_model
+
+# How far back into the base (and forward into the continuation) an overlap is looked for
+OVERLAP_WINDOW_CHARS = int(os.environ.get("MERGE_OVERLAP_WINDOW", 8192))
+OVERLAP_WINDOW_TOKENS = OVERLAP_WINDOW_CHARS // 4
+
+# Shorter overlaps are treated as coincidence ("}" followed by "}") rather than repetition
+MIN_OVERLAP_CHARS = 16
+MIN_OVERLAP_TOKENS = 4
+
+# "chars" or "tokens" (tiktoken ids; falls back to chars if the encoding can't be loaded)
+OVERLAP_MODE = os.environ.get("MERGE_OVERLAP_MODE", "chars")
+
+def prefix_function(pattern: Sequence) -> list:
+    """ KMP failure function: longest proper prefix of pattern[:i + 1] that is also its suffix """
+    failure = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = failure[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        failure[i] = k
+    return failure
+
+def overlap_length(left: Sequence, right: Sequence) -> int:
+    """
+    Length of the longest suffix of left that is also a prefix of right, in
+    O(len(left) + len(right)): KMP matching of right over left, where the match
+    state left after the last element is the overlap. Works on strings and token id lists.
+    """
+    if not left or not right:
+        return 0
+    failure = prefix_function(right)
+    k = 0
+    for item in left:
+        while k and (k == len(right) or item != right[k]):
+            k = failure[k - 1]
+        if item == right[k]:
+            k += 1
+    return k
+
+def _token_overlap_chars(base, continuation, model_name, window_tokens):
+    """ overlap measured on token ids, converted back to characters of the continuation; None without an encoding """
+    encoding = get_encoding_for_model(model_name)
+    if encoding is None:
+        return None
+    base_ids = encoding.encode(base, disallowed_special=())[-window_tokens:]
+    continuation_ids = encoding.encode(continuation, disallowed_special=())[:window_tokens]
+    tokens = overlap_length(base_ids, continuation_ids)
+    if tokens < MIN_OVERLAP_TOKENS:
+        return 0
+    repeated = encoding.decode(continuation_ids[:tokens])
+    # Token boundaries can differ where the two texts meet; only trust an exact text match
+    return len(repeated) if base.endswith(repeated) and continuation.startswith(repeated) else 0
+
+def find_merge_point(base, continuation, window=None, mode=None, model_name="gpt-4o-mini") -> Optional[int]:
+    """
+    Index in base where continuation should be joined, i.e. where the part of base
+    that continuation repeats begins; None if they don't overlap.
+
+    Args:
+        base (str): Text so far
+        continuation (str): Next part, possibly starting with a repeat of base's end
+        window (int): Characters (or tokens in "tokens" mode) searched at the seam
+        mode (str): "chars" or "tokens", defaults to OVERLAP_MODE
+        model_name (str): Model whose tokenizer is used in "tokens" mode
+    """
+    mode = mode or OVERLAP_MODE
+    overlap = None
+    if mode == "tokens":
+        overlap = _token_overlap_chars(base, continuation, model_name, window or OVERLAP_WINDOW_TOKENS)
+    if overlap is None:
+        window = window if window and mode != "tokens" else OVERLAP_WINDOW_CHARS
+        overlap = overlap_length(base[-window:], continuation[:window])
+        if overlap < MIN_OVERLAP_CHARS:
+            overlap = 0
+    return len(base) - overlap if overlap else None
@@ -0,0 +1,79 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Concurrent LLM calls per page unless the caller picks a limit
+DEFAULT_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", 4))
+
+def _with_script_context(fn):
+    """
+    Wrap fn so it runs with the calling Streamlit script context, letting st.* calls
+    made from worker threads (errors, warnings, progress) reach the page, and with
+    the caller's context variables (e.g. the telemetry session).
+    """
+    variables = contextvars.copy_context()
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        ctx = None
+
+    def run(*args, **kwargs):
+        if ctx is not None:
+            add_script_run_ctx(ctx=ctx)
+        return variables.copy().run(fn, *args, **kwargs)
+    return run
+
+def map_parallel(fn, items, max_workers=None, on_done=None):
+    """
+    Call fn(item) for every item on a thread pool and return the results in input order.
+
+    Args:
+        fn (callable): Function applied to each item
+        items (list): Inputs
+        max_workers (int): Concurrency limit, defaults to DEFAULT_MAX_WORKERS
+        on_done (callable): Called as on_done(index, result) on the calling thread
+            as each item completes, in completion order
+
+    Returns:
+        list: fn(item) for each item, in the order of items
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+    task = _with_script_context(fn)
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_MAX_WORKERS) as pool:
+        futures = {pool.submit(task, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_done:
+                on_done(i, results[i])
+    return results
+
+def map_in_containers(fn, items, render=None, max_workers=None):
+    """
+    Run fn(item) concurrently with one Streamlit container per item, created up front
+    so results display in item order. Each worker writes into its own container (a
+    streamed response appears there as it is generated), and render(item, result),
+    if given, adds to it as soon as that item completes.
+
+    Returns:
+        list: fn(item) for each item, in the order of items
+    """
+    import streamlit as st
+
+    items = list(items)
+    containers = [st.container() for _ in items]
+
+    def task(indexed_item):
+        i, item = indexed_item
+        with containers[i]:
+            return fn(item)
+
+    def on_done(i, result):
+        with containers[i]:
+            render(items[i], result)
+
+    return map_parallel(task, list(enumerate(items)), max_workers, on_done if render else None)
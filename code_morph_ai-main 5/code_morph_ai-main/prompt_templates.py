@@ -226,6 +226,99 @@ Please also output the word *END* at the end of your response to indicate comple
 
 """
 
+oo_digest_prompt = """
+
+You are helping to modernize a legacy PLSQL codebase to Java and Spring Boot microservices. The codebase is too large
+to analyze at once, so each file is first summarized into a compact design digest. Later steps merge the digests into
+a Domain-Driven Design.
+
+Here is one file of the PLSQL codebase:
+
+<plsql_code>
+    {PLSQL_CODE}
+</plsql_code>
+
+Write a compact design digest of this file using these headings, with short bullet points:
+
+1. Module: file or package name and its purpose in one sentence.
+2. Data: tables, records and types used, with key columns and relationships.
+3. Operations: each procedure or function with its inputs, outputs and the business action it performs.
+4. Business rules: validations, state transitions and calculations.
+5. Dependencies: other packages, procedures and tables it calls or touches.
+6. Candidate domain: the bounded context this file most likely belongs to.
+
+Do not reproduce the code. Keep the digest under 400 words.
+
+"""
+
+oo_digest_merge_prompt = """
+
+You are helping to modernize a legacy PLSQL codebase to Java and Spring Boot microservices. Below are design digests
+of several parts of the codebase, each produced from the PLSQL source.
+
+<design_digests>
+    {PLSQL_CODE}
+</design_digests>
+
+Merge them into a single design digest with the same headings (Module, Data, Operations, Business rules,
+Dependencies, Candidate domain). Group related modules under their candidate domains, remove duplication, keep every
+distinct operation, business rule and dependency, and note the relationships between modules.
+
+Keep the merged digest under 800 words.
+
+"""
+
+oo_design_from_digest_prompt = """
+
+You are tasked with modernizing a complex legacy PLSQL codebase to modern Java and Spring Boot microservices. Your goal 
+is to generate an object-oriented design from the PLSQL code using Domain-Driven Design (DDD) principles to break the 
+design into microservices. You will also create a Mermaid component diagram to visualize the architecture.
+
+The codebase is large, so instead of the source you are given a design digest summarizing every module of it:
+
+<design_digest>
+    {PLSQL_CODE}
+</design_digest>
+
+Follow these steps to complete the task:
+
+1. Analyze the design digest:
+   a. Identify the main functionalities and business logic in the code.
+   b. Determine the data structures and their relationships.
+   c. Recognize any existing modules or logical separations in the code.
+
+2. Apply Domain-Driven Design (DDD) principles:
+   a. Identify the core domain and subdomains based on the business logic.
+   b. Define bounded contexts for each subdomain.
+   c. Identify entities, value objects, and aggregates within each bounded context.
+   d. Determine the domain events and commands.
+
+3. Design microservices:
+   a. Map each bounded context to a potential microservice.
+   b. Ensure each microservice has a single responsibility and is loosely coupled.
+   c. Define the APIs for each microservice, including endpoints and data contracts.
+   d. Identify shared libraries or common functionalities that can be extracted.
+
+4. Create a Mermaid component diagram:
+   a. Represent each microservice as a component.
+   b. Show the relationships and dependencies between microservices.
+   c. Include external systems or databases if applicable.
+   d. Use appropriate Mermaid syntax for component diagrams.
+
+5. Provide your output in the following format:
+   a. Start with a brief overview of the identified domains and subdomains.
+   b. List each microservice with its responsibilities and main entities.
+   c. Describe the APIs for each microservice.
+   d. Include the Mermaid component diagram code.
+   e. Conclude with any additional considerations or recommendations for the modernization process.
+
+Enclose your entire response within <answer> tags. Use appropriate subheadings to organize your response clearly. 
+Present the Mermaid diagram code within <mermaid> tags.
+
+Please also output the word *END* at the end of your response to indicate completion.
+
+"""
+
 ms_prompt="""
  
 Convert my existing Spring Boot project into a microservices architecture by creating a separate Java Spring microservice for each entity class in the project. Each microservice should include:
@@ -0,0 +1,190 @@
+"""
+Process-wide rate limiting for the model deployments.
+
+Every request through the shared httpx client (llm_client, and the langchain
+models that reuse its connection pool) passes limit_request, which waits on a token
+bucket for requests per minute (LLM_RPM) and one for estimated tokens per
+minute (LLM_TPM) of its deployment. Waiters are served strictly in arrival order.
+A limit of 0 turns that bucket off.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from tokenizer import approx_tokens
+
+RPM_LIMIT = int(os.environ.get("LLM_RPM", 0))
+TPM_LIMIT = int(os.environ.get("LLM_TPM", 0))
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, holding at most per_minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """ seconds until amount is available (amounts above capacity wait for a full bucket) """
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets with a FIFO queue:
+    a request waits until everything queued before it has been admitted and
+    both buckets hold enough for it.
+    """
+
+    def __init__(self, rpm=RPM_LIMIT, tpm=TPM_LIMIT, name=""):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._condition = threading.Condition()
+        self._queue = deque()
+
+    def _wait_time(self, tokens, now):
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def acquire(self, tokens=0) -> float:
+        """
+        Block until this request may be sent.
+
+        Args:
+            tokens (int): Estimated tokens of the request (prompt plus requested output)
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if not self.requests and not self.tokens:
+            return 0.0
+        ticket = object()
+        start = time.monotonic()
+        notified = False
+        with self._condition:
+            self._queue.append(ticket)
+        try:
+            while True:
+                # the listener (a Streamlit toast) runs after the lock is released
+                notice = None
+                with self._condition:
+                    wait = None
+                    if self._queue[0] is ticket:
+                        wait = self._wait_time(tokens, time.monotonic())
+                        if wait <= 0:
+                            if self.requests:
+                                self.requests.take(1)
+                            if self.tokens:
+                                self.tokens.take(tokens)
+                            return time.monotonic() - start
+                    if not notified and _wait_listener:
+                        notified = True
+                        notice = (self._queue.index(ticket), len(self._queue), wait)
+                    else:
+                        self._condition.wait(timeout=wait)
+                if notice:
+                    _wait_listener(self.name, *notice)
+        finally:
+            with self._condition:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+    def backlog(self):
+        """ snapshot of the queue and what the buckets hold right now """
+        with self._condition:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    bucket._refill(now)
+            return {
+                "name": self.name,
+                "waiting": len(self._queue),
+                "requests_available": int(self.requests.level) if self.requests else None,
+                "tokens_available": int(self.tokens.level) if self.tokens else None,
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_wait_listener: Optional[Callable] = None
+
+def get_rate_limiter(name="default") -> RateLimiter:
+    """ the limiter for one deployment (or model), created with the LLM_RPM/LLM_TPM limits """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(name, RateLimiter(name=name))
+    return limiter
+
+def set_wait_listener(listener: Optional[Callable]):
+    """
+    Call listener(name, position, queued, wait_seconds) whenever a request has to
+    wait, on the waiting thread (wait_seconds is None while requests ahead of it
+    are still queued).
+    """
+    global _wait_listener
+    _wait_listener = listener
+
+def toast_wait(name, position, queued, wait):
+    """ wait listener that tells the Streamlit page a request is queued """
+    import streamlit as st
+
+    ahead = f"{position} request(s) ahead" if wait is None else f"about {wait:.0f}s"
+    st.toast(f"Rate limit on {name}: waiting, {ahead} ({queued} queued)")
+
+def backlog():
+    return [limiter.backlog() for limiter in list(_limiters.values())]
+
+def describe_backlog():
+    """ one-line summary for the UI, empty when no limits are configured """
+    if not RPM_LIMIT and not TPM_LIMIT:
+        return ""
+    waiting = sum(entry["waiting"] for entry in backlog())
+    limits = ", ".join(part for part in (f"{RPM_LIMIT} RPM" if RPM_LIMIT else "", f"{TPM_LIMIT} TPM" if TPM_LIMIT else "") if part)
+    return f"Rate limit {limits} per deployment; {waiting} request(s) waiting"
+
+def estimate_request_tokens(body: dict) -> int:
+    """
+    Tokens a chat or embeddings request counts against TPM: the prompt estimate
+    plus the requested max output, the same estimate Azure OpenAI applies.
+    """
+    if "messages" in body:
+        prompt = "".join(str(message.get("content") or "") for message in body["messages"])
+    else:
+        prompt = json.dumps(body.get("input", ""))
+    return approx_tokens(prompt) + int(body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+
+def limiter_key(url_path, body: dict) -> str:
+    """ the Azure deployment in /openai/deployments/<name>/..., else the request's model """
+    parts = url_path.strip("/").split("/")
+    if "deployments" in parts[:-1]:
+        return parts[parts.index("deployments") + 1]
+    return body.get("model") or url_path
+
+def limit_request(request):
+    """ httpx request event hook: wait for the deployment's RPM/TPM budget before sending """
+    if not RPM_LIMIT and not TPM_LIMIT:
+        return
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    get_rate_limiter(limiter_key(request.url.path, body)).acquire(estimate_request_tokens(body))
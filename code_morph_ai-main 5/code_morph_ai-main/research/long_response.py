@@ -1,9 +1,9 @@
+# Run from the project root: python -m research.long_response
 import warnings
 from dotenv import load_dotenv
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
 from langchain_openai import ChatOpenAI
 import tiktoken
+from continuation import continuation_prompt
 
 warnings.filterwarnings('ignore')
 _ = load_dotenv()
@@ -20,16 +20,16 @@ llm = ChatOpenAI(model_name=model_name,
 query = ("Whats AdS/CFT correspondence? Explain in no less than 500 tokens and when the generation is complete, "
          "output the word *END* as well.")
 
-memory = ConversationBufferMemory(return_messages=True)
-conversation = ConversationChain(llm=llm, memory=memory)
-
-response = conversation.predict(input=query)
+response = llm.invoke(query).content
 
 full_response = response
 
+# Each round sends the query, an outline and the tail of the answer rather than the
+# whole conversation, so the input size stays flat
 while "*END*" not in response:
-    continuation_prompt = "Continue from where you left off"
-    continuation_response = conversation.predict(input=continuation_prompt)
+    continuation = llm.invoke(continuation_prompt(query, full_response))
+    print("continuation input tokens", continuation.usage_metadata["input_tokens"])
+    continuation_response = continuation.content
     full_response += " " + continuation_response
     response = continuation_response
 
@@ -1,44 +1,39 @@
+# Run from the project root: python -m research.long_response_v2
 import warnings
 from dotenv import load_dotenv
-from langchain.chains.conversation.base import ConversationChain
-from langchain.memory import ConversationBufferMemory
 from langchain_openai import ChatOpenAI
+from continuation import continuation_prompt
 
 warnings.filterwarnings('ignore')
 _ = load_dotenv()
 
-# Initialize the chat model and memory
+# Initialize the chat model
 chat = ChatOpenAI(model_name="gpt-4o-2024-08-06", temperature=0, max_tokens=500)
 
-memory = ConversationBufferMemory(return_messages=True)
-conversation = ConversationChain(llm=chat, memory=memory)
-
 # Initial prompt
 user_input = ("Explain the theory of general relativity in detail, including its historical development, "
               "mathematical formulations, experimental confirmations, and implications for modern physics.")
 
 # Generate the initial response
-response = conversation.predict(input=user_input)
+response = chat.invoke(user_input)
 
 # Initialize the full response
-full_response = response
+full_response = response.content
 
 # Check if continuation is needed
-max_tokens = 500
-needs_continuation = len(response.split()) >= max_tokens - 50
+needs_continuation = response.response_metadata.get("finish_reason") == "length"
 
 while needs_continuation:
-    # Prompt the model to continue
-    continuation_prompt = "Continue from where you left off"
-
-    # Generate the continuation response
-    continuation_response = conversation.predict(input=continuation_prompt)
+    # Prompt the model to continue with the request, an outline and the tail of the
+    # answer so far (not the whole conversation), so each round's input stays flat
+    continuation = chat.invoke(continuation_prompt(user_input, full_response))
+    print("continuation input tokens", continuation.usage_metadata["input_tokens"])
 
     # Append the continuation to the full response
-    full_response += " " + continuation_response
+    full_response += " " + continuation.content
 
     # Check again if the continuation is also truncated
-    needs_continuation = len(continuation_response.split()) >= max_tokens - 50
+    needs_continuation = continuation.response_metadata.get("finish_reason") == "length"
 
 # Output the full response
 print("Full Response:\n", full_response)
\ No newline at end of file
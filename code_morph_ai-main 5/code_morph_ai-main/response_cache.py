@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import telemetry
+from llm_client import sampling_params
+from tokenizer import approx_tokens
+
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3")
+
+# Total size of cached responses; least recently used entries are evicted above it
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def template_version(template):
+    """ short hash of a prompt template, so editing the template invalidates its entries """
+    return _sha256(template)[:12] if template else ""
+
+def normalize_prompt(prompt):
+    """ prompt without trailing spaces, repeated blank lines or surrounding whitespace; indentation is kept """
+    lines = [line.rstrip() for line in prompt.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+def cache_key(model_name, template, prompt, sampling):
+    return _sha256("\0".join([
+        model_name, template_version(template), _sha256(normalize_prompt(prompt)), json.dumps(sampling, sort_keys=True),
+    ]))
+
+class ResponseCache:
+    """
+    SQLite-backed LLM response cache with LRU eviction, shared by every session
+    and surviving restarts.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, model_name, response):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, len(response.encode()), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+def cached_response(llm_fn, model_name, prompt, template="", sampling=None, bypass=False, cache=None, on_hit=None):
+    """
+    Return the cached response for this request, calling llm_fn() on a miss.
+
+    Args:
+        llm_fn (callable): llm_fn() -> (response text or None on failure, complete); a
+            response that is still cut off after its continuations is returned but not cached
+        model_name (str): Model name
+        prompt (str): The formatted prompt sent to the model
+        template (str): Prompt template the prompt was built from, part of the key
+        sampling (dict): The sampling fields the request actually sends (temperature,
+            max_tokens or max_completion_tokens, see llm_client.sampling_params), part of
+            the key; defaults to the model's settings
+        bypass (bool): Skip the lookup and call the model; the fresh response replaces the entry
+        cache (ResponseCache): Defaults to the process-wide cache
+        on_hit (callable): Called with the cached response on a hit, e.g. to display it
+            where a fresh response would have been streamed
+
+    Returns:
+        str: The response, or None if the call failed (failures and incomplete responses are not cached)
+    """
+    cache = cache or get_response_cache()
+    sampling = sampling_params(model_name) if sampling is None else sampling
+    key = cache_key(model_name, template, prompt, sampling)
+    if not bypass:
+        cached = cache.get(key)
+        if cached is not None:
+            telemetry.record(telemetry.CallRecord(model_name, "cache_hit", approx_tokens(prompt), approx_tokens(cached)))
+            if on_hit:
+                on_hit(cached)
+            return cached
+    response, complete = llm_fn()
+    if response and complete:
+        cache.put(key, model_name, response)
+    return response
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
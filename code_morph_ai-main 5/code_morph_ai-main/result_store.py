@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+# Results kept in memory; least recently used ones are dropped above it
+RESULT_STORE_MAX_ENTRIES = int(os.environ.get("RESULT_STORE_MAX_ENTRIES", 2000))
+
+def content_hash(text):
+    """ key for a file (or whole codebase) by content, so renames and re-uploads of the same code reuse results """
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+class ResultStore:
+    """
+    Per-process store of pipeline results keyed by (content hash, stage, model).
+    Each result is computed once: concurrent requests for a key that is being
+    computed wait for that computation instead of starting another.
+    """
+
+    def __init__(self, max_entries=RESULT_STORE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[tuple, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        """ the finished result for key, None if it is missing or still being computed """
+        with self._lock:
+            future = self._results.get(key)
+        if future is None or not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def get_or_compute(self, key, compute: Callable[[], Optional[str]], refresh=False) -> Optional[str]:
+        """
+        The result for key, calling compute() if there is none. A None result or an
+        exception isn't stored, so the next request tries again.
+
+        Args:
+            refresh (bool): Recompute even if a finished result exists
+        """
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None or (refresh and future.done())
+            if owner:
+                future = Future()
+                self._results[key] = future
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+            self._results.move_to_end(key)
+        if not owner:
+            return future.result()
+        try:
+            result = compute()
+        except Exception as e:
+            self._discard(key, future)
+            future.set_exception(e)
+            raise
+        if result is None:
+            self._discard(key, future)
+        future.set_result(result)
+        return result
+
+    def _discard(self, key, future):
+        with self._lock:
+            if self._results.get(key) is future:
+                del self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_result_store() -> ResultStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore()
+    return _store
@@ -0,0 +1,183 @@
+import fnmatch
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Build outputs, vendored libraries, logs, tooling folders and secrets skipped by default (gitignore syntax).
+# The ignore files themselves are skipped on purpose: they are read as scan rules
+# (build_matcher), not sent to the model as code.
+DEFAULT_IGNORE_PATTERNS = (
+    ".env",
+    ".gitignore",
+    ".gitattributes",
+    ".codemorphignore",
+    ".git/",
+    ".svn/",
+    ".hg/",
+    ".idea/",
+    ".vscode/",
+    "__pycache__/",
+    ".venv/",
+    "venv/",
+    "node_modules/",
+    "bower_components/",
+    "vendor/",
+    "third_party/",
+    "target/",
+    "build/",
+    "dist/",
+    "chroma_db/",
+    "*.log",
+    "*.tmp",
+    "*.class",
+    "*.pyc",
+    "*.map",
+    "*.min.js",
+    "*.min.css",
+    "*.lock",
+    "package-lock.json",
+)
+
+# Extra ignore file read from the repository root, same syntax as .gitignore
+CUSTOM_IGNORE_FILE = ".codemorphignore"
+
+# Header comments that generators put at the top of a file; only the first
+# GENERATED_HEADER_LINES lines are checked, so prose like "-- id generated by
+# sequence" in real code doesn't match
+GENERATED_MARKERS = re.compile(
+    r"^\s*(?://|#|--|/\*|\*|<!--)\s*(?:@generated\b|<auto-generated\b|Code generated .* DO NOT EDIT)",
+    re.MULTILINE,
+)
+GENERATED_HEADER_LINES = 5
+GENERATED_NAME_PATTERNS = ("*_pb2.py", "*.generated.*", "*.g.cs", "*.designer.cs", "*.pb.go")
+
+@dataclass(frozen=True)
+class ScanRules:
+    """What the repository scanner reads; frozen so it can be part of cache keys."""
+    ignore_patterns: Tuple[str, ...] = DEFAULT_IGNORE_PATTERNS
+    use_gitignore: bool = True
+    max_file_bytes: int = 512 * 1024
+    max_total_bytes: int = 16 * 1024 * 1024
+    skip_generated: bool = True
+
+    @classmethod
+    def from_env(cls):
+        """ defaults, overridable with SCAN_IGNORE (comma separated), SCAN_MAX_FILE_BYTES, SCAN_MAX_TOTAL_BYTES """
+        extra = tuple(p.strip() for p in os.environ.get("SCAN_IGNORE", "").split(",") if p.strip())
+        return cls(
+            ignore_patterns=DEFAULT_IGNORE_PATTERNS + extra,
+            max_file_bytes=int(os.environ.get("SCAN_MAX_FILE_BYTES", cls.max_file_bytes)),
+            max_total_bytes=int(os.environ.get("SCAN_MAX_TOTAL_BYTES", cls.max_total_bytes)),
+        )
+
+def _pattern_to_regex(pattern):
+    """ translate one gitignore glob into a regex over '/'-separated relative paths """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            regex += pattern[i:end + 1].replace("[!", "[^")
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(("^" if anchored else "^(?:.*/)?") + regex + "$")
+
+class IgnoreMatcher:
+    """
+    Gitignore-style matcher: patterns are evaluated in order and the last match wins,
+    '!' negates, a trailing '/' matches directories only and patterns containing a
+    '/' are anchored to the directory of the file that declared them.
+    """
+
+    def __init__(self):
+        self._rules = []  # (base_dir, regex, negate, dir_only)
+
+    def add_patterns(self, patterns, base_dir=""):
+        for line in patterns:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line:
+                self._rules.append((base_dir, _pattern_to_regex(line), negate, dir_only))
+
+    def add_file(self, ignore_file, base_dir=""):
+        try:
+            with open(ignore_file, "r") as f:
+                self.add_patterns(f.readlines(), base_dir)
+        except OSError:
+            pass
+
+    def is_ignored(self, relative_path, is_dir=False):
+        relative_path = relative_path.replace(os.sep, "/")
+        ignored = False
+        for base_dir, regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if base_dir:
+                if not relative_path.startswith(base_dir + "/"):
+                    continue
+                candidate = relative_path[len(base_dir) + 1:]
+            else:
+                candidate = relative_path
+            if regex.match(candidate):
+                ignored = not negate
+        return ignored
+
+def build_matcher(repo_dir, rules: ScanRules) -> IgnoreMatcher:
+    """ matcher with the configured patterns plus the repository's root ignore files """
+    matcher = IgnoreMatcher()
+    matcher.add_patterns(rules.ignore_patterns)
+    matcher.add_file(os.path.join(repo_dir, CUSTOM_IGNORE_FILE))
+    if rules.use_gitignore:
+        matcher.add_file(os.path.join(repo_dir, ".gitignore"))
+    return matcher
+
+def looks_generated(relative_path, text) -> Optional[str]:
+    """ return why a file looks generated, or None """
+    file_name = os.path.basename(relative_path)
+    if any(fnmatch.fnmatch(file_name, pattern) for pattern in GENERATED_NAME_PATTERNS):
+        return "generated file name"
+    if GENERATED_MARKERS.search("\n".join(text[:2048].splitlines()[:GENERATED_HEADER_LINES])):
+        return "generated header"
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return None
+    if len(text) > 20_000 and len(text) / len(lines) > 500:
+        return "minified"
+
+    # Huge data dumps: scripts that are almost only INSERT statements
+    if len(lines) > 200:
+        inserts = sum(1 for line in lines if line.lstrip().upper().startswith("INSERT INTO"))
+        if inserts / len(lines) > 0.9:
+            return "generated data script"
+    return None
+
+def skipped_reasons(skipped: List[tuple]):
+    """ count of skipped files per reason, for display """
+    counts = {}
+    for _, reason in skipped:
+        counts[reason] = counts.get(reason, 0) + 1
+    return counts
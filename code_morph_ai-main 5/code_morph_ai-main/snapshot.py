@@ -0,0 +1,80 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from util import DEFAULT_SCAN_RULES, load_codebase, scan_progress_callback, walk_batches
+
+# Number of distinct codebase snapshots kept in memory
+MAX_SNAPSHOTS = 8
+
+def fingerprint_directory(repo_dir, rules=DEFAULT_SCAN_RULES):
+    """
+    Hash of every scanned file's relative path, size and mtime under repo_dir, plus
+    the ignore files that decide what is scanned. Only stats files, so it is cheap
+    enough to run on every Streamlit rerun; ignored paths (build output, .git, ...)
+    don't affect it.
+    """
+    digest = hashlib.sha256()
+    rule_files = []
+    for file_paths in walk_batches(repo_dir, rules, rule_files=rule_files):
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            relative_path = os.path.relpath(file_path, repo_dir)
+            digest.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    for rule_file in rule_files:
+        try:
+            stat = os.stat(rule_file)
+        except OSError:
+            continue
+        relative_path = os.path.relpath(rule_file, repo_dir)
+        digest.update(f"rules:{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+@st.cache_resource
+def _snapshot_store():
+    """ process-wide snapshot store, shared by every session """
+    return {"lock": threading.Lock(), "snapshots": OrderedDict(), "scans": {}}
+
+def get_codebase(repo_dir, rules=DEFAULT_SCAN_RULES):
+    """
+    Return the CodeBase for repo_dir, scanning only when the directory fingerprint
+    changed since the last scan. Snapshots are shared across sessions, so widget
+    clicks and other sessions reuse the same scan of an unchanged codebase.
+
+    The store lock only guards lookups and inserts; a scan holds a lock of its own
+    key, so sessions asking for the same snapshot wait for one scan while sessions
+    reading other directories are not blocked.
+    """
+    key = (os.path.abspath(repo_dir), rules, fingerprint_directory(repo_dir, rules))
+    store = _snapshot_store()
+    with store["lock"]:
+        codebase = store["snapshots"].get(key)
+        if codebase is not None:
+            store["snapshots"].move_to_end(key)
+            return codebase
+        scan_lock = store["scans"].setdefault(key, threading.Lock())
+
+    with scan_lock:
+        with store["lock"]:
+            codebase = store["snapshots"].get(key)  # scanned by another session while we waited
+        if codebase is not None:
+            return codebase
+
+        scan_progress = scan_progress_callback(st)
+        try:
+            codebase = load_codebase(repo_dir, progress=scan_progress, rules=rules)
+            with store["lock"]:
+                store["snapshots"][key] = codebase
+                while len(store["snapshots"]) > MAX_SNAPSHOTS:
+                    store["snapshots"].popitem(last=False)
+        finally:
+            scan_progress.bar.empty()
+            with store["lock"]:
+                store["scans"].pop(key, None)
+        return codebase
@@ -0,0 +1,170 @@
+"""
+Per-call LLM telemetry: tokens, time to first token, latency, continuation rounds
+and cache hits.
+
+Every record is appended to TELEMETRY_PATH (JSON lines, or SQLite if the path ends
+in .sqlite3/.db) for offline analysis, and added to in-memory totals for the
+Streamlit session that made it. The session is a context variable set once per
+script run with start_session(); parallel.map_parallel carries it to its workers.
+"""
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, Iterable, Iterator, Optional
+
+from tokenizer import approx_tokens
+
+# Where records are written; empty to keep them in memory only
+TELEMETRY_PATH = os.environ.get("TELEMETRY_PATH", ".cache/telemetry.jsonl")
+
+SESSION: contextvars.ContextVar[str] = contextvars.ContextVar("telemetry_session", default="")
+
+@dataclass
+class CallRecord:
+    """One model call (or a response served from the cache instead)."""
+    model: str
+    kind: str = "chat"  # "chat", "stream" or "cache_hit"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    ttft: Optional[float] = None  # seconds to the first streamed token
+    latency: float = 0.0  # seconds for the whole call
+    finish_reason: Optional[str] = None
+    request_id: str = ""  # shared by a response's initial call and its continuations
+    round: int = 0  # 0 for the initial call, then 1, 2... for continuations
+    error: Optional[str] = None
+    session: str = ""
+    timestamp: float = field(default_factory=time.time)
+
+@dataclass
+class SessionTotals:
+    calls: int = 0
+    continuation_rounds: int = 0
+    cache_hits: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    ttft_total: float = 0.0
+    ttft_count: int = 0
+
+    def add(self, record: CallRecord):
+        if record.kind == "cache_hit":
+            self.cache_hits += 1
+            return
+        self.calls += 1
+        self.continuation_rounds += record.round > 0
+        self.errors += record.error is not None
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.latency += record.latency
+        if record.ttft is not None:
+            self.ttft_total += record.ttft
+            self.ttft_count += 1
+
+    def describe(self):
+        ttft = f", first token {self.ttft_total / self.ttft_count:.1f}s avg" if self.ttft_count else ""
+        return (f"{self.calls} LLM calls ({self.continuation_rounds} continuations, {self.errors} failed), "
+                f"{self.cache_hits} cache hits  \n"
+                f"{self.prompt_tokens:,} prompt + {self.completion_tokens:,} completion tokens  \n"
+                f"{self.latency:.1f}s model time{ttft}")
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write(self, record: CallRecord):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(asdict(record)) + "\n")
+
+class SqliteSink:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._columns = [f.name for f in fields(CallRecord)]
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS calls ({', '.join(self._columns)})")
+        self._db.commit()
+
+    def write(self, record: CallRecord):
+        self._db.execute(f"INSERT INTO calls VALUES ({', '.join('?' * len(self._columns))})",
+                         [getattr(record, name) for name in self._columns])
+        self._db.commit()
+
+class Telemetry:
+    """Writes call records to a sink and keeps per-session totals."""
+
+    def __init__(self, path=TELEMETRY_PATH):
+        self.sink = None
+        if path:
+            self.sink = SqliteSink(path) if path.endswith((".sqlite3", ".db")) else JsonlSink(path)
+        self._totals: Dict[str, SessionTotals] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: CallRecord):
+        record.session = record.session or SESSION.get()
+        with self._lock:
+            self._totals.setdefault(record.session, SessionTotals()).add(record)
+            if self.sink:
+                self.sink.write(record)
+
+    def totals(self, session=None) -> SessionTotals:
+        with self._lock:
+            totals = self._totals.get(SESSION.get() if session is None else session)
+            return SessionTotals(**asdict(totals)) if totals else SessionTotals()
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+    return _telemetry
+
+def record(record: CallRecord):
+    get_telemetry().record(record)
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+def start_session(session_state) -> str:
+    """ bind this script run (and the workers it starts) to the Streamlit session's telemetry """
+    session = session_state.setdefault("telemetry_session", new_request_id())
+    SESSION.set(session)
+    return session
+
+def session_totals() -> SessionTotals:
+    return get_telemetry().totals()
+
+def timed_stream(chunks: Iterable, model, prompt, request_id="") -> Iterator:
+    """
+    Pass a stream of text chunks through, recording it as one call when it ends;
+    for clients that don't report usage (tokens are estimated).
+    """
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    error = None
+    try:
+        for chunk in chunks:
+            text = getattr(chunk, "content", chunk)
+            if ttft is None and text:
+                ttft = time.perf_counter() - start
+            parts.append(str(text))
+            yield chunk
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        record(CallRecord(model, "stream", approx_tokens(prompt), approx_tokens("".join(parts)) if parts else 0,
+                          ttft, time.perf_counter() - start, request_id=request_id, error=error))
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules are imported flat, as the apps do (streamlit run from the app directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep test calls out of the telemetry log in the working directory
+os.environ["TELEMETRY_PATH"] = ""
@@ -0,0 +1,77 @@
+import json
+import os
+import zipfile
+
+import httpx
+import pytest
+
+import batch_convert
+import response_cache
+from batch_convert import BatchConverter, TruncatedResponse, generate, load_input
+from llm_client import LLMClient, RetryPolicy
+from response_cache import ResponseCache
+
+def completion(text, finish_reason="stop"):
+    return {"choices": [{"message": {"content": text}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 2}}
+
+class Server:
+    """ answers chat requests with the scripted (text, finish_reason) replies in turn, repeating the last one """
+
+    def __init__(self):
+        self.replies = [("converted", "stop")]
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(json.loads(request.content))
+        text, finish_reason = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        return httpx.Response(200, json=completion(text, finish_reason))
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    server = Server()
+    client = LLMClient("http://llm.test/v1", "key", azure=False, http_client=httpx.Client(transport=httpx.MockTransport(server)))
+    monkeypatch.setattr(batch_convert, "get_client", lambda: client)
+    monkeypatch.setattr(response_cache, "_cache", ResponseCache(str(tmp_path / "responses.sqlite3")))
+    return server
+
+def test_generate_continues_a_truncated_reply(server):
+    server.replies = [("first half", "length"), ("second half", "stop")]
+    assert generate("convert this", "gpt-4o-mini") == ("first half\nsecond half", True)
+    assert len(server.requests) == 2
+    assert server.requests[1]["messages"][-1]["content"].count("convert this") == 1
+
+def test_generate_reports_a_reply_still_cut_off(server):
+    server.replies = [("more", "length")]
+    response, complete = generate("convert this", "gpt-4o-mini", RetryPolicy(max_attempts=2))
+    assert not complete and len(server.requests) == 2
+
+def test_truncated_result_is_not_cached(server, tmp_path):
+    server.replies = [("cut", "length")]
+    converter = BatchConverter(str(tmp_path / "out"), "gpt-4o-mini", verbose=False)
+    with pytest.raises(TruncatedResponse):
+        converter.call("explain", "BEGIN NULL; END;")
+    server.replies = [("whole", "stop")]
+    server.requests.clear()
+    assert converter.call("explain", "BEGIN NULL; END;") == "whole"
+    assert converter.call("explain", "BEGIN NULL; END;") == "whole"
+    assert len(server.requests) == 1  # the second answer came from the cache
+
+def test_zip_input_is_read_then_removed(tmp_path, server, monkeypatch):
+    archive = tmp_path / "repo.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("pkg/a.sql", "PROCEDURE a IS BEGIN NULL; END;")
+        zf.writestr("pkg/b.sql", "PROCEDURE b IS BEGIN NULL; END;")
+    extracted = []
+    load_codebase = batch_convert.load_codebase
+    monkeypatch.setattr(batch_convert, "load_codebase", lambda path: extracted.append(path) or load_codebase(path))
+    codebase = load_input(str(archive))
+    assert [code_file.path for code_file in codebase.files] == ["pkg/a.sql", "pkg/b.sql"]
+    assert "PROCEDURE a IS" in codebase.files[0].text
+    assert not os.path.exists(extracted[0])
+
+    out = tmp_path / "out"
+    reports = BatchConverter(str(out), "gpt-4o-mini", max_workers=2, verbose=False).run(codebase.files, ["java", "microservice"])
+    assert [(report.stage, report.items, report.failed) for report in reports] == [("java", 2, []), ("microservice", 2, [])]
+    assert (out / "files" / "pkg" / "a.sql" / "java.md").read_text() == "converted"
+    assert (out / "files" / "pkg" / "b.sql" / "microservice.md").exists()
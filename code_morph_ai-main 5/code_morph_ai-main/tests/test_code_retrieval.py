@@ -0,0 +1,37 @@
+from code_retrieval import build_code_prompt, codebase_tokens, estimate_tokens, get_code_index
+from util import CodeBase, CodeFile
+
+def procedure(name, body_lines=30):
+    body = "".join(f"    v_{name.lower()}_{i} := {i};\n" for i in range(body_lines))
+    return f"PROCEDURE {name} IS\nBEGIN\n{body}END {name};\n"
+
+def make_codebase(files):
+    code_files = [CodeFile(path, "sql", text, len(text)) for path, text in files.items()]
+    return CodeBase(repo_dir=".", index=list(files), files=code_files)
+
+def test_codebase_tokens_estimates_the_full_text_without_building_it():
+    codebase = make_codebase({"a.sql": procedure("A"), "pkg/b.sql": procedure("B", 5)})
+    estimate = codebase_tokens(codebase)
+    assert "text" not in codebase.__dict__
+    assert abs(estimate - estimate_tokens(codebase.text)) <= 1
+
+def test_small_codebase_is_sent_whole():
+    codebase = make_codebase({"a.sql": procedure("A", 3)})
+    prompt = build_code_prompt("what does A do?", codebase, token_budget=2000)
+    assert codebase.text in prompt
+
+def test_large_codebase_sends_the_relevant_units_only():
+    files = {f"pkg/file{i:02d}.sql": procedure(f"PROC_{i:02d}") for i in range(40)}
+    files["pkg/billing.sql"] = procedure("CALCULATE_INVOICE_TOTAL")
+    codebase = make_codebase(files)
+    prompt = build_code_prompt("How is the invoice total calculated?", codebase, token_budget=1500)
+    assert "text" not in codebase.__dict__  # the concatenated text is never needed
+    assert "PROCEDURE CALCULATE_INVOICE_TOTAL IS" in prompt
+    assert "pkg/billing.sql (lines 1-" in prompt
+    assert estimate_tokens(prompt) <= 1500
+    assert get_code_index(codebase) is get_code_index(codebase)  # built once per snapshot
+
+def test_full_mode_ignores_the_budget():
+    files = {f"file{i}.sql": procedure(f"P{i}") for i in range(20)}
+    codebase = make_codebase(files)
+    assert codebase.text in build_code_prompt("anything", codebase, token_budget=100, mode="full")
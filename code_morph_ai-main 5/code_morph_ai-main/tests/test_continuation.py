@@ -0,0 +1,42 @@
+from continuation import continuation_prompt, outline, should_continue, was_truncated
+from llm_client import ChatResult
+
+def test_was_truncated_uses_finish_reason_first():
+    assert was_truncated(ChatResult("x", "length")) is True
+    assert was_truncated(ChatResult("x", "max_tokens")) is True
+    assert was_truncated(ChatResult("x", "stop", {"completion_tokens": 4000}), 4000) is False
+    assert was_truncated(ChatResult("x", "end_turn")) is False
+
+def test_was_truncated_falls_back_to_usage():
+    assert was_truncated(ChatResult("x", None, {"completion_tokens": 4000}), 4000) is True
+    assert was_truncated(ChatResult("x", None, {"completion_tokens": 10}), 4000) is False
+    assert was_truncated(ChatResult("x"), 4000) is None
+    assert was_truncated(None) is None
+
+def test_should_continue_only_uses_fallback_without_api_signal():
+    always = lambda text: True
+    assert should_continue(ChatResult("x", "stop"), "x", 4000, always) is False
+    assert should_continue(ChatResult("x", "length"), "x", 4000, lambda text: False) is True
+    assert should_continue(ChatResult("x"), "x", None, always) is True
+    assert should_continue(ChatResult("x"), "x") is False
+
+def test_continuation_prompt_resends_only_the_tail():
+    emitted = "".join(f"line {i}\n" for i in range(2000))
+    prompt = continuation_prompt("Convert this", emitted, tail_chars=100)
+    assert "Convert this" in prompt
+    assert emitted[-50:] in prompt
+    assert "line 0\n" not in prompt
+
+def test_continuation_prompt_size_stays_bounded():
+    emitted = "".join(f"## Step {i}\npublic class Service{i} {{\n" + "    x++;\n" * 50 for i in range(500))
+    short = continuation_prompt("Convert this", emitted[:20000], tail_chars=4000)
+    long = continuation_prompt("Convert this", emitted, tail_chars=4000)
+    assert len(long) < len(emitted) // 10
+    assert abs(len(long) - len(short)) < 2000
+
+def test_outline_keeps_the_most_recent_declarations():
+    text = "\n".join(f"public class Service{i} {{" for i in range(100))
+    lines = outline(text, max_lines=10).splitlines()
+    assert lines[0] == "- ... 90 earlier items"
+    assert lines[-1] == "- public class Service99 {"
+    assert outline("just prose") == "- (no headings or declarations yet)"
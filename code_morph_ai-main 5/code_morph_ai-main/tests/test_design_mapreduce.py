@@ -0,0 +1,92 @@
+import hashlib
+
+import pytest
+
+from design_mapreduce import DigestCache, bucket_tree, generate_oo_design, show_design
+from util import CodeFile
+
+def make_files(count, start=0):
+    return [CodeFile(f"pkg{i % 3}/proc{i:03d}.sql", "sql", f"PROCEDURE proc{i} IS BEGIN NULL; END;", 40)
+            for i in range(start, start + count)]
+
+class FakeLLM:
+    """ answers every prompt with a short text derived from it; fails prompts containing fail_on """
+
+    def __init__(self, fail_on=None):
+        self.prompts = []
+        self.fail_on = fail_on
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            return None, False
+        return "digest " + hashlib.sha256(prompt.encode()).hexdigest()[:8], True
+
+def groups(tree):
+    """ every merge group as the frozenset of file paths it covers """
+    found = set()
+
+    def paths(group):
+        if not isinstance(group, list):
+            return frozenset([group])
+        covered = frozenset().union(*(paths(member) for member in group))
+        found.add(covered)
+        return covered
+    paths(tree)
+    return found
+
+def test_bucket_tree_groups_at_most_fan_in_members():
+    paths = [f"src/file{i}.sql" for i in range(100)]
+    tree = bucket_tree(paths, lambda path: path, fan_in=4)
+
+    def check(group):
+        assert 1 <= len(group) <= 4
+        for member in group:
+            if isinstance(member, list):
+                check(member)
+    check(tree)
+    assert frozenset(paths) in groups(tree)
+
+def test_adding_a_file_only_changes_its_own_branch():
+    paths = [f"src/file{i}.sql" for i in range(200)]
+    before = groups(bucket_tree(paths, lambda path: path, fan_in=4))
+    after = groups(bucket_tree(paths + ["src/new.sql"], lambda path: path, fan_in=4))
+    changed = after - before
+    branch = [group for group in changed if "src/new.sql" in group]
+    # groups on the new file's path to the root, plus any split of its old bucket; not every group after it
+    assert all(any(group <= parent for parent in branch) for group in changed)
+    assert len(changed) <= 10
+
+@pytest.fixture
+def cache(tmp_path):
+    return DigestCache(str(tmp_path / "digests"))
+
+def test_rerun_reuses_every_digest_and_merge(cache):
+    files = make_files(30)
+    first = FakeLLM()
+    design, complete = generate_oo_design(files, first, "gpt-4o-mini", max_workers=4, cache=cache)
+    assert design and complete
+    second = FakeLLM()
+    assert generate_oo_design(files, second, "gpt-4o-mini", max_workers=4, cache=cache) == (design, True)
+    assert len(second.prompts) == 1  # only the final design call
+
+def test_new_file_only_recomputes_its_branch(cache):
+    files = make_files(60)
+    full_run = FakeLLM()
+    generate_oo_design(files, full_run, "gpt-4o-mini", cache=cache)
+    incremental = FakeLLM()
+    generate_oo_design(make_files(1, start=60) + files, incremental, "gpt-4o-mini", cache=cache)
+    # one new digest, the merges on its branch and the final call
+    assert len(incremental.prompts) <= 6 < len(full_run.prompts)
+
+def test_failed_digest_is_not_cached_nor_any_merge_on_it(cache):
+    files = make_files(12)
+    generate_oo_design(files, FakeLLM(fail_on="proc3 IS"), "gpt-4o-mini", cache=cache)
+    retry = FakeLLM()
+    generate_oo_design(files, retry, "gpt-4o-mini", cache=cache)
+    assert sum("proc3 IS" in prompt for prompt in retry.prompts) == 1
+    assert not any("(digest unavailable)" in prompt for prompt in retry.prompts)
+
+def test_show_design_returns_empty_text_on_failure():
+    assert show_design("single call", make_files(1), lambda: None, FakeLLM(), "gpt-4o-mini") == ""
+    assert show_design("single call", make_files(1), lambda: "the design", FakeLLM(), "gpt-4o-mini") == "the design"
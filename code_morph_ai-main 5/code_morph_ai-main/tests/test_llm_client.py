@@ -0,0 +1,105 @@
+import json
+
+import httpx
+import pytest
+
+from llm_client import LLMClient
+
+def completion(text, finish_reason="stop"):
+    return {"choices": [{"message": {"content": text}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 2}}
+
+@pytest.fixture
+def server():
+    """ an in-process OpenAI-compatible endpoint that records the request bodies """
+    requests = []
+
+    def handle(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=completion(f"reply {len(requests)}"))
+
+    client = LLMClient("http://llm.test/v1", "key", azure=False, http_client=httpx.Client(transport=httpx.MockTransport(handle)))
+    client.requests = requests
+    return client
+
+def test_model_settings_are_sent(server):
+    server.complete("hi", "gpt-4o-mini")
+    server.complete("hi", "o1-mini")
+    server.complete("hi", "gpt-4o", temperature=0, max_tokens=100)
+    assert server.requests[0]["temperature"] == 0.5 and server.requests[0]["max_tokens"] == 4000
+    assert "temperature" not in server.requests[1] and server.requests[1]["max_completion_tokens"] == 16000
+    assert server.requests[2]["temperature"] == 0 and server.requests[2]["max_tokens"] == 100
+
+def test_api_defaults_send_no_sampling_settings(server):
+    result = server.complete("hi", "gpt-4o-mini", api_defaults=True)
+    assert result.text == "reply 1" and result.finish_reason == "stop"
+    assert set(server.requests[0]) == {"model", "messages"}
+
+def test_conversation_keeps_history(server):
+    conversation = server.conversation("gpt-4o-mini", system="be brief")
+    assert conversation.predict("first") == "reply 1"
+    assert conversation.predict("second") == "reply 2"
+    assert [message["role"] for message in server.requests[1]["messages"]] == ["system", "user", "assistant", "user"]
+    assert conversation.last_result.usage["completion_tokens"] == 2
+
+def test_azure_requests_go_to_the_deployment(monkeypatch):
+    urls = []
+
+    def handle(request):
+        urls.append(str(request.url))
+        assert request.headers["api-key"] == "key"
+        return httpx.Response(200, json=completion("ok"))
+
+    monkeypatch.setenv("DEPLOYMENT_NAME", "shared")
+    monkeypatch.setenv("DEPLOYMENT_NAME_GPT_4O", "gpt4o-deployment")
+    client = LLMClient("https://x.openai.azure.com", "key", azure=True,
+                       http_client=httpx.Client(transport=httpx.MockTransport(handle)))
+    client.complete("hi", "gpt-4o-mini")
+    client.complete("hi", "gpt-4o")
+    assert urls[0].startswith("https://x.openai.azure.com/openai/deployments/shared/chat/completions?api-version=")
+    assert "/deployments/gpt4o-deployment/" in urls[1]
+
+def sse(*events):
+    return "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+
+@pytest.fixture
+def streaming_server():
+    requests = []
+
+    def handle(request):
+        body = json.loads(request.content)
+        requests.append(body)
+        if not body.get("stream"):
+            return httpx.Response(200, json=completion("whole reply", "stop"))
+        return httpx.Response(200, text=sse(
+            {"choices": [{"delta": {"content": "Hel"}}]},
+            {"choices": [{"delta": {"content": "lo"}, "finish_reason": "length"}]},
+            {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 2}},
+        ), headers={"content-type": "text/event-stream"})
+
+    client = LLMClient("http://llm.test/v1", "key", azure=False, http_client=httpx.Client(transport=httpx.MockTransport(handle)))
+    client.requests = requests
+    return client
+
+def test_stream_yields_deltas_then_holds_the_result(streaming_server):
+    stream = streaming_server.stream_complete("hi", "gpt-4o-mini")
+    assert stream.result is None
+    assert list(stream) == ["Hel", "lo"]
+    assert (stream.result.text, stream.result.finish_reason) == ("Hello", "length")
+    assert stream.result.usage["completion_tokens"] == 2
+    assert streaming_server.requests[0]["stream"] is True
+
+def test_models_that_cannot_stream_get_one_regular_request(streaming_server):
+    stream = streaming_server.stream_complete("hi", "o1-mini")
+    assert streaming_server.requests == []  # nothing is sent before iteration
+    assert list(stream) == ["whole reply"]
+    assert stream.result.finish_reason == "stop"
+    assert "stream" not in streaming_server.requests[0]
+
+def test_streamed_conversation_turn_joins_the_history(streaming_server):
+    conversation = streaming_server.conversation("gpt-4o-mini")
+    shown = []
+    assert conversation.predict("hi", stream_to=lambda chunks: shown.extend(chunks)) == "Hello"
+    assert shown == ["Hel", "lo"]
+    assert conversation.messages[-1] == {"role": "assistant", "content": "Hello"}
+    assert conversation.last_result.finish_reason == "length"
@@ -0,0 +1,59 @@
+import pytest
+
+import model_router
+from llm_client import LatencyStats
+from model_router import AUTO, TASKS, complexity, resolve_model, route
+from prompt_templates import code_explain_prompt
+from tokenizer import count_tokens
+
+@pytest.fixture(autouse=True)
+def tiers(monkeypatch):
+    monkeypatch.setattr(model_router, "FAST_MODELS", ["fast-a", "fast-b"])
+    monkeypatch.setattr(model_router, "STRONG_MODELS", ["strong"])
+    monkeypatch.setattr(model_router, "get_latency_stats", LatencyStats)
+
+def prompt_of(tokens):
+    """ a prompt of roughly this many tokens without complex constructs """
+    line = "select name from customers where id = 1;\n"
+    return line * max(1, tokens // count_tokens(line))
+
+def stats_with(**seconds_per_call):
+    stats = LatencyStats()
+    for model, seconds in seconds_per_call.items():
+        stats.record(model.replace("_", "-"), seconds, 1000)
+    return stats
+
+def test_size_bands_pick_the_tier():
+    small = TASKS["qa"].small_tokens
+    assert route("qa", prompt_of(small // 2)).model == "fast-a"
+    assert route("qa", prompt_of(small * 3)).model == "strong"
+    assert route("qa", prompt_of(small * 3 // 2)).reason == "borderline size"
+
+def test_complex_plsql_goes_to_the_strong_tier():
+    code = "CURSOR c IS SELECT 1 FROM dual; BEGIN LOOP FETCH c; END LOOP; EXCEPTION WHEN OTHERS THEN ROLLBACK;\n"
+    assert complexity(code) == 5
+    decision = route("java", code * 3)
+    assert (decision.model, decision.complexity) == ("strong", 15)
+    assert route("qa", code * 3).model == "fast-a"  # qa ignores complexity
+
+def test_template_wording_does_not_count_towards_complexity():
+    prompt = code_explain_prompt.format(PLSQL_CODE="BEGIN NULL; END;")
+    assert route("explain", prompt, template=code_explain_prompt).complexity == 0
+
+def test_untried_models_are_measured_first_then_the_fastest_wins():
+    prompt = prompt_of(100)
+    assert route("qa", prompt, stats_with(fast_a=2.0)).model == "fast-b"
+    assert route("qa", prompt, stats_with(fast_a=2.0, fast_b=1.0)).model == "fast-b"
+    assert route("qa", prompt, stats_with(fast_a=0.5, fast_b=1.0)).model == "fast-a"
+
+def test_borderline_prompts_stay_fast_while_the_strong_tier_is_slow():
+    prompt = prompt_of(TASKS["qa"].small_tokens * 3 // 2)
+    assert route("qa", prompt, stats_with(fast_a=1.0, fast_b=1.0, strong=2.0)).model == "strong"
+    decision = route("qa", prompt, stats_with(fast_a=1.0, fast_b=1.0, strong=10.0))
+    assert decision.model == "fast-a" and "10.0x slower" in decision.reason
+
+def test_resolve_model_only_routes_auto():
+    routes = []
+    assert resolve_model("gpt-4o", "hi", on_route=routes.append) == "gpt-4o"
+    assert resolve_model(AUTO, "hi", template=code_explain_prompt, on_route=routes.append) == "fast-a"
+    assert routes == [routes[0]] and routes[0].startswith("Auto-routed explain ")
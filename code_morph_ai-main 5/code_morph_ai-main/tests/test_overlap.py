@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from overlap import MIN_OVERLAP_CHARS, find_merge_point, overlap_length
+
+def brute_force_overlap(left, right):
+    for k in range(min(len(left), len(right)), 0, -1):
+        if left[-k:] == right[:k]:
+            return k
+    return 0
+
+@pytest.mark.parametrize("seed", range(20))
+def test_overlap_length_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        # A small alphabet makes repeated prefixes (and KMP fallbacks) common
+        left = "".join(rng.choice("ab") for _ in range(rng.randint(0, 30)))
+        right = "".join(rng.choice("ab") for _ in range(rng.randint(0, 30)))
+        assert overlap_length(left, right) == brute_force_overlap(left, right), (left, right)
+
+def test_overlap_length_on_token_ids():
+    assert overlap_length([1, 2, 3, 1, 2], [1, 2, 3, 4]) == 2
+    assert overlap_length([1, 2, 3], [1, 2, 3]) == 3
+    assert overlap_length([], [1]) == 0
+
+def test_find_merge_point_drops_repeated_seam():
+    base = "public class A {\n    void run() {\n        step();\n"
+    continuation = "    void run() {\n        step();\n        done();\n    }\n}"
+    merge_point = find_merge_point(base, continuation, mode="chars")
+    assert base[:merge_point] + continuation == "public class A {\n" + continuation
+
+def test_find_merge_point_ignores_short_coincidences():
+    assert find_merge_point("x" * 40 + "}", "}" + "y" * 40, mode="chars") is None
+    assert find_merge_point("a" * 40 + "b" * MIN_OVERLAP_CHARS, "b" * MIN_OVERLAP_CHARS + "c", mode="chars") == 40
@@ -0,0 +1,45 @@
+import time
+
+from rate_limiter import RateLimiter, TokenBucket
+
+def test_token_bucket_wait_time_refills_continuously():
+    bucket = TokenBucket(60)  # one per second
+    now = bucket.updated
+    assert bucket.wait_time(1, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == 1.0
+    assert abs(bucket.wait_time(1, now + 0.25) - 0.75) < 1e-9
+    assert bucket.wait_time(1, now + 5) == 0
+
+def test_token_bucket_caps_amounts_above_capacity():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(1000)
+    assert bucket.level == 0
+    assert bucket.wait_time(1000, now) == 60.0  # waits for a full bucket, not forever
+
+def test_rate_limiter_waits_for_tokens():
+    limiter = RateLimiter(rpm=0, tpm=600)  # 10 tokens per second
+    assert limiter.acquire(600) < 0.1
+    waited = limiter.acquire(5)
+    assert 0.35 < waited < 1.5
+
+def test_rate_limiter_off_without_limits():
+    assert RateLimiter(rpm=0, tpm=0).acquire(10 ** 6) == 0.0
+
+def test_wait_listener_runs_without_the_lock(monkeypatch):
+    import rate_limiter
+
+    limiter = RateLimiter(rpm=0, tpm=6000)  # 100 tokens per second
+    limiter.acquire(6000)
+    notices = []
+
+    def listener(name, position, queued, wait):
+        # a slow listener that needs the limiter must not block it
+        assert limiter._condition.acquire(blocking=False)
+        limiter._condition.release()
+        notices.append((name, position, queued))
+
+    monkeypatch.setattr(rate_limiter, "_wait_listener", listener)
+    assert limiter.acquire(10) > 0.05
+    assert notices == [("", 0, 1)]
@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+
+import response_cache
+from llm_client import RetryPolicy, sampling_params
+from response_cache import ResponseCache, cache_key, cached_response
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ strictly increasing time.time(), so last_used orders every access """
+    ticks = itertools.count(1)
+    monkeypatch.setattr(response_cache.time, "time", lambda: float(next(ticks)))
+
+def test_lru_eviction_drops_least_recently_used(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_bytes=10)
+    cache.put("a", "m", "aaaaa")
+    cache.put("b", "m", "bbbbb")
+    assert cache.get("a") == "aaaaa"  # a is now more recent than b
+    cache.put("c", "m", "ccccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaaa"
+    assert cache.get("c") == "ccccc"
+    assert cache.stats() == {"entries": 2, "bytes": 10}
+
+def test_cached_response_skips_incomplete_and_failed(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    calls = []
+
+    def llm_fn(response, complete):
+        def call():
+            calls.append(response)
+            return response, complete
+        return call
+
+    assert cached_response(llm_fn("partial", False), "gpt-4o-mini", "p", cache=cache) == "partial"
+    assert cached_response(llm_fn(None, False), "gpt-4o-mini", "p", cache=cache) is None
+    assert cache.stats()["entries"] == 0
+    assert cached_response(llm_fn("full", True), "gpt-4o-mini", "p", cache=cache) == "full"
+    assert cached_response(llm_fn("other", True), "gpt-4o-mini", "p", cache=cache) == "full"
+    assert calls == ["partial", None, "full"]
+
+def test_key_follows_the_sampling_actually_sent():
+    key = lambda sampling: cache_key("gpt-4o-mini", "t", "prompt", sampling)
+    assert key(sampling_params("gpt-4o-mini", 0.5, 4000)) == key(sampling_params("gpt-4o-mini"))
+    assert key(sampling_params("gpt-4o-mini", 0, 4000)) != key(sampling_params("gpt-4o-mini", 0.5, 4000))
+    assert key(sampling_params("gpt-4o-mini", 0.5, 2000)) != key(sampling_params("gpt-4o-mini", 0.5, 4000))
+    assert key(sampling_params("gpt-4o-mini", api_defaults=True)) != key(sampling_params("gpt-4o-mini"))
+
+def test_retry_policy_sampling_matches_its_requests():
+    # o1 models take no temperature and name the limit max_completion_tokens; the key uses
+    # the 4000 the policy sends, not the model's 16000 default
+    assert RetryPolicy().sampling("o1-mini") == {"max_completion_tokens": 4000}
+    assert RetryPolicy().sampling("gpt-4o") == {"max_tokens": 4000, "temperature": 0.0}
+
+def test_changed_sampling_misses_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    call = lambda text: lambda: (text, True)
+    assert cached_response(call("warm"), "gpt-4o", "p", sampling={"temperature": 0.5}, cache=cache) == "warm"
+    assert cached_response(call("cold"), "gpt-4o", "p", sampling={"temperature": 0}, cache=cache) == "cold"
+    assert cached_response(call("other"), "gpt-4o", "p", sampling={"temperature": 0.5}, cache=cache) == "warm"
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from result_store import ResultStore, content_hash
+
+def test_concurrent_requests_share_one_computation():
+    store = ResultStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        assert release.wait(10)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_compute("key", compute))) for _ in range(4)]
+    threads[0].start()
+    assert started.wait(10)
+    for thread in threads[1:]:
+        thread.start()
+    assert store.get("key") is None  # still being computed
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert results == ["result"] * 4 and len(calls) == 1
+    assert store.get("key") == "result"
+
+def test_failures_are_not_stored():
+    store = ResultStore()
+    assert store.get_or_compute("key", lambda: None) is None
+    with pytest.raises(ValueError):
+        store.get_or_compute("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert store.get("key") is None
+    assert store.get_or_compute("key", lambda: "second try") == "second try"
+
+def test_refresh_recomputes():
+    store = ResultStore()
+    store.get_or_compute("key", lambda: "old")
+    assert store.get_or_compute("key", lambda: "ignored") == "old"
+    assert store.get_or_compute("key", lambda: "new", refresh=True) == "new"
+    assert store.get("key") == "new"
+
+def test_least_recently_used_results_are_dropped():
+    store = ResultStore(max_entries=2)
+    store.get_or_compute("a", lambda: "A")
+    store.get_or_compute("b", lambda: "B")
+    store.get_or_compute("a", lambda: "unused")  # a is now the most recent
+    store.get_or_compute("c", lambda: "C")
+    assert (store.get("a"), store.get("b"), store.get("c")) == ("A", None, "C")
+
+def test_content_hash_depends_on_content_only():
+    assert content_hash("select 1 from dual;") == content_hash("select 1 from dual;")
+    assert content_hash("select 1 from dual;") != content_hash("select 2 from dual;")
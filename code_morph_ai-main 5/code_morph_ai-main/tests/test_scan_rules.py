@@ -0,0 +1,67 @@
+import pytest
+
+import scan_rules
+from scan_rules import IgnoreMatcher, ScanRules, looks_generated
+from util import iter_code_files
+
+@pytest.mark.parametrize("text", [
+    "-- id generated by sequence\nCREATE TABLE orders (id NUMBER);",
+    "CREATE OR REPLACE PACKAGE pkg AS\n  -- do not edit the status codes below\nEND pkg;",
+    "x := 1;\n" * 10 + "// @generated",
+    "The @generated marker is only honoured in a comment header",
+])
+def test_real_sources_are_not_generated(text):
+    assert looks_generated("src/pkg.sql", text) is None
+
+@pytest.mark.parametrize("text", [
+    "// Code generated by protoc-gen-go. DO NOT EDIT.\npackage api",
+    "# @generated by pip-compile\nrequests==2.0",
+    "/*\n * @generated\n */\nclass A {}",
+    "-- @generated by the schema exporter\nCREATE TABLE t (id NUMBER);",
+    "// <auto-generated>\nclass A {}",
+])
+def test_generator_headers_are_detected(text):
+    assert looks_generated("src/file.txt", text) == "generated header"
+
+def test_scanner_does_not_skip_itself():
+    with open(scan_rules.__file__) as f:
+        assert looks_generated("scan_rules.py", f.read()) is None
+
+def test_ignore_matcher_follows_gitignore_rules():
+    matcher = IgnoreMatcher()
+    matcher.add_patterns(["*.log", "!keep.log", "build/", "/root_only.sql", "# comment", ""])
+    matcher.add_patterns(["generated/*.java"], base_dir="src")
+    assert matcher.is_ignored("logs/app.log")
+    assert not matcher.is_ignored("logs/keep.log")
+    assert matcher.is_ignored("build", is_dir=True)
+    assert not matcher.is_ignored("build")  # a file named build is kept
+    assert matcher.is_ignored("root_only.sql")
+    assert not matcher.is_ignored("pkg/root_only.sql")
+    assert matcher.is_ignored("src/generated/Foo.java")
+    assert not matcher.is_ignored("generated/Foo.java")
+
+def test_scanner_applies_ignore_files_and_size_caps(tmp_path):
+    (tmp_path / "target").mkdir()
+    (tmp_path / "target" / "Out.java").write_text("class Out {}")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / ".gitignore").write_text("local.sql\n")
+    (tmp_path / "pkg" / "local.sql").write_text("select 0 from dual;")
+    (tmp_path / ".codemorphignore").write_text("*.bak.sql\n")
+    (tmp_path / "old.bak.sql").write_text("select 1 from dual;")
+    (tmp_path / "big.sql").write_text("x" * 200)
+    (tmp_path / "a.sql").write_text("select 2 from dual;")
+    (tmp_path / "b.sql").write_text("select 3 from dual;")
+
+    skipped = []
+    rules = ScanRules(max_file_bytes=100, max_total_bytes=30)
+    files = list(iter_code_files(str(tmp_path), rules=rules, skipped=skipped))
+    assert [f.path for f in files] == ["a.sql"]
+    assert dict(skipped) == {
+        ".codemorphignore": "ignored",
+        "old.bak.sql": "ignored",
+        "target/": "ignored",
+        "pkg/.gitignore": "ignored",
+        "pkg/local.sql": "ignored",
+        "big.sql": "file size cap",
+        "b.sql": "total size cap",
+    }
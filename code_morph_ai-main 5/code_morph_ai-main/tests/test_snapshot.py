@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import snapshot
+from snapshot import fingerprint_directory, get_codebase
+
+@pytest.fixture
+def store(monkeypatch):
+    """ a fresh snapshot store per test instead of the process-wide one """
+    fresh = {"lock": threading.Lock(), "snapshots": OrderedDict(), "scans": {}}
+    monkeypatch.setattr(snapshot, "_snapshot_store", lambda: fresh)
+    return fresh
+
+def write(path, text, mtime_ns=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    if mtime_ns:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_unchanged_directory_reuses_the_snapshot(tmp_path, store):
+    write(tmp_path / "a.sql", "select 1 from dual;")
+    first = get_codebase(str(tmp_path))
+    assert get_codebase(str(tmp_path)) is first
+
+    write(tmp_path / "b.sql", "select 2 from dual;")
+    second = get_codebase(str(tmp_path))
+    assert second is not first
+    assert [f.path for f in second.files] == ["a.sql", "b.sql"]
+
+@pytest.mark.parametrize("ignore_file", [".codemorphignore", ".gitignore", "pkg/.gitignore"])
+def test_ignore_file_changes_the_fingerprint(tmp_path, ignore_file):
+    write(tmp_path / "pkg" / "a.sql", "select 1 from dual;")
+    write(tmp_path / "pkg" / "b.sql", "select 2 from dual;")
+    before = fingerprint_directory(str(tmp_path))
+
+    write(tmp_path / ignore_file, "nothing.sql\n", mtime_ns=1_000_000_000)
+    created = fingerprint_directory(str(tmp_path))
+    assert created != before
+
+    write(tmp_path / ignore_file, "b.sql\n", mtime_ns=1_000_000_000)  # same mtime, other size
+    assert fingerprint_directory(str(tmp_path)) != created
+
+def test_edited_ignore_file_rescans(tmp_path, store):
+    write(tmp_path / "a.sql", "select 1 from dual;")
+    write(tmp_path / "b.sql", "select 2 from dual;")
+    assert [f.path for f in get_codebase(str(tmp_path)).files] == ["a.sql", "b.sql"]
+    write(tmp_path / ".codemorphignore", "b.sql\n")
+    assert [f.path for f in get_codebase(str(tmp_path)).files] == ["a.sql"]
+
+def test_slow_scan_only_blocks_its_own_directory(tmp_path, store, monkeypatch):
+    slow_dir, fast_dir = tmp_path / "slow", tmp_path / "fast"
+    write(slow_dir / "a.sql", "select 1 from dual;")
+    write(fast_dir / "b.sql", "select 2 from dual;")
+    release = threading.Event()
+    scans = []
+    load_codebase = snapshot.load_codebase
+
+    def slow_load(repo_dir, **kwargs):
+        scans.append(os.path.basename(repo_dir))
+        if repo_dir == str(slow_dir):
+            assert release.wait(10)
+        return load_codebase(repo_dir, **kwargs)
+
+    monkeypatch.setattr(snapshot, "load_codebase", slow_load)
+    results = []
+    sessions = [threading.Thread(target=lambda: results.append(get_codebase(str(slow_dir)))) for _ in range(2)]
+    for session in sessions:
+        session.start()
+
+    fast = get_codebase(str(fast_dir))  # doesn't wait for the slow scan
+    assert [f.path for f in fast.files] == ["b.sql"]
+    release.set()
+    for session in sessions:
+        session.join(10)
+    assert len(results) == 2 and results[0] is results[1]
+    assert sorted(scans) == ["fast", "slow"]  # both slow sessions shared one scan
+    assert store["scans"] == {}
@@ -0,0 +1,39 @@
+import pytest
+import tiktoken
+
+import tokenizer
+from tokenizer import approx_tokens, count_tokens, count_tokens_batch, encode, get_encoding, write_vendored
+
+@pytest.fixture
+def fresh(monkeypatch, tmp_path):
+    """ empty encoding caches and an empty vendor directory """
+    monkeypatch.setattr(tokenizer, "_encodings", {})
+    monkeypatch.setattr(tokenizer, "_failed", set())
+    monkeypatch.setattr(tokenizer, "VENDOR_DIR", str(tmp_path))
+    return tmp_path
+
+def byte_encoding(name="bytes_only"):
+    """ a tiny encoding (one token per byte) that needs no download """
+    return tiktoken.Encoding(name=name, pat_str=r"\S+|\s+",
+                             mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+def test_unavailable_encoding_falls_back_to_estimates(fresh, monkeypatch):
+    def offline(name):
+        raise OSError("no network")
+    monkeypatch.setattr(tokenizer.tiktoken, "get_encoding", offline)
+    with pytest.warns(UserWarning, match="approximate token counts"):
+        assert get_encoding("cl100k_base") is None
+    assert get_encoding("cl100k_base") is None  # the failure is remembered, not retried
+    assert encode("select 1 from dual;", "gpt-3.5-turbo") is None
+    assert count_tokens("select 1 from dual;", "gpt-3.5-turbo") == approx_tokens("select 1 from dual;")
+    assert count_tokens_batch(["abcd", "", "abcdefgh"], "gpt-3.5-turbo") == [1, 0, 2]
+
+def test_vendored_encoding_is_loaded_once_without_the_network(fresh, monkeypatch):
+    write_vendored(byte_encoding(), str(fresh))
+    assert sorted(path.name for path in fresh.iterdir()) == ["bytes_only.json", "bytes_only.tiktoken"]
+    monkeypatch.setattr(tokenizer.tiktoken, "get_encoding", lambda name: pytest.fail("went to the network"))
+    monkeypatch.setattr(tokenizer, "encoding_name_for_model", lambda model_name: "bytes_only")
+    encoding = get_encoding("bytes_only")
+    assert encoding is get_encoding("bytes_only")
+    assert encode("héllo") == list("héllo".encode())
+    assert count_tokens_batch(["ab", "abc"]) == [2, 3]
@@ -0,0 +1,101 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import util
+from scan_rules import ScanRules
+from util import CodeBase, CodeFile, detect_file_types, iter_code_files, load_codebase
+
+class FakeMagika:
+    """ identifies every path as python code and records what it was asked """
+
+    def __init__(self):
+        self.calls = []
+
+    def identify_paths(self, paths):
+        self.calls.append([os.path.basename(str(path)) for path in paths])
+        output = SimpleNamespace(group="code", label="python")
+        return [SimpleNamespace(ok=True, output=output) for _ in paths]
+
+@pytest.fixture
+def magika(monkeypatch):
+    fake = FakeMagika()
+    monkeypatch.setattr(util, "get_magika", lambda: fake)
+    monkeypatch.setattr(util, "_file_type_cache", {})
+    return fake
+
+def make_repo(root, files):
+    for relative_path, text in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return str(root)
+
+def test_iter_code_files_streams_one_record_per_file(tmp_path):
+    repo_dir = make_repo(tmp_path, {
+        "pkg/orders.sql": "CREATE TABLE orders (id NUMBER);",
+        "src/App.java": "class App {}",
+        "logo.png": "not really a png",
+    })
+    index = []
+    records = iter_code_files(repo_dir, index=index)
+    assert not index  # nothing is read before the first record is asked for
+    files = list(records)
+    assert [(f.path, f.type, f.text) for f in files] == [
+        ("pkg/orders.sql", "sql", "CREATE TABLE orders (id NUMBER);"),
+        ("src/App.java", "java", "class App {}"),
+    ]
+    assert files[0].size == len("CREATE TABLE orders (id NUMBER);")
+    assert index == ["logo.png", "pkg/orders.sql", "src/App.java"]
+
+def test_codebase_text_is_built_on_first_access():
+    files = [CodeFile("a.sql", "sql", "select 1;", 9), CodeFile("b.sql", "sql", "select 2;", 9)]
+    codebase = CodeBase(repo_dir=".", index=["a.sql", "b.sql"], files=files)
+    assert "text" not in codebase.__dict__
+    assert codebase.text == files[0].render() + files[1].render()
+    assert codebase.text is codebase.__dict__["text"]
+
+def test_known_extensions_skip_the_model(tmp_path, magika):
+    assert detect_file_types([str(tmp_path / "a.PKB"), str(tmp_path / "b.java"), str(tmp_path / "c.png")]) == [
+        ("code", "sql"), ("code", "java"), ("image", "png"),
+    ]
+    assert magika.calls == []
+
+def test_model_results_are_cached_by_size_and_mtime(tmp_path, magika):
+    script = tmp_path / "build"
+    script.write_text("print(1)")
+    paths = [str(script), str(tmp_path / "a.sql"), str(tmp_path / "missing")]
+    assert detect_file_types(paths) == [("code", "python"), ("code", "sql"), ("unknown", "unknown")]
+    assert detect_file_types(paths)[0] == ("code", "python")
+    assert magika.calls == [["build"]]
+
+    script.write_text("print('changed')")
+    detect_file_types([str(script)])
+    assert magika.calls == [["build"], ["build"]]
+
+def test_model_is_called_in_batches(tmp_path, magika, monkeypatch):
+    monkeypatch.setattr(util, "MAGIKA_BATCH_SIZE", 2)
+    paths = []
+    for i in range(5):
+        (tmp_path / f"script{i}").write_text("x")
+        paths.append(str(tmp_path / f"script{i}"))
+    assert len(detect_file_types(paths)) == 5
+    assert [len(batch) for batch in magika.calls] == [2, 2, 1]
+
+def test_load_codebase_matches_the_sequential_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(util, "MAGIKA_BATCH_SIZE", 3)
+    repo_dir = make_repo(tmp_path, {
+        f"pkg{i % 4}/file{i:02d}.sql": f"select {i} from dual;" for i in range(20)
+    })
+    rules = ScanRules(max_total_bytes=200)  # the cap must cut at the same file either way
+    sequential_index, sequential_skipped = [], []
+    sequential = list(iter_code_files(repo_dir, sequential_index, rules, sequential_skipped))
+    progress = []
+    codebase = load_codebase(repo_dir, workers=4, progress=lambda done, found: progress.append((done, found)), rules=rules)
+    assert codebase.files == sequential
+    assert codebase.index == sequential_index
+    assert codebase.skipped == sequential_skipped
+    assert any(reason == "total size cap" for _, reason in codebase.skipped)
+    assert progress[-1] == (20, 20)
+    assert all(done <= found for done, found in progress)
@@ -1,7 +1,8 @@
-import tiktoken
 import streamlit as st
-# Load the tokenizer for a specific model (e.g., gpt-3.5-turbo)
-encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+from tokenizer import count_tokens, encode, get_encoding_for_model
+# Tokenizer of a specific model (e.g., gpt-3.5-turbo), cached and vendored if available;
+# offline without a vendored encoding, encode() returns None and counts are approximate
+model_name = "gpt-3.5-turbo"
 
 # Sample text data
 text_data = """ 
@@ -695,10 +696,11 @@ public class VideoController {
 """
 
 # Encode the text to get tokens
-tokens = encoding.encode(text_data)
-st.write("Tokens:", tokens)
-st.write("Number of tokens:", len(tokens))
+tokens = encode(text_data, model_name)
+st.write("Tokens:", tokens if tokens is not None else "encoding unavailable, the count below is approximate")
+st.write("Number of tokens:", count_tokens(text_data, model_name))
 
 # Decode tokens back to text (optional)
-decoded_text = encoding.decode(tokens)
-st.write("Decoded text:", decoded_text)
+if tokens is not None:
+    decoded_text = get_encoding_for_model(model_name).decode(tokens)
+    st.write("Decoded text:", decoded_text)
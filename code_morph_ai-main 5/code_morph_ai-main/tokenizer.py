@@ -0,0 +1,120 @@
+"""
+Shared tokenizer service.
+
+Each tiktoken encoding is loaded once per process. Encodings can be vendored so the
+apps work offline (tiktoken otherwise downloads the BPE file on first use):
+
+    python tokenizer.py vendor cl100k_base o200k_base
+
+writes <name>.tiktoken and <name>.json into TIKTOKEN_VENDOR_DIR (default ./vendor/tiktoken),
+which are then preferred over the network. If an encoding can't be loaded at all,
+counts fall back to approx_tokens.
+"""
+import base64
+import json
+import os
+import sys
+import threading
+import warnings
+from typing import List, Optional
+
+import tiktoken
+from tiktoken.load import load_tiktoken_bpe
+
+VENDOR_DIR = os.environ.get("TIKTOKEN_VENDOR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor", "tiktoken"))
+
+# Encoding for models tiktoken doesn't know (e.g. claude-3-5-sonnet)
+FALLBACK_ENCODING = "o200k_base"
+
+# Threads used by encode_batch
+BATCH_THREADS = 8
+
+_encodings = {}
+_failed = set()
+_lock = threading.Lock()
+
+def _load_vendored(name) -> Optional[tiktoken.Encoding]:
+    ranks_path = os.path.join(VENDOR_DIR, f"{name}.tiktoken")
+    spec_path = os.path.join(VENDOR_DIR, f"{name}.json")
+    if not (os.path.exists(ranks_path) and os.path.exists(spec_path)):
+        return None
+    with open(spec_path, "r") as f:
+        spec = json.load(f)
+    return tiktoken.Encoding(
+        name=name,
+        pat_str=spec["pat_str"],
+        mergeable_ranks=load_tiktoken_bpe(ranks_path),
+        special_tokens=spec["special_tokens"],
+    )
+
+def get_encoding(name) -> Optional[tiktoken.Encoding]:
+    """ encoding by name, loaded once (vendored files first); None if it can't be loaded """
+    encoding = _encodings.get(name)
+    if encoding is not None or name in _failed:
+        return encoding
+    with _lock:
+        if name in _encodings or name in _failed:
+            return _encodings.get(name)
+        try:
+            encoding = _load_vendored(name) or tiktoken.get_encoding(name)
+        except Exception as e:
+            warnings.warn(f"Could not load tiktoken encoding {name} ({e}); using approximate token counts")
+            _failed.add(name)
+            return None
+        _encodings[name] = encoding
+        return encoding
+
+def encoding_name_for_model(model_name):
+    try:
+        return tiktoken.encoding_name_for_model(model_name)
+    except KeyError:
+        return FALLBACK_ENCODING
+
+def get_encoding_for_model(model_name) -> Optional[tiktoken.Encoding]:
+    return get_encoding(encoding_name_for_model(model_name))
+
+def approx_tokens(text) -> int:
+    """ fast estimate for UI display, about 4 characters per token """
+    return (len(text) + 3) // 4 if text else 0
+
+def encode(text, model_name="gpt-4o-mini") -> Optional[List[int]]:
+    """ token ids of text, or None when the encoding is unavailable """
+    encoding = get_encoding_for_model(model_name)
+    return encoding.encode(text, disallowed_special=()) if encoding else None
+
+def count_tokens(text, model_name="gpt-4o-mini") -> int:
+    if not text:
+        return 0
+    encoding = get_encoding_for_model(model_name)
+    if encoding is None:
+        return approx_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_tokens_batch(texts, model_name="gpt-4o-mini") -> List[int]:
+    """ token counts for many texts at once, encoded on BATCH_THREADS threads """
+    texts = list(texts)
+    encoding = get_encoding_for_model(model_name)
+    if encoding is None:
+        return [approx_tokens(text) for text in texts]
+    return [len(ids) for ids in encoding.encode_batch(texts, num_threads=BATCH_THREADS, disallowed_special=())]
+
+def write_vendored(encoding: tiktoken.Encoding, vendor_dir=VENDOR_DIR):
+    """ write an encoding as <name>.tiktoken (BPE ranks) and <name>.json (pattern, special tokens) """
+    os.makedirs(vendor_dir, exist_ok=True)
+    with open(os.path.join(vendor_dir, f"{encoding.name}.tiktoken"), "wb") as f:
+        for token, rank in sorted(encoding._mergeable_ranks.items(), key=lambda item: item[1]):
+            f.write(base64.b64encode(token) + b" " + str(rank).encode() + b"\n")
+    with open(os.path.join(vendor_dir, f"{encoding.name}.json"), "w") as f:
+        json.dump({"pat_str": encoding._pat_str, "special_tokens": encoding._special_tokens}, f)
+
+def vendor_encodings(names, vendor_dir=VENDOR_DIR):
+    """ download (or take from tiktoken's cache) the named encodings and write them to vendor_dir """
+    for name in names:
+        write_vendored(tiktoken.get_encoding(name), vendor_dir)
+        print(f"Vendored {name} into {vendor_dir}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "vendor":
+        print("usage: python tokenizer.py vendor <encoding> [<encoding> ...]")
+        sys.exit(1)
+    vendor_encodings(sys.argv[2:])
@@ -1,31 +1,298 @@
 import os
-import magika
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
 from pathlib import Path
+from typing import Iterator, List, Optional
 
-m = magika.Magika()
-
-def extract_code(repo_dir):
-    code_index=[]
-    file_list = []
-    code_text=""
-    for root, _, files in os.walk(repo_dir):
-
-        for file in files:
-            file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(file_path, repo_dir)
-            code_index.append(relative_path)
-            file_type = m.identify_path(Path(file_path))
-
-            if file_type.output.group in ["text", "code"]:
-                try:
-                    with open(file_path, "r") as f:
-                        code_text += f"__________{relative_path}__________\n"
-                        code_text += f.read()
-                        code_text += "\n\n"
-                        file_list.append(code_text)
-                except Exception:
-                    pass
-    return code_index, code_text, file_list
+from scan_rules import CUSTOM_IGNORE_FILE, ScanRules, build_matcher, looks_generated
+
+# Groups whose files are read into the codebase
+CODE_GROUPS = ("text", "code")
+
+# Obvious extensions are classified without running the magika model: extension -> (group, label)
+EXTENSION_TYPES = {
+    ".sql": ("code", "sql"),
+    ".pks": ("code", "sql"),
+    ".pkb": ("code", "sql"),
+    ".pls": ("code", "sql"),
+    ".plb": ("code", "sql"),
+    ".java": ("code", "java"),
+    ".xml": ("code", "xml"),
+    ".png": ("image", "png"),
+    ".jpg": ("image", "jpeg"),
+    ".jpeg": ("image", "jpeg"),
+    ".gif": ("image", "gif"),
+    ".bmp": ("image", "bmp"),
+    ".webp": ("image", "webp"),
+    ".ico": ("image", "ico"),
+    ".zip": ("archive", "zip"),
+    ".jar": ("archive", "jar"),
+    ".war": ("archive", "zip"),
+    ".ear": ("archive", "zip"),
+    ".tar": ("archive", "tar"),
+    ".gz": ("archive", "gzip"),
+    ".tgz": ("archive", "gzip"),
+    ".bz2": ("archive", "bzip"),
+    ".7z": ("archive", "sevenzip"),
+    ".rar": ("archive", "rar"),
+}
+
+MAGIKA_BATCH_SIZE = 256
+
+# Rules used when the caller doesn't pass any
+DEFAULT_SCAN_RULES = ScanRules.from_env()
+
+# Worker threads used by load_codebase
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+_magika = None
+_magika_lock = threading.Lock()
+
+# (path, size, mtime) -> (group, label) for files classified by the model
+_file_type_cache = {}
+
+def get_magika():
+    """ load the magika model on first use """
+    global _magika
+    if _magika is None:
+        with _magika_lock:
+            if _magika is None:
+                import magika
+                _magika = magika.Magika()
+    return _magika
+
+def detect_file_types(file_paths) -> List[tuple]:
+    """
+    Return (group, label) for each path. Known extensions skip the model; the rest
+    go through magika in batches and are cached by (path, size, mtime).
+    """
+    results = [None] * len(file_paths)
+    ambiguous = []
+    for i, file_path in enumerate(file_paths):
+        known = EXTENSION_TYPES.get(os.path.splitext(file_path)[1].lower())
+        if known:
+            results[i] = known
+            continue
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            results[i] = ("unknown", "unknown")
+            continue
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        cached = _file_type_cache.get(key)
+        if cached:
+            results[i] = cached
+        else:
+            ambiguous.append((i, key))
+
+    for start in range(0, len(ambiguous), MAGIKA_BATCH_SIZE):
+        batch = ambiguous[start:start + MAGIKA_BATCH_SIZE]
+        identified = get_magika().identify_paths([Path(key[0]) for _, key in batch])
+        for (i, key), result in zip(batch, identified):
+            if result.ok:
+                file_type = (str(result.output.group), str(result.output.label))
+                _file_type_cache[key] = file_type
+            else:
+                file_type = ("unknown", "unknown")
+            results[i] = file_type
+    return results
+
+def detect_file_type(file_path) -> tuple:
+    """ (group, label) of a single file """
+    return detect_file_types([file_path])[0]
+
+@dataclass
+class CodeFile:
+    """A single text/code file from the scanned repository."""
+    path: str  # relative to the repository root
+    type: str  # magika content type label, e.g. "sql"
+    text: str
+    size: int
+
+    def render(self):
+        """ file content with the header used in prompts """
+        return f"__________{self.path}__________\n{self.text}\n\n"
+
+@dataclass
+class CodeBase:
+    """Index and per-file records of a repository; the concatenated text is built on first access."""
+    repo_dir: str
+    index: List[str]
+    files: List[CodeFile]
+    skipped: List[tuple] = field(default_factory=list)  # (relative_path, reason)
+    derived: dict = field(default_factory=dict, repr=False, compare=False)  # data built from the files, e.g. search indexes
+
+    @cached_property
+    def text(self):
+        return "".join(file.render() for file in self.files)
+
+def read_code_file(file_path, relative_path, label, size):
+    """ read a text/code file into a CodeFile, or None if it can't be decoded """
+    try:
+        with open(file_path, "r") as f:
+            text = f.read()
+    except Exception:
+        return None
+    return CodeFile(path=relative_path, type=label, text=text, size=size)
+
+def walk_batches(repo_dir, rules: ScanRules = DEFAULT_SCAN_RULES, skipped: Optional[list] = None,
+                 rule_files: Optional[list] = None) -> Iterator[List[str]]:
+    """
+    Walk repo_dir in sorted order, pruning ignored directories and files, and yield
+    file paths in batches of at most MAGIKA_BATCH_SIZE, one directory at a time so
+    magika sees whole batches. Ignored paths are appended to skipped if given; the
+    ignore files the walk reads (present or not at the root) are appended to rule_files.
+    """
+    matcher = build_matcher(repo_dir, rules)
+    if rule_files is not None:
+        rule_files.append(os.path.join(repo_dir, CUSTOM_IGNORE_FILE))
+        if rules.use_gitignore:
+            rule_files.append(os.path.join(repo_dir, ".gitignore"))
+    for root, dirs, files in os.walk(repo_dir):
+        relative_root = os.path.relpath(root, repo_dir)
+        relative_root = "" if relative_root == "." else relative_root.replace(os.sep, "/")
+        if rules.use_gitignore and relative_root and ".gitignore" in files:
+            matcher.add_file(os.path.join(root, ".gitignore"), relative_root)
+            if rule_files is not None:
+                rule_files.append(os.path.join(root, ".gitignore"))
+
+        kept_dirs = []
+        for directory in sorted(dirs):
+            relative_path = f"{relative_root}/{directory}" if relative_root else directory
+            if matcher.is_ignored(relative_path, is_dir=True):
+                if skipped is not None:
+                    skipped.append((relative_path + "/", "ignored"))
+            else:
+                kept_dirs.append(directory)
+        dirs[:] = kept_dirs
+
+        file_paths = []
+        for file in sorted(files):
+            relative_path = f"{relative_root}/{file}" if relative_root else file
+            if matcher.is_ignored(relative_path):
+                if skipped is not None:
+                    skipped.append((relative_path, "ignored"))
+            else:
+                file_paths.append(os.path.join(root, file))
+        for start in range(0, len(file_paths), MAGIKA_BATCH_SIZE):
+            yield file_paths[start:start + MAGIKA_BATCH_SIZE]
+
+def scan_batch(repo_dir, file_paths, rules: ScanRules = DEFAULT_SCAN_RULES) -> List[tuple]:
+    """ classify and read a batch of files into (relative_path, CodeFile or None, skip reason or None) """
+    scanned = []
+    for file_path, (group, label) in zip(file_paths, detect_file_types(file_paths)):
+        relative_path = os.path.relpath(file_path, repo_dir)
+        if group not in CODE_GROUPS:
+            scanned.append((relative_path, None, None))
+            continue
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        if size > rules.max_file_bytes:
+            scanned.append((relative_path, None, "file size cap"))
+            continue
+        code_file = read_code_file(file_path, relative_path, label, size)
+        reason = looks_generated(relative_path, code_file.text) if code_file and rules.skip_generated else None
+        scanned.append((relative_path, None, reason) if reason else (relative_path, code_file, None))
+    return scanned
+
+def _assemble(batches, rules: ScanRules, skipped: list) -> Iterator[tuple]:
+    """ apply the total size cap in walk order; yields (relative_path, CodeFile or None) for kept paths """
+    total = 0
+    for batch in batches:
+        for relative_path, code_file, reason in batch:
+            if code_file is not None and total + code_file.size > rules.max_total_bytes:
+                reason = "total size cap"
+            if reason:
+                skipped.append((relative_path, reason))
+                continue
+            if code_file is not None:
+                total += code_file.size
+            yield relative_path, code_file
+
+def iter_code_files(repo_dir, index: Optional[list] = None, rules: ScanRules = DEFAULT_SCAN_RULES,
+                    skipped: Optional[list] = None) -> Iterator[CodeFile]:
+    """
+    Stream one CodeFile record per text/code file, without accumulating content.
+    If index is given, the relative path of every kept file is appended to it;
+    if skipped is given, (relative_path, reason) of every skipped path is appended.
+    """
+    skipped = skipped if skipped is not None else []
+    batches = (scan_batch(repo_dir, file_paths, rules) for file_paths in walk_batches(repo_dir, rules, skipped))
+    for relative_path, code_file in _assemble(batches, rules, skipped):
+        if index is not None:
+            index.append(relative_path)
+        if code_file is not None:
+            yield code_file
+
+def load_codebase(repo_dir, workers=None, progress=None, rules: ScanRules = DEFAULT_SCAN_RULES) -> CodeBase:
+    """
+    Scan repo_dir into a CodeBase on a thread pool.
+
+    The directory walk runs on the calling thread and hands batches to the workers as it
+    goes, so walking, type detection and reading overlap. Results are assembled in walk
+    order, so the output is the same as iter_code_files regardless of worker count.
+
+    Args:
+        repo_dir (str): Directory to scan
+        workers (int): Thread count, defaults to SCAN_WORKERS
+        progress (callable): Called as progress(done, discovered) on the calling thread;
+            discovered keeps growing until the walk finishes
+        rules (ScanRules): Ignore patterns, size caps and generated-file handling
+
+    Returns:
+        CodeBase: The scanned codebase
+    """
+    completed = queue.Queue()
+    futures = []
+    skipped = []
+    discovered = 0
+    done = 0
+
+    def report(block):
+        nonlocal done
+        while done < discovered:
+            try:
+                done += completed.get(block=block)
+            except queue.Empty:
+                return
+            if progress:
+                progress(done, discovered)
+
+    with ThreadPoolExecutor(max_workers=workers or SCAN_WORKERS) as pool:
+        for file_paths in walk_batches(repo_dir, rules, skipped):
+            discovered += len(file_paths)
+            future = pool.submit(scan_batch, repo_dir, file_paths, rules)
+            future.add_done_callback(lambda _, count=len(file_paths): completed.put(count))
+            futures.append(future)
+            report(block=False)
+        report(block=True)
+
+    index = []
+    files = []
+    batches = (future.result() for future in futures)
+    for relative_path, code_file in _assemble(batches, rules, skipped):
+        index.append(relative_path)
+        if code_file is not None:
+            files.append(code_file)
+    return CodeBase(repo_dir=repo_dir, index=index, files=files, skipped=skipped)
+
+def scan_progress_callback(container):
+    """
+    Build a load_codebase progress callback that renders into a streamlit
+    container (st, st.sidebar, a column...). Call .bar.empty() to remove it.
+    """
+    bar = container.progress(0.0, text="Scanning codebase...")
+
+    def report(done, discovered):
+        bar.progress(done / discovered if discovered else 1.0, text=f"Scanned {done}/{discovered} files")
+
+    report.bar = bar
+    return report
 
 def get_code_prompt(question, code_index, code_text):
 
@@ -48,6 +315,5 @@ def get_code_prompt(question, code_index, code_text):
 
 # test
 # repo_dir = "./code"
-# code_index, code_text, file_content = extract_code(repo_dir)
-# for file in file_content:
-#     print(file)
\ No newline at end of file
+# for code_file in iter_code_files(repo_dir):
+#     print(code_file.path, code_file.type, code_file.size)
@@ -1,42 +1,22 @@
 from dotenv import load_dotenv
 import os
-from plsql_splitter import split_plsql_for_vectordb, PLSQLChunk
+from plsql_splitter import split_plsql_for_vectordb, PLSQLChunk, chunk_to_vectordb_record
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.runnables import RunnablePassthrough
 from pathlib import Path
 import chromadb
+from llm_models import embeddings, llm, rate_limiter
 
 load_dotenv()
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-
-llm = ChatOpenAI(model="gpt-4o-mini", 
-                 temperature=0)
-
 def load_plsql_file(file_path):
     """Load a PLSQL file and return its content."""
     with open(file_path, 'r') as f:
         return f.read()
 
-def clean_metadata(metadata: dict) -> dict:
-    """Clean metadata by removing None values and converting lists to strings."""
-    cleaned = {}
-    for key, value in metadata.items():
-        if value is None or value == []:
-            continue  # Skip None values and empty lists
-        elif isinstance(value, list):
-            cleaned[key] = ", ".join(str(v) for v in value)
-        elif isinstance(value, (str, int, float, bool)):
-            cleaned[key] = value
-        else:
-            cleaned[key] = str(value)
-    return cleaned
-
 def create_vectorstore(sql_directory: str):
     """Create vector store from SQL files."""
     # Create persistent client
@@ -54,27 +34,8 @@ def create_vectorstore(sql_directory: str):
         chunks = split_plsql_for_vectordb(str(sql_file))
         
         for chunk in chunks:
-            # Create searchable text that combines code and metadata
-            searchable_text = f"""
-            Type: {chunk.chunk_type}
-            Name: {chunk.name}
-            Package: {chunk.package_name or 'N/A'}
-            Context: {chunk.context or 'N/A'}
-            Dependencies: {', '.join(chunk.dependencies) if chunk.dependencies else 'N/A'}
-            
-            Code:
-            {chunk.content}
-            """
-            
-            # Clean metadata before storing
-            metadata = clean_metadata({
-                'type': chunk.chunk_type,
-                'name': chunk.name,
-                'package': chunk.package_name,
-                'file_path': str(sql_file),
-                'context': chunk.context,
-                'signature': chunk.signature
-            })
+            # Searchable text and cleaned metadata are shared with bench_retrieval.py
+            searchable_text, metadata = chunk_to_vectordb_record(chunk, sql_file)
             
             # Only add if we have valid metadata
             if metadata:
@@ -125,9 +86,27 @@ def explain_plsql_logic(chain, question: str):
         print(f"Error during explanation: {str(e)}")
         return "Sorry, I couldn't process that question.", []
 
-def generate_spring_boot_code(chain, plsql_object: str):
-    """Generate Spring Boot equivalent of PL/SQL code."""
-    prompt = f"""
+def stream_explain_plsql_logic(chain, question: str):
+    """Stream the explanation of PL/SQL logic token by token."""
+    try:
+        for token in chain.stream(question):
+            yield token
+    except Exception as e:
+        print(f"Error during explanation: {str(e)}")
+        yield "Sorry, I couldn't process that question."
+
+async def astream_explain_plsql_logic(chain, question: str):
+    """Async variant of stream_explain_plsql_logic."""
+    try:
+        async for token in chain.astream(question):
+            yield token
+    except Exception as e:
+        print(f"Error during explanation: {str(e)}")
+        yield "Sorry, I couldn't process that question."
+
+def spring_boot_prompt(plsql_object: str) -> str:
+    """Build the Spring Boot generation question for a PL/SQL object."""
+    return f"""
     Based on the PL/SQL implementation of {plsql_object}, generate equivalent Spring Boot code.
     Include:
     1. Entity classes
@@ -137,13 +116,33 @@ def generate_spring_boot_code(chain, plsql_object: str):
     5. Any necessary DTOs
     Maintain the same business logic and validation rules.
     """
-    
+
+def generate_spring_boot_code(chain, plsql_object: str):
+    """Generate Spring Boot equivalent of PL/SQL code."""
     try:
-        return chain.invoke(prompt)
+        return chain.invoke(spring_boot_prompt(plsql_object))
     except Exception as e:
         print(f"Error during code generation: {str(e)}")
         return "Sorry, I couldn't generate the Spring Boot code."
 
+def stream_spring_boot_code(chain, plsql_object: str):
+    """Stream the Spring Boot equivalent of PL/SQL code token by token."""
+    try:
+        for token in chain.stream(spring_boot_prompt(plsql_object)):
+            yield token
+    except Exception as e:
+        print(f"Error during code generation: {str(e)}")
+        yield "Sorry, I couldn't generate the Spring Boot code."
+
+async def astream_spring_boot_code(chain, plsql_object: str):
+    """Async variant of stream_spring_boot_code."""
+    try:
+        async for token in chain.astream(spring_boot_prompt(plsql_object)):
+            yield token
+    except Exception as e:
+        print(f"Error during code generation: {str(e)}")
+        yield "Sorry, I couldn't generate the Spring Boot code."
+
 # Usage example
 if __name__ == "__main__":
     try:
@@ -159,13 +158,14 @@ if __name__ == "__main__":
             "Explain how order processing works in the system"
         )
         print("Explanation:", explanation)
+        if rate_limiter.enabled:
+            print("Rate limit:", rate_limiter.describe_backlog())
         
-        # Example: Generate Spring Boot code
-        spring_code = generate_spring_boot_code(
-            chain,
-            "PKG_ORDER_PROCESSING.PROCESS_ORDER"
-        )
-        print("\nSpring Boot Implementation:", spring_code)
+        # Example: Generate Spring Boot code, printing tokens as they arrive
+        print("\nSpring Boot Implementation:", end=" ", flush=True)
+        for token in stream_spring_boot_code(chain, "PKG_ORDER_PROCESSING.PROCESS_ORDER"):
+            print(token, end="", flush=True)
+        print()
         
     except Exception as e:
         print(f"An error occurred: {str(e)}")
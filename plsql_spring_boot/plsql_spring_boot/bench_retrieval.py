@@ -0,0 +1,296 @@
+"""
+Retrieval benchmark for the PL/SQL vector store.
+
+Builds the index from a fixed corpus (./code/ plus optional synthetic scale-ups)
+with a deterministic fake embedder, runs a labelled query set and reports
+p50/p95 retrieval latency, recall@k and index build throughput.
+
+Examples:
+    python bench_retrieval.py
+    python bench_retrieval.py --scale 20 --backends chroma memory --k 1 4 8
+    python bench_retrieval.py --strategies splitter file objects --json bench.json
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from plsql_splitter import split_plsql_for_vectordb, chunk_to_vectordb_record
+
+DEFAULT_CORPUS = "./code/"
+
+# Chunk types dropped by the "objects" strategy
+_COARSE_CHUNK_TYPES = {"COMPLETE_FILE", "CODE_BLOCK", "DECLARATION"}
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-identifiers embedder (feature hashing), no network needed."""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.upper()):
+            # Index both the full identifier and its underscore-separated parts
+            for part in {token, *token.split("_")}:
+                if not part:
+                    continue
+                digest = hashlib.md5(part.encode()).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@dataclass
+class LabelledQuery:
+    query: str
+    object_name: str
+    file_path: str
+    pattern: str  # regex identifying the object's definition inside a relevant chunk
+
+
+@dataclass
+class BenchResult:
+    backend: str
+    strategy: str
+    chunks: int
+    corpus_bytes: int
+    build_seconds: float
+    latency_ms: Dict[int, Dict[str, float]] = field(default_factory=dict)
+    recall: Dict[int, float] = field(default_factory=dict)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.build_seconds if self.build_seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.corpus_bytes / 1e6 / self.build_seconds if self.build_seconds else 0.0
+
+
+def build_corpus(source_dir: str, scale: int, target_dir: str) -> Path:
+    """Copy the corpus and add `scale - 1` synthetic copies with renamed objects."""
+    target = Path(target_dir)
+    sources = sorted(Path(source_dir).glob("**/*.sql"))
+    object_names = set()
+    for sql_file in sources:
+        object_names.update(_defined_objects(sql_file.read_text()))
+
+    rename = re.compile(r"\b(" + "|".join(sorted(object_names, key=len, reverse=True)) + r")\b") if object_names else None
+    for sql_file in sources:
+        content = sql_file.read_text()
+        relative = sql_file.relative_to(source_dir)
+        (target / relative).parent.mkdir(parents=True, exist_ok=True)
+        (target / relative).write_text(content)
+        for copy in range(1, scale):
+            scaled = rename.sub(lambda m: f"{m.group(1)}_S{copy}", content) if rename else content
+            scaled_path = target / f"scale_{copy}" / relative
+            scaled_path.parent.mkdir(parents=True, exist_ok=True)
+            scaled_path.write_text(scaled)
+    return target
+
+
+def _defined_objects(content: str) -> List[str]:
+    """Names of packages, procedures, functions, tables, triggers and sequences defined in a file."""
+    patterns = [
+        r"CREATE\s+(?:OR\s+REPLACE\s+)?PACKAGE\s+(?:BODY\s+)?(\w+)",
+        r"\b(?:PROCEDURE|FUNCTION)\s+(\w+)",
+        r"CREATE\s+TABLE\s+(\w+)",
+        r"CREATE\s+(?:OR\s+REPLACE\s+)?TRIGGER\s+(\w+)",
+        r"CREATE\s+SEQUENCE\s+(\w+)",
+    ]
+    names = []
+    for pattern in patterns:
+        names.extend(m.group(1) for m in re.finditer(pattern, content, re.IGNORECASE))
+    return [name for name in names if name.upper() != "BODY"]
+
+
+def build_labelled_queries(corpus_dir: Path) -> List[LabelledQuery]:
+    """Derive object name -> expected chunk labels straight from the source files."""
+    queries = []
+    for sql_file in sorted(corpus_dir.glob("**/*.sql")):
+        content = sql_file.read_text()
+        package_match = re.search(r"CREATE\s+OR\s+REPLACE\s+PACKAGE\s+BODY\s+(\w+)", content, re.IGNORECASE)
+        package_name = package_match.group(1) if package_match else None
+        seen = set()
+
+        if package_name:
+            body = content[package_match.start():]
+            for match in re.finditer(r"\b(PROCEDURE|FUNCTION)\s+(\w+)", body, re.IGNORECASE):
+                name = match.group(2)
+                if name in seen:
+                    continue
+                seen.add(name)
+                queries.append(LabelledQuery(
+                    query=f"{package_name}.{name}",
+                    object_name=name,
+                    file_path=str(sql_file),
+                    pattern=rf"\b{match.group(1)}\s+{name}\b",
+                ))
+
+        for match in re.finditer(r"CREATE\s+TABLE\s+(\w+)", content, re.IGNORECASE):
+            queries.append(LabelledQuery(
+                query=f"Table {match.group(1)}",
+                object_name=match.group(1),
+                file_path=str(sql_file),
+                pattern=rf"CREATE\s+TABLE\s+{match.group(1)}\b",
+            ))
+
+        for match in re.finditer(r"CREATE\s+(?:OR\s+REPLACE\s+)?TRIGGER\s+(\w+)", content, re.IGNORECASE):
+            queries.append(LabelledQuery(
+                query=f"Trigger {match.group(1)}",
+                object_name=match.group(1),
+                file_path=str(sql_file),
+                pattern=rf"TRIGGER\s+{match.group(1)}\b",
+            ))
+    return queries
+
+
+def load_records(corpus_dir: Path, strategy: str) -> Tuple[List[str], List[dict], int]:
+    """Split the corpus with the given chunking strategy into (texts, metadatas, corpus bytes)."""
+    texts, metadatas = [], []
+    corpus_bytes = 0
+    for sql_file in sorted(corpus_dir.glob("**/*.sql")):
+        corpus_bytes += sql_file.stat().st_size
+        chunks = split_plsql_for_vectordb(str(sql_file))
+        if strategy == "file":
+            chunks = [c for c in chunks if c.chunk_type == "COMPLETE_FILE"]
+        elif strategy == "objects":
+            chunks = [c for c in chunks if c.chunk_type not in _COARSE_CHUNK_TYPES] or chunks[:1]
+        for chunk in chunks:
+            text, metadata = chunk_to_vectordb_record(chunk, sql_file)
+            metadata["content"] = chunk.content
+            texts.append(text)
+            metadatas.append(metadata)
+    return texts, metadatas, corpus_bytes
+
+
+def create_store(backend: str, embeddings: Embeddings):
+    """Create an empty, throwaway vector store for the given backend."""
+    if backend == "chroma":
+        import chromadb
+        from langchain_chroma import Chroma
+        return Chroma(
+            client=chromadb.EphemeralClient(),
+            collection_name=f"bench_{uuid.uuid4().hex[:8]}",
+            embedding_function=embeddings,
+        )
+    if backend == "memory":
+        from langchain_core.vectorstores import InMemoryVectorStore
+        return InMemoryVectorStore(embedding=embeddings)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def is_relevant(metadata: dict, label: LabelledQuery) -> bool:
+    """A chunk is relevant if it comes from the defining file and contains the definition."""
+    if Path(metadata.get("file_path", "")) != Path(label.file_path):
+        return False
+    return re.search(label.pattern, metadata.get("content", ""), re.IGNORECASE) is not None
+
+
+def run_benchmark(corpus_dir: Path, backend: str, strategy: str, k_values: List[int],
+                  queries: List[LabelledQuery], embeddings: Embeddings,
+                  repeat: int = 3, batch_size: int = 256) -> BenchResult:
+    texts, metadatas, corpus_bytes = load_records(corpus_dir, strategy)
+    store = create_store(backend, embeddings)
+
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        store.add_texts(texts=texts[offset:offset + batch_size], metadatas=metadatas[offset:offset + batch_size])
+    build_seconds = time.perf_counter() - start
+
+    result = BenchResult(backend=backend, strategy=strategy, chunks=len(texts),
+                         corpus_bytes=corpus_bytes, build_seconds=build_seconds)
+
+    for k in k_values:
+        latencies = []
+        hits = 0
+        for round_number in range(repeat):
+            for label in queries:
+                start = time.perf_counter()
+                docs = store.similarity_search(label.query, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if round_number == 0 and any(is_relevant(doc.metadata, label) for doc in docs):
+                    hits += 1
+        result.latency_ms[k] = {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)}
+        result.recall[k] = hits / len(queries) if queries else 0.0
+    return result
+
+
+def print_report(results: List[BenchResult], num_queries: int):
+    print(f"Queries: {num_queries}")
+    print(f"{'backend':<8} {'strategy':<9} {'chunks':>7} {'build s':>8} {'chunks/s':>9} {'MB/s':>7} "
+          f"{'k':>3} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9}")
+    for result in results:
+        for k in sorted(result.recall):
+            print(f"{result.backend:<8} {result.strategy:<9} {result.chunks:>7} {result.build_seconds:>8.2f} "
+                  f"{result.chunks_per_second:>9.1f} {result.mb_per_second:>7.2f} {k:>3} "
+                  f"{result.latency_ms[k]['p50']:>8.2f} {result.latency_ms[k]['p95']:>8.2f} "
+                  f"{result.recall[k]:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PL/SQL retrieval latency and recall.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory with .sql files")
+    parser.add_argument("--scale", type=int, default=1, help="Total corpus copies (synthetic scale-up)")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "memory"], choices=["chroma", "memory"])
+    parser.add_argument("--strategies", nargs="+", default=["splitter"], choices=["splitter", "file", "objects"])
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 4, 8], dest="k_values")
+    parser.add_argument("--repeat", type=int, default=3, help="Query rounds used for latency percentiles")
+    parser.add_argument("--dimensions", type=int, default=512, help="Fake embedding dimensions")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    embeddings = HashingEmbeddings(args.dimensions)
+    work_dir = tempfile.mkdtemp(prefix="plsql_bench_")
+    try:
+        corpus_dir = build_corpus(args.corpus, max(1, args.scale), work_dir)
+        queries = build_labelled_queries(corpus_dir)
+        results = [
+            run_benchmark(corpus_dir, backend, strategy, args.k_values, queries, embeddings, repeat=args.repeat)
+            for backend in args.backends
+            for strategy in args.strategies
+        ]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results, len(queries))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "scale": args.scale,
+                "queries": len(queries),
+                "results": [dict(vars(r), chunks_per_second=r.chunks_per_second, mb_per_second=r.mb_per_second)
+                            for r in results],
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
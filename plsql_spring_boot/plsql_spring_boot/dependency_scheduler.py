@@ -0,0 +1,258 @@
+"""
+Dependency-ordered Spring Boot conversion of PL/SQL packages.
+
+Builds the package dependency DAG from the splitter's CALL: dependencies and
+converts it level by level: packages nobody depends on last, leaf packages
+(no calls into other packages) first, every package of a level in parallel.
+Each package's prompt carries the Java interfaces already generated for the
+packages it calls, instead of their PL/SQL.
+
+Examples:
+    python dependency_scheduler.py --dry-run
+    python dependency_scheduler.py ./code/ --out ./java --workers 4
+"""
+import argparse
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Set
+
+from plsql_splitter import split_plsql_for_vectordb
+
+# Characters of one dependency's Java interface included in a prompt
+MAX_INTERFACE_CHARS = 3000
+
+# Lines kept from generated Java: type declarations and public/protected method signatures
+_JAVA_DECLARATION = re.compile(
+    r'^\s*(?:public|protected)?\s*(?:abstract\s+|final\s+|static\s+)*'
+    r'(?:class|interface|enum|record)\s+\w+[^{]*'
+)
+_JAVA_METHOD = re.compile(r'^\s*(?:public|protected)\s+(?:static\s+|final\s+|abstract\s+)*[\w<>\[\],.? ]+\s+\w+\s*\([^)]*\)')
+
+
+@dataclass
+class PackageUnit:
+    """One PL/SQL package: its source and the packages it calls."""
+    name: str
+    file_path: str
+    spec: str = ""
+    body: str = ""
+    dependencies: Set[str] = field(default_factory=set)
+
+    @property
+    def source(self) -> str:
+        return "\n/\n".join(part for part in (self.spec, self.body) if part)
+
+
+def collect_packages(sql_directory: str) -> Dict[str, PackageUnit]:
+    """Split every .sql file and collect its packages with their package-level dependencies."""
+    packages: Dict[str, PackageUnit] = {}
+    calls: Dict[str, Set[str]] = {}
+    for sql_file in sorted(Path(sql_directory).glob("**/*.sql")):
+        for chunk in split_plsql_for_vectordb(str(sql_file)):
+            if chunk.chunk_type in ("PACKAGE_SPEC", "PACKAGE_BODY"):
+                name = chunk.name.upper()
+                unit = packages.setdefault(name, PackageUnit(name, str(sql_file)))
+                if chunk.chunk_type == "PACKAGE_SPEC":
+                    unit.spec = chunk.content
+                else:
+                    unit.body = chunk.content
+            elif chunk.package_name and chunk.dependencies:
+                targets = calls.setdefault(chunk.package_name.upper(), set())
+                for dependency in chunk.dependencies:
+                    if dependency.startswith("CALL:"):
+                        targets.add(dependency[len("CALL:"):].split(".")[0].upper())
+    # CALL: also matches record fields and sequences (rec.ID, SEQ.NEXTVAL); keep package calls only
+    for name, unit in packages.items():
+        unit.dependencies = {target for target in calls.get(name, ()) if target in packages and target != name}
+    return packages
+
+
+def _closed_cycles(remaining: Dict[str, Set[str]]) -> List[List[str]]:
+    """Dependency cycles (strongly connected components) that call nothing outside themselves."""
+    reach = {}
+    for name in remaining:
+        seen, stack = set(), [name]
+        while stack:
+            for dependency in remaining[stack.pop()]:
+                if dependency not in seen:
+                    seen.add(dependency)
+                    stack.append(dependency)
+        reach[name] = seen
+    cycles = []
+    for name in sorted(remaining):
+        closed = name in reach[name] and all(name in reach[member] for member in reach[name])
+        if closed and not any(name in cycle for cycle in cycles):
+            cycles.append(sorted(reach[name]))
+    return cycles
+
+
+def dependency_levels(packages: Dict[str, PackageUnit]) -> List[List[str]]:
+    """
+    Topological levels: level 0 has the packages without dependencies, each later
+    level only depends on earlier ones. When only dependency cycles are left, the
+    cycles whose other dependencies are converted form a level of their own and
+    the packages depending on them follow in later levels.
+    """
+    remaining = {name: set(unit.dependencies) for name, unit in packages.items()}
+    levels = []
+    while remaining:
+        ready = sorted(name for name, dependencies in remaining.items() if not dependencies)
+        if not ready:
+            for cycle in _closed_cycles(remaining):
+                print(f"Warning: dependency cycle between {', '.join(cycle)}", file=sys.stderr)
+                ready.extend(cycle)
+            ready.sort()
+        levels.append(ready)
+        for name in ready:
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    return levels
+
+
+def java_interface(java_code: str, max_chars: int = MAX_INTERFACE_CHARS) -> str:
+    """Compact public API of generated Java: type declarations and method signatures without bodies."""
+    lines = []
+    for line in java_code.splitlines():
+        if _JAVA_DECLARATION.match(line):
+            lines.append(line.split("{")[0].rstrip() + " {")
+        elif _JAVA_METHOD.match(line):
+            lines.append("    " + _JAVA_METHOD.match(line).group(0).strip() + ";")
+    interface = "\n".join(dict.fromkeys(lines))  # drop repeats, keep order
+    return (interface or java_code)[:max_chars]
+
+
+def conversion_prompt(unit: PackageUnit, dependency_interfaces: Dict[str, str]) -> str:
+    """Spring Boot conversion prompt for one package, with the Java APIs of its converted dependencies."""
+    context = "\n\n".join(
+        f"// {name} (already converted)\n{interface}" for name, interface in sorted(dependency_interfaces.items())
+    )
+    return f"""
+    Convert the PL/SQL package {unit.name} into equivalent Spring Boot code.
+    Include:
+    1. Entity classes
+    2. Repository interfaces
+    3. Service layer implementation
+    4. Controller endpoints if applicable
+    5. Any necessary DTOs
+    Maintain the same business logic and validation rules.
+
+    {"The packages it calls are already converted. Call these Java APIs instead of re-implementing them:" if context else ""}
+    {context}
+
+    PL/SQL:
+    {unit.source}
+    """
+
+
+@dataclass
+class LevelReport:
+    level: int
+    packages: List[str]
+    seconds: float = 0.0
+    failed: Dict[str, str] = field(default_factory=dict)  # package -> error
+    skipped: List[str] = field(default_factory=list)  # packages with a failed or skipped dependency
+
+
+def convert_in_dependency_order(
+    packages: Dict[str, PackageUnit],
+    generate: Callable[[str], str],
+    max_workers: int = 4,
+    on_converted: Callable[[str, str], None] = None,
+):
+    """
+    Convert packages leaves first, the packages of each level in parallel. A package
+    whose conversion raises is reported as failed and the packages depending on it,
+    directly or not, are skipped; every other package is still converted.
+
+    Args:
+        packages: Output of collect_packages
+        generate: generate(prompt) -> Java code
+        max_workers: Concurrent conversions within a level
+        on_converted: Called as on_converted(package, java) as each package finishes
+
+    Returns:
+        tuple: ({package: java}, [LevelReport])
+    """
+    results: Dict[str, str] = {}
+    interfaces: Dict[str, str] = {}
+    reports = []
+
+    def convert(name):
+        unit = packages[name]
+        dependency_interfaces = {dep: interfaces[dep] for dep in unit.dependencies if dep in interfaces}
+        return generate(conversion_prompt(unit, dependency_interfaces))
+
+    unavailable: Set[str] = set()  # failed or skipped packages
+    for level, names in enumerate(dependency_levels(packages)):
+        start = time.perf_counter()
+        report = LevelReport(level, names)
+        ready = []
+        for name in names:
+            if packages[name].dependencies & unavailable:
+                report.skipped.append(name)
+            else:
+                ready.append(name)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(convert, name): name for name in ready}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    java = future.result()
+                except Exception as e:
+                    report.failed[name] = str(e)
+                    continue
+                results[name] = java
+                interfaces[name] = java_interface(java)
+                if on_converted:
+                    on_converted(name, java)
+        unavailable.update(report.failed, report.skipped)
+        report.seconds = time.perf_counter() - start
+        reports.append(report)
+    return results, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sql_directory", nargs="?", default="./code/")
+    parser.add_argument("--out", default="./java", help="directory for the generated <PACKAGE>.md files")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent conversions per level")
+    parser.add_argument("--dry-run", action="store_true", help="print the dependency levels without converting")
+    args = parser.parse_args()
+
+    packages = collect_packages(args.sql_directory)
+    for level, names in enumerate(dependency_levels(packages)):
+        print(f"Level {level}: " + ", ".join(
+            f"{name} -> {', '.join(sorted(packages[name].dependencies))}" if packages[name].dependencies else name
+            for name in names
+        ))
+    if args.dry_run:
+        return
+
+    from llm_models import llm  # the app's model, only needed for a real conversion
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def save(name, java):
+        (out_dir / f"{name}.md").write_text(java)
+        print(f"Converted {name}")
+
+    _, reports = convert_in_dependency_order(
+        packages, lambda prompt: llm.invoke(prompt).content, args.workers, save
+    )
+    for report in reports:
+        print(f"Level {report.level}: {len(report.packages)} packages in {report.seconds:.1f}s")
+        for name, error in sorted(report.failed.items()):
+            print(f"  {name} failed: {error}", file=sys.stderr)
+        if report.skipped:
+            print(f"  skipped, a dependency failed: {', '.join(report.skipped)}", file=sys.stderr)
+    sys.exit(1 if any(report.failed or report.skipped for report in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+The chat model and embeddings used by app.py and dependency_scheduler.py,
+without the vector store and chain dependencies of app.py.
+"""
+import os
+
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from rate_limiter import RateLimiter
+
+load_dotenv()
+
+# Requests and estimated tokens per minute shared by the chat and embedding calls
+# (0 = unlimited); calls over the budget wait their turn instead of failing with 429
+LLM_RPM = int(os.environ.get("LLM_RPM", 0))
+LLM_TPM = int(os.environ.get("LLM_TPM", 0))
+
+rate_limiter = RateLimiter(rpm=LLM_RPM, tpm=LLM_TPM)
+
+# Both clients send their requests through the limiter's httpx hooks
+embeddings = OpenAIEmbeddings(
+    model="text-embedding-3-large",
+    http_client=rate_limiter.http_client(),
+    http_async_client=rate_limiter.http_async_client(),
+)
+
+llm = ChatOpenAI(model="gpt-4o-mini", 
+                 temperature=0,
+                 http_client=rate_limiter.http_client(),
+                 http_async_client=rate_limiter.http_async_client())
@@ -1,5 +1,5 @@
 import re
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -15,6 +15,44 @@ class PLSQLChunk:
     file_path: str = None
     context: str = None
 
+def clean_metadata(metadata: dict) -> dict:
+    """Clean metadata by removing None values and converting lists to strings."""
+    cleaned = {}
+    for key, value in metadata.items():
+        if value is None or value == []:
+            continue  # Skip None values and empty lists
+        elif isinstance(value, list):
+            cleaned[key] = ", ".join(str(v) for v in value)
+        elif isinstance(value, (str, int, float, bool)):
+            cleaned[key] = value
+        else:
+            cleaned[key] = str(value)
+    return cleaned
+
+def chunk_to_vectordb_record(chunk: PLSQLChunk, file_path: str) -> Tuple[str, dict]:
+    """Build the searchable text and cleaned metadata stored for a chunk."""
+    # Create searchable text that combines code and metadata
+    searchable_text = f"""
+    Type: {chunk.chunk_type}
+    Name: {chunk.name}
+    Package: {chunk.package_name or 'N/A'}
+    Context: {chunk.context or 'N/A'}
+    Dependencies: {', '.join(chunk.dependencies) if chunk.dependencies else 'N/A'}
+    
+    Code:
+    {chunk.content}
+    """
+
+    metadata = clean_metadata({
+        'type': chunk.chunk_type,
+        'name': chunk.name,
+        'package': chunk.package_name,
+        'file_path': str(file_path),
+        'context': chunk.context,
+        'signature': chunk.signature
+    })
+    return searchable_text, metadata
+
 def split_plsql_for_vectordb(file_path: str) -> List[PLSQLChunk]:
     """
     Split PL/SQL file into chunks while preserving complete context for vector embedding.
@@ -35,14 +73,14 @@ def split_plsql_for_vectordb(file_path: str) -> List[PLSQLChunk]:
         context="Complete SQL file content"
     ))
     
-    # Handle different SQL object types
-    if "CREATE TABLE" in content.upper():
+    # Handle different SQL object types ("CREATE OR REPLACE" included)
+    if re.search(r'CREATE\s+TABLE\b', content, re.IGNORECASE):
         chunks.extend(_split_table_definitions(content, file_path))
     
-    if "CREATE TRIGGER" in content.upper():
+    if re.search(r'CREATE\s+(?:OR\s+REPLACE\s+)?TRIGGER\b', content, re.IGNORECASE):
         chunks.extend(_split_triggers(content, file_path))
     
-    if "CREATE PACKAGE" in content.upper():
+    if re.search(r'CREATE\s+(?:OR\s+REPLACE\s+)?PACKAGE\b', content, re.IGNORECASE):
         chunks.extend(_split_package(content, file_path))
     
     return chunks
@@ -52,9 +90,9 @@ def _split_package(content: str, file_path: str) -> List[PLSQLChunk]:
     chunks = []
     package_name = _extract_package_name(content)
     
-    # Package Specification
+    # Package Specification, up to "END <package>;" (not the first END IF/LOOP)
     spec_match = re.search(
-        r'(CREATE\s+OR\s+REPLACE\s+PACKAGE\s+.*?END\s+\w+;)',
+        r'(CREATE\s+(?:OR\s+REPLACE\s+)?PACKAGE\s+(?!BODY\b)(\w+)\b.*?\bEND\s+\2\s*;)',
         content,
         re.IGNORECASE | re.DOTALL
     )
@@ -83,7 +121,7 @@ def _split_package(content: str, file_path: str) -> List[PLSQLChunk]:
     
     # Package Body
     body_match = re.search(
-        r'(CREATE\s+OR\s+REPLACE\s+PACKAGE\s+BODY\s+.*?END\s+\w+;)',
+        r'(CREATE\s+(?:OR\s+REPLACE\s+)?PACKAGE\s+BODY\s+(\w+)\b.*?\bEND\s+\2\s*;)',
         content,
         re.IGNORECASE | re.DOTALL
     )
@@ -97,9 +135,9 @@ def _split_package(content: str, file_path: str) -> List[PLSQLChunk]:
             context="Package Body"
         ))
         
-        # Extract implementations with complete context
+        # Extract implementations with complete context (statements included, up to "END <name>;")
         for impl_match in re.finditer(
-            r'((/\*.*?\*/\s*)?)(PROCEDURE|FUNCTION)\s+(\w+)([^;]+?END\s+\4;)',
+            r'((/\*.*?\*/\s*)?)(PROCEDURE|FUNCTION)\s+(\w+)\b(.*?\bEND\s+\4\s*;)',
             body_content,
             re.IGNORECASE | re.DOTALL
         ):
@@ -241,7 +279,7 @@ def _split_proc_body(body: str, proc_name: str) -> List[PLSQLChunk]:
 
 def _extract_package_name(content: str) -> str:
     """Extract package name from content."""
-    match = re.search(r'CREATE\s+OR\s+REPLACE\s+PACKAGE\s+(\w+)', content, re.IGNORECASE)
+    match = re.search(r'CREATE\s+(?:OR\s+REPLACE\s+)?PACKAGE\s+(?:BODY\s+)?(\w+)', content, re.IGNORECASE)
     return match.group(1) if match else "UNKNOWN"
 
 def _extract_signature(content: str) -> str:
@@ -0,0 +1,159 @@
+"""
+Shared request and token budget for the OpenAI calls of llm_models.py.
+
+The chat model and the embeddings client send their requests through httpx
+clients whose request hook waits on one limiter: a bucket of requests per
+minute (LLM_RPM) and a bucket of estimated tokens per minute (LLM_TPM).
+A limit of 0 turns that bucket off.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), no tokenizer needed."""
+    return (len(text) + 3) // 4
+
+
+def estimate_request_tokens(body: dict) -> int:
+    """Tokens a chat or embeddings request counts against TPM: prompt plus requested output."""
+    if "messages" in body:
+        prompt = "".join(str(message.get("content") or "") for message in body["messages"])
+    else:
+        prompt = json.dumps(body.get("input", ""))
+    return estimate_tokens(prompt) + int(body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, holding at most per_minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """RPM and TPM buckets shared by every client whose requests pass through its hooks."""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, verbose: bool = True):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.verbose = verbose
+        self.waiting = 0
+        self.waiting_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests or self.tokens)
+
+    def _reserve(self, tokens: int) -> float:
+        """Take the budget for one request now and return how long it must wait before it is sent."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.wait_time(1, now))
+                self.requests.take(1)
+            if self.tokens:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+                self.tokens.take(tokens)
+            if wait > 0:
+                self.waiting += 1
+                self.waiting_tokens += tokens
+            return wait
+
+    def _release(self, tokens: int):
+        with self._lock:
+            self.waiting -= 1
+            self.waiting_tokens -= tokens
+
+    def _report(self, wait: float):
+        if self.verbose:
+            print(f"Rate limit: waiting {wait:.1f}s ({self.describe_backlog()})", file=sys.stderr)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until a request of about `tokens` tokens may be sent.
+
+        The budget is reserved up front, so requests are admitted in arrival order
+        and each one waits until the buckets have refilled past it.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._report(wait)
+            try:
+                time.sleep(wait)
+            finally:
+                self._release(tokens)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Async variant of acquire that sleeps without blocking the event loop."""
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._report(wait)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._release(tokens)
+        return wait
+
+    def describe_backlog(self) -> str:
+        """One-line summary of the limits and the queued work, empty when no limits are set."""
+        if not self.enabled:
+            return ""
+        limits = ", ".join(part for part in (f"{self.rpm} RPM" if self.rpm else "",
+                                             f"{self.tpm} TPM" if self.tpm else "") if part)
+        with self._lock:
+            return f"{limits}; {self.waiting} request(s) waiting, ~{self.waiting_tokens} tokens queued"
+
+    def limit_request(self, request: httpx.Request):
+        """httpx request hook: wait for the shared budget before the request is sent."""
+        self.acquire(_request_tokens(request))
+
+    async def alimit_request(self, request: httpx.Request):
+        """Async httpx request hook for the clients langchain uses in astream/ainvoke."""
+        await self.aacquire(_request_tokens(request))
+
+    def http_client(self) -> Optional[httpx.Client]:
+        """A client for langchain's http_client argument, None (the default client) when unlimited."""
+        return httpx.Client(event_hooks={"request": [self.limit_request]}) if self.enabled else None
+
+    def http_async_client(self) -> Optional[httpx.AsyncClient]:
+        """A client for langchain's http_async_client argument, None when unlimited."""
+        return httpx.AsyncClient(event_hooks={"request": [self.alimit_request]}) if self.enabled else None
+
+
+def _request_tokens(request: httpx.Request) -> int:
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 0
+    return estimate_request_tokens(body) if isinstance(body, dict) else 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported flat, as the scripts do when run from their directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
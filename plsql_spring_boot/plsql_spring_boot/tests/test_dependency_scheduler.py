@@ -0,0 +1,31 @@
+from dependency_scheduler import PackageUnit, convert_in_dependency_order, dependency_levels
+
+def packages(**dependencies):
+    return {name: PackageUnit(name, f"{name}.sql", dependencies=set(deps)) for name, deps in dependencies.items()}
+
+def test_levels_put_leaves_first():
+    graph = packages(UTILS=[], CUSTOMER=["UTILS"], ORDERS=["CUSTOMER", "UTILS"], REPORTS=[])
+    assert dependency_levels(graph) == [["REPORTS", "UTILS"], ["CUSTOMER"], ["ORDERS"]]
+
+def test_cycle_gets_its_own_level_before_its_dependents(capsys):
+    graph = packages(UTILS=[], A=["B", "UTILS"], B=["A"], C=["A"], D=["C"], E=["F"], F=["E", "C"])
+    assert dependency_levels(graph) == [["UTILS"], ["A", "B"], ["C"], ["D"], ["E", "F"]]
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "dependency cycle between A, B\n" in captured.err
+    assert "dependency cycle between E, F\n" in captured.err
+    assert "C" not in captured.err
+
+def test_failed_package_only_skips_its_dependents():
+    graph = packages(UTILS=[], BROKEN=["UTILS"], FINE=["UTILS"], ORDERS=["BROKEN"], AUDIT=["ORDERS"], REPORTS=["FINE"])
+
+    def generate(prompt):
+        if "package BROKEN " in prompt:
+            raise RuntimeError("model error")
+        return "public class Service {\n    public void run() {\n    }\n}"
+
+    results, reports = convert_in_dependency_order(graph, generate, max_workers=2)
+    assert set(results) == {"UTILS", "FINE", "REPORTS"}
+    assert reports[1].failed == {"BROKEN": "model error"}
+    assert reports[2].skipped == ["ORDERS"]
+    assert reports[3].skipped == ["AUDIT"]